@@ -1,12 +1,19 @@
 import json
 from typing import Optional, Tuple, List
 from pathlib import Path
-import itertools
-import requests
+from geocoding import get_geocoder, GeocodingError
+from id_allocator import IdAllocator
 
 
 class Address:
-    _id_counter = itertools.count(1)
+    # The fields of to_dict(), in order; also the only attributes an Address can have
+    FIELDS = ("id", "street", "house_number", "city", "postal_code",
+              "country", "apartment", "floor", "coordinates", "message",
+              "coordinates_pending", "geocode_failed")
+    __slots__ = FIELDS
+
+    # Replaced by AddressRepository with an allocator shared by all worker processes
+    _id_allocator = IdAllocator()
 
     def __init__(self,
                  street: str,
@@ -18,7 +25,8 @@ class Address:
                  apartment: Optional[int] = None,
                  floor: Optional[int] = None,
                  coordinates: Optional[Tuple[float, float]] = None,
-                 id: Optional[int] = None
+                 id: Optional[int] = None,
+                 defer_geocoding: bool = False
 
                  ) -> None:
         """Initialize an Address Object.
@@ -34,9 +42,11 @@ class Address:
             coordinates (Optional[Tuple[float,float]]): GPS coordinates as (latitude, longitude). Defaults to None.
             message (Optional [str]): Customer's message. Defaults to None.
             id (Optional[int]): Unique ID of the address. If None, a new ID is generated automatically.
+            defer_geocoding (bool): If True and no coordinates are given, do not geocode now;
+                the address is marked as pending coordinates instead. Defaults to False.
 
         """
-        self.id = id if id is not None else next(Address._id_counter)
+        self.id = id if id is not None else Address._id_allocator.next_id()
         self.street = street
         self.house_number = house_number
         self.city = city
@@ -46,39 +56,31 @@ class Address:
         self.floor = floor
         self.coordinates = coordinates
         self.message = message
+        self.coordinates_pending = False
+        self.geocode_failed = False
 
         if self.coordinates is None:
-            self.fetch_coordinates()
+            if defer_geocoding:
+                self.coordinates_pending = True
+            else:
+                self.fetch_coordinates()
+
+    def query_string(self) -> str:
+        """Return the free-text query used to geocode this address."""
+        return f"{self.house_number} {self.street}, {self.city}, {self.postal_code}, {self.country}"
 
     def fetch_coordinates(self) -> None:
         """
-        Use OpenStreetMap Nominatim API to fetch GPS coordinates for the address.
-        Sets self.coordinates to (latitude, longitude).
+        Fetch GPS coordinates for the address through the process-wide geocoder.
+        Repeat queries are answered from the geocoding cache instead of the Nominatim API.
+        Sets self.coordinates to (latitude, longitude), or marks the address as
+        geocode_failed if the address could not be located.
         """
-        query = f"{self.house_number} {self.street}, {self.city}, {self.postal_code}, {self.country}"
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            "q": query,
-            "format": "json",
-            "limit": 1
-        }
-        headers = {
-            "User-Agent": "DeliverySim/1.0 (tmunot1234567@gmail.com)"
-        }
-
         try:
-            response = requests.get(url, params=params, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            if data:
-                lat = float(data[0]["lat"])
-                lon = float(data[0]["lon"])
-                self.coordinates = (lat, lon)
-                print(f"[Geocoding] Coordinates found: {self.coordinates}")
-            else:
-                print("[Geocoding] No coordinates found for the given address.")
-        except requests.RequestException as e:
+            self.coordinates = get_geocoder().geocode(self.query_string())
+        except GeocodingError as e:
             print(f"[Geocoding] Error: {e}")
+        self.geocode_failed = self.coordinates is None
 
     def __str__(self) -> str:
         """Return a string representation of the Address object.
@@ -106,11 +108,10 @@ class Address:
         Returns:
             dict: A dictionary with keys:
                 'id', 'street', 'house_number', 'city', 'postal_code',
-                'country', 'apartment', 'floor', 'coordinates', 'message'
+                'country', 'apartment', 'floor', 'coordinates', 'message',
+                'coordinates_pending', 'geocode_failed'
         """
-        fields = ["id", "street", "house_number", "city", "postal_code",
-                  "country", "apartment", "floor", "coordinates", "message"]
-        return {field: getattr(self, field) for field in fields}
+        return {field: getattr(self, field) for field in Address.FIELDS}
 
     # מקבלת את הפנקציה FROM DICT ומחזירה אובייקט מיוחד -
     # staticmethod ששומר את הפונקציה המקורית בפנים
@@ -120,13 +121,16 @@ class Address:
     def from_dict(data: dict) -> "Address":
         """Create an Address object from a dictionary.
 
+        Never geocodes: an address stored without coordinates stays without
+        them (pending, failed, or never located) until they are set explicitly.
+
         Args:
             data (dict): Dictionary containing address data.
 
         Returns:
             Address: A new Address instance populated with the dictionary values.
         """
-        return Address(
+        address = Address(
             id=data["id"],
             street=data["street"],
             house_number=data["house_number"],
@@ -141,9 +145,13 @@ class Address:
             floor=data.get("floor"),
             coordinates=tuple(data["coordinates"])if data.get(
                 "coordinates") else None,
-            message=data.get("message")
-
+            message=data.get("message"),
+            defer_geocoding=True
         )
+        address.coordinates_pending = bool(
+            data.get("coordinates_pending")) and address.coordinates is None
+        address.geocode_failed = bool(data.get("geocode_failed"))
+        return address
 
 
 if __name__ == '__main__':
@@ -1,8 +1,29 @@
-import json
 from address import Address
+import storage
+from operator import attrgetter, itemgetter
 from pathlib import Path
-from typing import List, Optional
-import itertools
+from typing import Any, Dict, Iterator, List, Optional
+import id_allocator
+import threading
+import tracing
+from contextlib import contextmanager
+
+# Every field but the coordinates, which an Address holds as a tuple and a stored record as a list
+_PLAIN_FIELDS = tuple(
+    field for field in Address.FIELDS if field != "coordinates")
+_address_values = attrgetter(*_PLAIN_FIELDS)
+_record_values = itemgetter(*_PLAIN_FIELDS)
+
+
+def _is_built_from(address: Address, record: Dict[str, Any]) -> bool:
+    """Tell whether Address.from_dict(record) would give an address equal to this one."""
+    try:
+        if _record_values(record) != _address_values(address):
+            return False
+    except KeyError:
+        return False
+    coordinates = record.get("coordinates")
+    return (tuple(coordinates) if coordinates else None) == address.coordinates
 
 
 class AddressRepository:
@@ -10,54 +31,110 @@ class AddressRepository:
         """
         Initialize the repository with a file path.
         Loads existing addresses from the file and updates the ID counter.
+        Addresses are kept in a dict keyed by ID (in insertion order), so lookups,
+        updates and deletes do not walk the whole collection. When another
+        worker process changes the stored addresses, only the addresses whose
+        records changed are built again. The records themselves are held
+        once, compactly, by the underlying repository.
         """
         self.path = path
-        self.addresses: List[Address] = self._load_from_file()
+        self._records = storage.repository("addresses", path)
+        self._lock = threading.RLock()
+        self._version: Optional[int] = None
+        self._by_id: Dict[int, Address] = {}
+        self._sync()
         self._update_id_counter()
 
-    def _load_from_file(self) -> List[Address]:
-        if not self.path.exists() or self.path.stat().st_size == 0:
-            return []
-        with self.path.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-            return [Address.from_dict(d) for d in data]
+    def _sync(self) -> None:
+        # Never reads the records while holding self._lock: writers take the
+        # records' lock first (see _changing) and this lock second
+        version = self._records.data_version()
+        if version == self._version:
+            return
+        records = self._records.all()
+        with self._lock:
+            by_id: Dict[int, Address] = {}
+            for record in records:
+                address_id = record.get("id")
+                address = self._by_id.get(address_id)
+                if address is None or not _is_built_from(address, record):
+                    address = Address.from_dict(record)
+                by_id[address_id] = address
+            self._by_id = by_id
+            self._version = version
+
+    @contextmanager
+    def _changing(self) -> Iterator[None]:
+        with self._records.batch():
+            self._sync()
+            with self._lock:
+                yield
+
+    @property
+    def addresses(self) -> List[Address]:
+        self._sync()
+        return list(self._by_id.values())
+
+    def __len__(self) -> int:
+        self._sync()
+        return len(self._by_id)
+
+    def __contains__(self, address_id: int) -> bool:
+        self._sync()
+        return address_id in self._by_id
+
+    def scan_records(self, after: Optional[int] = None, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield stored address records in ID order, starting after the ID `after`.
+        """
+        return self._records.scan(after=after, limit=limit)
 
     def _update_id_counter(self):
-        if self.addresses:
-            max_id = max(a.id for a in self.addresses)
-            Address._id_counter = itertools.count(max_id + 1)
-        else:
-            Address._id_counter = itertools.count(1)
+        # New IDs come from a counter file next to the addresses file, leased in blocks;
+        # the stored addresses only seed it when the counter file is first created
+        Address._id_allocator = id_allocator.for_path(
+            Path(self.path).with_suffix(".ids"),
+            seed=lambda: max(self._by_id, default=0) + 1)
 
     def save(self) -> None:
-        with self.path.open("w", encoding="utf-8") as f:
-            json.dump([a.to_dict() for a in self.addresses],
-                      f, ensure_ascii=False, indent=4)
+        """Rewrite the whole stored collection from memory."""
+        with self._records.batch(), self._lock:
+            self._records.replace_all([a.to_dict()
+                                      for a in self._by_id.values()])
 
+    @tracing.traced("address.persist")
     def add(self, address: Address) -> None:
-        self.addresses.append(address)
-        self.save()  # 🔥 auto-save
+        with self._changing():
+            self._by_id[address.id] = address
+            # 🔥 auto-save
+            if not self._records.insert(address.to_dict()):
+                self._records.update(address.id, address.to_dict())
 
     def get_by_id(self, address_id: int) -> Optional[Address]:
-        return next((a for a in self.addresses if a.id == address_id), None)
+        self._sync()
+        return self._by_id.get(address_id)
 
     def update_by_id(self, address_id: int, new_data: dict) -> bool:
-        for a in self.addresses:
-            if a.id == address_id:
-                for key, value in new_data.items():
-                    if hasattr(a, key):
-                        setattr(a, key, value)
-                self.save()  # 🔥 auto-save
-                return True
-        return False
+        with self._changing():
+            a = self._by_id.get(address_id)
+            if a is None:
+                return False
+            for key, value in new_data.items():
+                if hasattr(a, key):
+                    setattr(a, key, value)
+            if a.id != address_id:
+                # The ID itself changed; re-key the address
+                del self._by_id[address_id]
+                self._by_id[a.id] = a
+            self._records.update(address_id, a.to_dict())  # 🔥 auto-save
+            return True
 
     def delete_by_id(self, address_id: int) -> bool:
-        before = len(self.addresses)
-        self.addresses = [a for a in self.addresses if a.id != address_id]
-        if len(self.addresses) < before:
-            self.save()  # 🔥 auto-save
+        with self._changing():
+            if self._by_id.pop(address_id, None) is None:
+                return False
+            self._records.delete(address_id)  # 🔥 auto-save
             return True
-        return False
 
     def get_all(self) -> List[Address]:
         return self.addresses
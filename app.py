@@ -1,8 +1,17 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g
 from werkzeug.wrappers import Response
-from typing import Union, List, Dict, Any, Optional
-from order import Order
+from typing import Union, List, Dict, Any, Iterator, Optional, Tuple
+from order import Order, PackageStatus
 from dispatch_system import DispatchSystem
+from session_store import SessionStore
+from courier_locations import Ping
+import config
+import metrics
+import storage
+import tracing
+import base64
+import binascii
+import hmac
 import json
 import logging
 
@@ -15,35 +24,48 @@ app.config['TEMPLATES_AUTO_RELOAD'] = True
 app.secret_key = 'your-secret-key-change-this'
 
 ds: DispatchSystem = DispatchSystem("managers.json", "addresses.json")
+sessions: SessionStore = SessionStore(path=config.SESSION_PATH or None)
 
 
 def authenticate_user(user_type: str, user_id: str, password: str) -> Optional[Dict[str, Any]]:
     """
-    Authenticate user using DispatchSystem methods
+    Authenticate user using DispatchSystem methods.
+    Returns the user's record without its password, or None.
     """
-    try:
-        if user_type == 'managers':
-            manager = ds.get_manager_by_id(user_id)
-            if manager and getattr(manager, 'password', None) == password:
-                return manager.to_dict()
-        elif user_type == 'customers':
-            customer = ds.get_customer_by_id(user_id)
-            if customer and getattr(customer, 'password', None) == password:
-                return customer.to_dict()
-        elif user_type == 'couriers':
-            courier = ds.get_courier_by_id(int(user_id))
-            if courier and getattr(courier, 'password', None) == password:
-                return courier.to_dict()
-    except (ValueError, AttributeError) as e:
-        logger.error(f"Authentication error: {e}")
-
-    return None
+    record = ds.get_user_record(user_type, user_id)
+    stored = record.get('password') if record else None
+    if stored is None or not hmac.compare_digest(str(stored).encode(), password.encode()):
+        return None
+    return public_record(record)
+
+
+@app.before_request
+def start_request_trace() -> None:
+    rule = request.url_rule.rule if request.url_rule else request.path
+    g.trace = tracing.start_trace(f"{request.method} {rule}", **{"http.method": request.method,
+                                                                 "http.route": rule})
+
+
+@app.teardown_request
+def end_request_trace(error: Optional[BaseException]) -> None:
+    tracing.end_trace(g.pop('trace', None), error)
+
+
+@app.before_request
+def load_user_session() -> None:
+    """Resolve the session id in the cookie to the logged-in user (g.user, g.user_type, g.user_id)."""
+    user_session = sessions.get(session.get('sid'))
+    if user_session is None and 'sid' in session:
+        session.pop('sid')  # expired or logged out
+    g.user = user_session.user if user_session else None
+    g.user_type = user_session.user_type if user_session else None
+    g.user_id = user_session.user_id if user_session else None
 
 
 @app.route("/")
 def index() -> Union[str, Response]:
-    if 'user' in session:
-        logged_in_user_type = session.get('user_type')
+    if g.user is not None:
+        logged_in_user_type = g.user_type
         if logged_in_user_type:
             return redirect(url_for('show_all_orders', user_type=logged_in_user_type))
     return render_template("index.html")
@@ -55,8 +77,8 @@ def login_page(user_type: str) -> Union[str, Response]:
         flash('Invalid user type')
         return redirect(url_for('index'))
 
-    if 'user' in session:
-        logged_in_user_type = session.get('user_type', user_type)
+    if g.user is not None:
+        logged_in_user_type = g.user_type or user_type
         return redirect(url_for('show_all_orders', user_type=logged_in_user_type))
 
     return render_template("login.html", user_type=user_type)
@@ -74,10 +96,10 @@ def authenticate() -> Union[str, Response]:
     user = authenticate_user(user_type, user_id, password)
 
     if user:
-        session['user'] = user
-        session['user_type'] = user_type
-        session['user_id'] = user_id
-        return redirect(url_for('show_all_orders', user_type=session.get('user_type')))
+        sessions.delete(session.get('sid'))
+        session.clear()
+        session['sid'] = sessions.create(user_type, user_id, user)
+        return redirect(url_for('show_all_orders', user_type=user_type))
 
     else:
         error_message = 'Wrong credentials. Please try again.'
@@ -88,12 +110,33 @@ def authenticate() -> Union[str, Response]:
 
 @app.route("/dashboard/<user_type>")
 def dashboard(user_type: str) -> Union[str, Response]:
-    if 'user' not in session:
+    if g.user is None:
         flash('Please log in first')
         return redirect(url_for('login_page', user_type=user_type))
 
-    user = session['user']
-    return render_template("dashboard.html", user=user, user_type=user_type)
+    user = g.user
+    stats = order_statistics() if g.user_type == 'managers' else None
+    return render_template("dashboard.html", user=user, user_type=user_type, stats=stats)
+
+
+DASHBOARD_TOP_ROWS = 10
+
+
+def order_statistics() -> Optional[Dict[str, Any]]:
+    """
+    Order aggregates for the manager dashboard, computed on the columnar order
+    table; None if the table is not available (numpy is not installed).
+    """
+    analytics = ds.order_analytics()
+    if analytics is None:
+        return None
+    per_courier = analytics.orders_per_courier(open_only=True)
+    per_area = analytics.open_orders_by_area()
+    return {
+        'status_counts': analytics.status_counts(),
+        'busiest_couriers': sorted(per_courier.items(), key=lambda item: -item[1])[:DASHBOARD_TOP_ROWS],
+        'busiest_areas': sorted(per_area.items(), key=lambda item: -item[1])[:DASHBOARD_TOP_ROWS],
+    }
 
 
 @app.route("/signup/<user_type>")
@@ -101,34 +144,246 @@ def signup(user_type: str) -> str:
     return render_template("signup.html", user_type=user_type)
 
 
+ORDER_SORT_FIELDS = ["package_id", "created_at",
+                     "status", "customer_id", "courier_id"]
+ORDERS_PER_PAGE = 20
+MAX_ORDERS_PER_PAGE = 100
+
+
+def render_order_list(user_type: Optional[str] = None) -> str:
+    """
+    Render one page of the order list.
+    Filters, sorting and paging come from the query string; customers and
+    couriers only ever see their own orders.
+    """
+    args = request.args
+    filters: Dict[str, Any] = {
+        'status': args.get('status') or None,
+        'customer_id': args.get('customer_id') or None,
+        'courier_id': args.get('courier_id', type=int),
+        'created_from': args.get('created_from') or None,
+        'created_to': args.get('created_to') or None,
+    }
+    logged_in_type = g.user_type
+    if logged_in_type == 'customers':
+        filters['customer_id'] = g.user_id
+    elif logged_in_type == 'couriers':
+        try:
+            filters['courier_id'] = int(g.user_id)
+        except (TypeError, ValueError):
+            filters['courier_id'] = -1
+
+    sort_by = args.get('sort') if args.get(
+        'sort') in ORDER_SORT_FIELDS else 'package_id'
+    descending = args.get('desc') == '1'
+    per_page = min(
+        max(args.get('per_page', ORDERS_PER_PAGE, type=int), 1), MAX_ORDERS_PER_PAGE)
+    page = max(args.get('page', 1, type=int), 1)
+
+    orders, total = ds.query_orders(sort_by=sort_by, descending=descending,
+                                    page=page, per_page=per_page, **filters)
+    pages = max(1, -(-total // per_page))
+
+    def page_url(number: int) -> str:
+        params = {**args.to_dict(), **(request.view_args or {}),
+                  'page': number}
+        return url_for(request.endpoint, **params)
+
+    return render_template("order_list.html", orders=[order.to_dict() for order in orders],
+                           user_type=user_type, filters=filters, sort_by=sort_by, descending=descending,
+                           sort_fields=ORDER_SORT_FIELDS, statuses=[
+                               s.value for s in PackageStatus],
+                           page=page, pages=pages, total=total, per_page=per_page, page_url=page_url)
+
+
 @app.route("/orders")
 def show_all_orders() -> str:
-    orders = ds.view_orders()
-    orders_dicts = [order.to_dict() for order in orders]
-    return render_template("order_list.html", orders=orders_dicts)
+    return render_order_list(request.args.get('user_type'))
 
 
 @app.route("/orders/<user_type>")
 def order_list(user_type: str) -> str:
-    orders = ds.view_orders()
-    orders_dicts = [order.to_dict() for order in orders]
-    return render_template("order_list.html", orders=orders_dicts, user_type=user_type)
+    return render_order_list(user_type)
+
+
+API_COLLECTIONS = ["orders", "couriers", "addresses"]
+API_PAGE_SIZE = 100
+MAX_API_PAGE_SIZE = 1000
+# Fields that are never sent out by the JSON API
+API_PRIVATE_FIELDS = ("password",)
+
+
+def encode_cursor(key: Any) -> str:
+    """Turn the key of the last record on a page into an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Any:
+    """Return the record key a cursor points at. Raises ValueError for malformed cursors."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(
+            cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if isinstance(key, bool) or not isinstance(key, (int, str)):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def public_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: value for field, value in record.items() if field not in API_PRIVATE_FIELDS}
+
+
+def api_filters(collection: str) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[Response, int]]]:
+    """
+    Return the record filters for an API request, or an error response.
+    Managers may read every collection; customers and couriers only their own orders.
+    """
+    if g.user is None:
+        return None, (jsonify(error="Please log in first"), 401)
+    logged_in_type = g.user_type
+    if collection != "orders":
+        if logged_in_type != 'managers':
+            return None, (jsonify(error="Only managers can export this collection"), 403)
+        return {}, None
+
+    args = request.args
+    where: Dict[str, Any] = {}
+    if args.get('status'):
+        where['status'] = args['status']
+    if args.get('customer_id'):
+        where['customer_id'] = args['customer_id']
+    if args.get('courier_id'):
+        courier_id = args.get('courier_id', type=int)
+        if courier_id is None:
+            return None, (jsonify(error="courier_id must be a number"), 400)
+        where['courier_id'] = courier_id
+    if logged_in_type == 'customers':
+        where['customer_id'] = g.user_id
+    elif logged_in_type == 'couriers':
+        try:
+            where['courier_id'] = int(g.user_id)
+        except (TypeError, ValueError):
+            return None, (jsonify(error="Invalid courier session"), 403)
+    return where, None
+
+
+@app.route("/api/<collection>")
+def api_records(collection: str) -> Union[Response, Tuple[Response, int]]:
+    """
+    Export orders, couriers or addresses as JSON, in key order.
+
+    By default one page is returned as {"data": [...], "next_cursor": ...};
+    pass next_cursor back as ?cursor= to get the following page. With
+    ?format=ndjson every remaining record is streamed as one JSON object per
+    line, read from storage a chunk at a time, so memory use stays flat no
+    matter how large the export is.
+    """
+    if collection not in API_COLLECTIONS:
+        return jsonify(error=f"Unknown collection: {collection}"), 404
+    where, error = api_filters(collection)
+    if error is not None:
+        return error
+    try:
+        after = decode_cursor(request.args['cursor']) if request.args.get(
+            'cursor') else None
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    limit = request.args.get('limit', type=int)
+
+    if request.args.get('format') == 'ndjson':
+        records = ds.scan_records(collection, where, after, limit)
+
+        def generate() -> Iterator[str]:
+            for record in records:
+                yield json.dumps(public_record(record), ensure_ascii=False) + "\n"
+
+        return Response(generate(), mimetype="application/x-ndjson")
+
+    limit = min(max(limit or API_PAGE_SIZE, 1), MAX_API_PAGE_SIZE)
+    # One record beyond the page tells whether there is a next page
+    records = list(ds.scan_records(collection, where, after, limit + 1))
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(
+            records[-1].get(storage.ENTITIES[collection][0]))
+    return jsonify(data=[public_record(record) for record in records], next_cursor=next_cursor)
+
+
+def parse_location_pings(body: bytes, ndjson: bool) -> List[Ping]:
+    """
+    Read the pings of a location request: one JSON object, a JSON array of
+    them, or (ndjson) one object per line. Raises ValueError if malformed.
+    """
+    try:
+        text = body.decode("utf-8")
+        if ndjson:
+            items = [json.loads(line)
+                     for line in text.splitlines() if line.strip()]
+        else:
+            items = json.loads(text)
+            items = items if isinstance(items, list) else [items]
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    pings = []
+    for number, item in enumerate(items, 1):
+        if not isinstance(item, dict) or "lat" not in item or "lon" not in item:
+            raise ValueError(
+                f"Ping {number}: expected an object with lat and lon")
+        courier_id = item.get("courier_id")
+        if courier_id is not None and (isinstance(courier_id, bool) or not isinstance(courier_id, int)):
+            raise ValueError(f"Ping {number}: courier_id must be a number")
+        pings.append(
+            Ping(courier_id, item["lat"], item["lon"], item.get("timestamp")))
+    return pings
+
+
+@app.route("/api/locations", methods=['POST'])
+def post_locations() -> Tuple[Response, int]:
+    """
+    Report courier GPS positions.
+
+    The body is one ping, {"courier_id": 7, "lat": 32.08, "lon": 34.78,
+    "timestamp": 1767225600.5}, or a JSON array of pings; bulk feeds can also
+    send one ping per line as application/x-ndjson. timestamp (Unix seconds)
+    defaults to the time of the request. Couriers report their own position
+    and may leave out courier_id; managers report for any courier.
+    """
+    if g.user is None:
+        return jsonify(error="Please log in first"), 401
+    if g.user_type not in ('couriers', 'managers'):
+        return jsonify(error="Only couriers and managers can report locations"), 403
+    try:
+        pings = parse_location_pings(
+            request.get_data(), request.mimetype == "application/x-ndjson")
+        if g.user_type == 'couriers':
+            own_id = int(g.user_id)
+            if any(ping.courier_id not in (None, own_id) for ping in pings):
+                return jsonify(error="Couriers can only report their own location"), 403
+            pings = [ping._replace(courier_id=own_id) for ping in pings]
+        elif any(ping.courier_id is None for ping in pings):
+            return jsonify(error="courier_id is required"), 400
+        accepted = ds.record_locations(pings)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(accepted=accepted, ignored=len(pings) - accepted), 202
 
 
 @app.route("/create_new_order/<user_type>")
 def create_new_order(user_type: str) -> Union[str, Response]:
     # Check if user is logged in
-    if 'user' not in session:
+    if g.user is None:
         flash('Please log in first')
         return redirect(url_for('login_page', user_type=user_type))
 
     # Check if user is a customer (not courier or manager)
-    if session.get('user_type') != 'customers':
+    if g.user_type != 'customers':
         flash('Only customers can create orders')
-        return redirect(url_for('show_all_orders', user_type=session.get('user_type')))
+        return redirect(url_for('show_all_orders', user_type=g.user_type))
 
     # Check if user has a valid ID
-    if not session.get('user_id'):
+    if not g.user_id:
         flash('Invalid user. Please log in again.')
         return redirect(url_for('login_page', user_type=user_type))
 
@@ -172,49 +427,45 @@ def create_order() -> Union[str, Response]:
             'message': message if message else None
         }
 
-        # Add address using ONLY DispatchSystem methods
-        address = ds.add_address(address_data)
-
         # Get customer_id from session if logged in, otherwise use guest
-        customer_id = session.get('user_id', 'GUEST_001')
-
-        # Create order using Order class through dispatch system
-        order_data = {
-            'customer_id': customer_id,
-            'courier_id': None,  # Will be assigned later by system
-            'origin_id': None,  # Default origin - could be made dynamic
-            'destination_id': address.id,
-            'status': 'created'
-        }
-
-        # Create order through dispatch system
-        order = ds.add_order(order_data)
+        customer_id = g.user_id or 'GUEST_001'
+
+        # The address, the order and its assignment are committed together,
+        # once per store; if any step raises, none of them is saved
+        with ds.unit_of_work():
+            # Add address using ONLY DispatchSystem methods
+            address = ds.add_address(address_data)
+
+            # Create order using Order class through dispatch system
+            order_data = {
+                'customer_id': customer_id,
+                'courier_id': None,  # Will be assigned later by system
+                'origin_id': None,  # Default origin - could be made dynamic
+                'destination_id': address.id,
+                'status': 'created'
+            }
+
+            # Create order through dispatch system
+            order = ds.add_order(order_data)
+
+            # Assign the closest courier and start the order from its location
+            assigned = ds.dispatch_order(order._package_id) if order else False
+            # What dispatching left in the order: still CREATED when it waits for the
+            # address to be geocoded, or the outcome of that deferred dispatch if it
+            # already ran on a geocoding worker
+            dispatched = ds.find_order_by_package_id(
+                order._package_id) if order and not assigned else None
 
         if order:
-            # Assign closest courier to the order
-            assignment_success = ds.assign_closest_courier_to_order(
-                order._package_id)
-
-            if assignment_success:
-                # Get the updated order with courier assignment
-                updated_order = ds.find_order_by_package_id(order._package_id)
-                if updated_order and updated_order._courier_id:
-                    # Get the assigned courier
-                    assigned_courier = ds.get_courier_by_id(
-                        updated_order._courier_id)
-                    if assigned_courier:
-                        # Update the order's origin_id to courier's current location
-                        Order.update_by_package_id(
-                            order._package_id, "origin_id", assigned_courier.current_location)
-                        flash('Order created successfully and assigned to courier!')
-                    else:
-                        flash('Order created but courier assignment failed!')
-                else:
-                    flash('Order created but courier assignment failed!')
+            if assigned or (dispatched and dispatched._status == PackageStatus.CONFIRMED.value):
+                flash('Order created successfully and assigned to courier!')
+            elif dispatched and dispatched._status == PackageStatus.CREATED.value:
+                flash(
+                    'Order created! A courier will be assigned once the address has been located.')
             else:
                 flash('Order created but no available courier could be assigned!')
 
-            return redirect(url_for('order_list', user_type=session.get('user_type', 'users')))
+            return redirect(url_for('order_list', user_type=g.user_type or 'users'))
         else:
             flash('Failed to create order')
             return render_template("create_new_order.html")
@@ -227,8 +478,17 @@ def create_order() -> Union[str, Response]:
         return render_template("create_new_order.html")
 
 
+@app.route("/metrics")
+def metrics_endpoint() -> Union[Response, Tuple[str, int]]:
+    """Call counts, latency histograms and I/O volumes of this worker, in the Prometheus text format."""
+    if not metrics.enabled():
+        return "Metrics are disabled (set DISPATCH_METRICS=1)\n", 404
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route("/logout")
 def logout() -> Response:
+    sessions.delete(session.get('sid'))
     session.clear()
     flash('You have been logged out successfully')
     return redirect(url_for('index'))
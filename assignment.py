@@ -0,0 +1,185 @@
+"""
+Batch matching of orders to couriers.
+
+optimal_assignment() solves the order x courier problem as a whole with the
+Hungarian algorithm (minimum total distance). Every courier gets at most one
+order per round, and rounds repeat until every order has a courier, so a burst
+of orders is spread across the fleet instead of piling onto one courier.
+assignment_cells() estimates the work of the optimal solve over all its rounds.
+greedy_assignment() is the fallback for inputs too large for an O(n^2 m) solve:
+it walks the orders and takes the nearest courier not yet used in the current
+round, using the spatial index. Both take an optional number of free slots
+per courier, so couriers at their capacity stop receiving orders.
+"""
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+from spatial_index import GridSpatialIndex
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; callers fall back to greedy_assignment
+    np = None
+
+Point = Tuple[float, float]
+
+
+def distance_matrix(order_points: Sequence[Point], courier_points: Sequence[Point]):
+    """Return the len(order_points) x len(courier_points) matrix of Euclidean distances."""
+    orders = np.asarray(order_points, dtype=float).reshape(-1, 2)
+    couriers = np.asarray(courier_points, dtype=float).reshape(-1, 2)
+    deltas = orders[:, None, :] - couriers[None, :, :]
+    return np.sqrt((deltas ** 2).sum(axis=2))
+
+
+def hungarian(cost) -> List[int]:
+    """
+    Minimum-cost assignment for a rectangular cost matrix.
+    Returns, for every row, the column assigned to it, or -1 when there are
+    more rows than columns and the row was left unassigned.
+    """
+    cost = np.asarray(cost, dtype=float)
+    n, m = cost.shape
+    if n == 0 or m == 0:
+        return [-1] * n
+    if n > m:
+        by_column = hungarian(cost.T)
+        result = [-1] * n
+        for column, row in enumerate(by_column):
+            result[row] = column
+        return result
+
+    # Shortest augmenting path with row/column potentials (1-based, column 0 is a sentinel)
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=int)
+    way = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used
+            free[0] = False
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv, np.inf)
+            j1 = int(np.argmin(candidates))
+            delta = candidates[j1]
+            used_columns = np.nonzero(used)[0]
+            u[p[used_columns]] += delta
+            v[used_columns] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    result = [-1] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            result[p[j] - 1] = j - 1
+    return result
+
+
+def assignment_cells(orders: int, slots: Sequence[Optional[int]], limit: Optional[int] = None) -> int:
+    """
+    Total number of cost-matrix cells optimal_assignment() solves over all its
+    rounds for `orders` orders and couriers with the given free slots (None
+    for no limit). Every round but the last gives each usable courier one
+    order, so the rounds can be counted without solving them. Counting stops
+    once the total exceeds `limit`.
+    """
+    limited = sorted(left for left in slots if left is not None and left > 0)
+    unlimited = sum(1 for left in slots if left is None)
+    cells = 0
+    full = 0  # index of the first limited courier not yet full
+    rounds = 0
+    while orders > 0:
+        while full < len(limited) and limited[full] <= rounds:
+            full += 1
+        usable = unlimited + len(limited) - full
+        if not usable:
+            break
+        cells += orders * usable
+        if limit is not None and cells > limit:
+            break
+        orders -= usable
+        rounds += 1
+    return cells
+
+
+def optimal_assignment(order_points: Sequence[Point], courier_ids: Sequence[Hashable],
+                       courier_points: Sequence[Point],
+                       slots: Optional[Sequence[Optional[int]]] = None) -> List[Optional[Hashable]]:
+    """
+    Assign every order to a courier, minimising total distance in each round.
+    slots, if given, holds how many more orders each courier can take (None
+    for no limit); a courier drops out of the rounds once it is full.
+    Returns the chosen courier id per order (None when no courier is left).
+    """
+    result: List[Optional[Hashable]] = [None] * len(order_points)
+    if not courier_ids:
+        return result
+    costs = distance_matrix(order_points, courier_points)
+    free = list(slots) if slots is not None else [None] * len(courier_ids)
+    remaining = list(range(len(order_points)))
+    while remaining:
+        usable = [j for j, left in enumerate(free) if left is None or left > 0]
+        if not usable:
+            break
+        columns = hungarian(costs[np.ix_(remaining, usable)])
+        left_over = []
+        for row, column in zip(remaining, columns):
+            if column < 0:
+                left_over.append(row)
+                continue
+            courier = usable[column]
+            result[row] = courier_ids[courier]
+            if free[courier] is not None:
+                free[courier] -= 1
+        remaining = left_over
+    return result
+
+
+def greedy_assignment(order_points: Sequence[Point], index: GridSpatialIndex,
+                      slots: Optional[Dict[Hashable, Optional[int]]] = None) -> List[Optional[Hashable]]:
+    """
+    Assign each order, in turn, to the nearest courier not yet used in the current round.
+    slots, if given, maps every indexed courier that may take orders to how
+    many more it can take (None for no limit); other couriers are skipped.
+    Returns the chosen courier id per order (None when no courier is left).
+    """
+    free = dict(slots) if slots is not None else None
+    # Couriers that can still take orders; `taken` only ever holds some of them
+    usable = len(index) if free is None else sum(
+        1 for left in free.values() if left != 0)
+    result: List[Optional[Hashable]] = []
+    taken = set()
+
+    def can_take(courier_id: Hashable) -> bool:
+        return courier_id not in taken and (free is None or free.get(courier_id, 0) != 0)
+
+    for point in order_points:
+        if len(taken) >= usable:
+            taken.clear()
+        found = index.nearest(point, predicate=can_take) if usable else None
+        if found is None:
+            result.append(None)
+            continue
+        courier_id = found[0]
+        result.append(courier_id)
+        if free is not None and free[courier_id] is not None:
+            free[courier_id] -= 1
+            if free[courier_id] == 0:
+                usable -= 1
+                continue
+        taken.add(courier_id)
+    return result
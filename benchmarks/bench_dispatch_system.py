@@ -0,0 +1,190 @@
+"""
+Benchmark the main DispatchSystem operations at growing data sizes and record the results as JSON.
+
+Every size runs in a fresh temporary data directory with an offline stub
+geocoder. The stores are seeded with `size` addresses, customers and orders,
+plus size / 10 couriers. Then each operation is timed
+`--calls` times against that data. The JSON file records the timings and the
+environment (git commit, Python version, storage backend). Pass an earlier
+results file with --compare to print the slowdown of each operation against it.
+
+Run from the repository root:
+    python -m benchmarks.bench_dispatch_system [--sizes 1000 10000 100000] [--output results.json]
+        [--compare baseline.json]
+"""
+import argparse
+import hmac
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import config
+import customerList
+import geocoding
+import storage
+from address import Address
+from benchmarks.common import fresh_data_dir, percentile
+from courier import Courier
+from customer import Customer
+from dispatch_system import DispatchSystem
+from order import Order, PackageStatus
+
+LAT_RANGE = (29.5, 33.3)
+LON_RANGE = (34.2, 35.7)
+PASSWORD = "benchmark"
+ADDRESSES_PATH = "data/addresses.json"
+
+
+def seed(size: int, rng: random.Random) -> Dict[str, list]:
+    """
+    Write the records straight into the (empty) stores, one replace_all() per
+    store. Inserting them one by one would cost O(size) each on the json backend.
+    Returns the IDs created.
+    """
+    addresses = [Address(f"Street {n % 2000}", n % 200 + 1, "Haifa", str(3000000 + n), "Israel",
+                         coordinates=(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)), id=n)
+                 for n in range(1, size + 1)]
+    couriers = []
+    for courier_id in range(1, max(10, size // 10) + 1):
+        home = rng.choice(addresses).id
+        couriers.append(
+            Courier(f"courier-{courier_id}", courier_id, home, home, PASSWORD))
+    customers = [Customer(f"customer {n}", str(100_000_000 + n), "050-0000000", f"{n}@example.com", PASSWORD, 0)
+                 for n in range(size)]
+    orders = [Order(rng.choice(customers).customer_id, None, None, rng.choice(addresses).id, package_id,
+                    PackageStatus.CREATED.value, auto_save=False, created_at="2025-01-01T00:00:00")
+              for package_id in range(1, size + 1)]
+
+    storage.repository("addresses", ADDRESSES_PATH).replace_all(
+        [a.to_dict() for a in addresses])
+    Courier._repository().replace_all([c.to_dict() for c in couriers])
+    customerList.save_customers([c.to_dict() for c in customers])
+    Order.store().replace_all([o.to_dict() for o in orders])
+    return {"addresses": [a.id for a in addresses], "couriers": [c.courier_id for c in couriers],
+            "customers": [c.customer_id for c in customers], "orders": [o._package_id for o in orders]}
+
+
+def operations(ds: DispatchSystem, ids: Dict[str, list], rng: random.Random) -> Dict[str, Callable[[], object]]:
+    """The operations to time, each as a function making one call with fresh random arguments."""
+    def login(user_type: str, user_id: str) -> bool:
+        # What app.authenticate_user() does
+        record = ds.get_user_record(user_type, user_id)
+        return bool(record) and hmac.compare_digest(str(record["password"]).encode(), PASSWORD.encode())
+
+    def new_address():
+        n = rng.randrange(10**6)
+        return Address(f"Benchmark street {n}", n % 200 + 1, "Tel Aviv", str(6100000 + n), "Israel")
+
+    return {
+        "add_order": lambda: ds.add_order({
+            "customer_id": rng.choice(ids["customers"]), "courier_id": None, "origin_id": None,
+            "destination_id": rng.choice(ids["addresses"]), "status": PackageStatus.CREATED}),
+        "find_order_by_package_id": lambda: ds.find_order_by_package_id(rng.choice(ids["orders"])),
+        "update_order_status": lambda: ds.update_order_status(
+            rng.choice(ids["orders"]), rng.choice([PackageStatus.CREATED, PackageStatus.ON_DELIVERY])),
+        "view_orders": ds.view_orders,
+        "assign_closest_courier_to_order": lambda: ds.assign_closest_courier_to_order(rng.choice(ids["orders"])),
+        "AddressRepository.add": lambda: ds.address_repo.add(new_address()),
+        "AddressRepository.get_by_id": lambda: ds.address_repo.get_by_id(rng.choice(ids["addresses"])),
+        "login (customer)": lambda: login("customers", rng.choice(ids["customers"])),
+        "login (courier)": lambda: login("couriers", str(rng.choice(ids["couriers"]))),
+    }
+
+
+# view_orders() reads every order, so it is timed fewer times
+CALLS_FACTOR = {"view_orders": 0.1}
+
+
+def run(size: int, calls: int, backend: str, seed_value: int = 0) -> List[dict]:
+    with fresh_data_dir("bench-dispatch-", backend, geocoder=geocoding.StubGeocoder()):
+        return _measure(size, calls, random.Random(seed_value))
+
+
+def _measure(size: int, calls: int, rng: random.Random) -> List[dict]:
+    start = time.perf_counter()
+    ids = seed(size, rng)
+    ds = DispatchSystem("managers.json", "addresses.json",
+                        deferred_geocoding=False)
+    seed_s = time.perf_counter() - start
+    results = []
+    for name, call in operations(ds, ids, rng).items():
+        # also warms caches and indexes
+        assert call() is not False, f"{name} failed"
+        timings = []
+        for _ in range(max(1, int(calls * CALLS_FACTOR.get(name, 1)))):
+            start = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - start) * 1000)
+        results.append({"operation": name, "entities": size, "calls": len(timings),
+                        "mean_ms": sum(timings) / len(timings), "p50_ms": percentile(timings, 50),
+                        "p95_ms": percentile(timings, 95), "seed_s": seed_s})
+    return results
+
+
+def environment(backend: str) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"), "commit": commit,
+            "python": sys.version.split()[0], "platform": platform.platform(), "backend": backend,
+            "serializer": config.SERIALIZER}
+
+
+def compare(results: List[dict], baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["operation"], r["entities"])
+                     : r for r in json.load(f)["results"]}
+    print(f"\ncompared with {baseline_path}")
+    print(f"{'operation':>32} {'entities':>9} {'before ms':>10} {'now ms':>10} {'ratio':>7}")
+    for r in results:
+        before = baseline.get((r["operation"], r["entities"]))
+        if before:
+            ratio = r["mean_ms"] / \
+                before["mean_ms"] if before["mean_ms"] else float('inf')
+            print(f"{r['operation']:>32} {r['entities']:>9} {before['mean_ms']:>10.3f} {r['mean_ms']:>10.3f} "
+                  f"{ratio:>6.2f}x")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1_000, 10_000, 100_000])
+    parser.add_argument("--calls", type=int, default=100,
+                        help="timed calls per operation and size")
+    parser.add_argument(
+        "--backend", choices=["json", "sqlite"], default=config.STORAGE_BACKEND)
+    parser.add_argument("--output", default="bench_dispatch_system.json",
+                        help="where to write the JSON results")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="an earlier results file to compare with")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    output = os.path.abspath(args.output)
+
+    results = []
+    print(f"{'operation':>32} {'entities':>9} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for size in args.sizes:
+        for r in run(size, args.calls, args.backend):
+            results.append(r)
+            print(f"{r['operation']:>32} {r['entities']:>9} {r['mean_ms']:>10.3f} {r['p50_ms']:>10.3f} "
+                  f"{r['p95_ms']:>10.3f}")
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(args.backend),
+                  "results": results}, f, indent=2)
+    print(f"results written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Load-test the Flask app with concurrent virtual users and report throughput and latency per route.
+
+The app runs against a freshly seeded temporary data directory, with the
+offline stub geocoder (optionally slowed down to mimic a real one). Every
+virtual user is a customer who logs in. Then, until the run ends, each user
+keeps picking a request from the mix by weight:
+- log in again
+- create an order
+- list its orders
+
+Requests go through the Flask test client by default. With --transport wsgi
+they go over HTTP to a local threaded WSGI server, so the socket, HTTP parsing
+and server threads are included in the timings.
+
+Run from the repository root:
+    python -m benchmarks.bench_http_load [--users 20] [--duration 30] [--mix authenticate=1,create_order=2,orders=7]
+        [--transport client|wsgi] [--output results.json]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import geocoding
+from benchmarks.common import fresh_data_dir, percentile
+
+PASSWORD = "load-test"
+LAT_RANGE = (32.02, 32.15)
+LON_RANGE = (34.76, 34.86)
+CITIES = ["Tel Aviv", "Ramat Gan", "Givatayim", "Bat Yam", "Holon"]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ACTIONS:
+            raise argparse.ArgumentTypeError(
+                f"unknown action {name!r}; choose from {', '.join(ACTIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class SlowGeocoder:
+    """StubGeocoder that takes latency seconds per call, like a remote geocoding service."""
+
+    def __init__(self, latency: float) -> None:
+        self.stub = geocoding.StubGeocoder()
+        self.latency = latency
+
+    def geocode(self, query: str):
+        time.sleep(self.latency)
+        return self.stub.geocode(query)
+
+
+@contextmanager
+def app_environment(couriers: int, customers: int, geocoder_latency: float) -> Iterator[object]:
+    """
+    Import the app inside a temporary data directory seeded with couriers and customers.
+    The app builds its DispatchSystem on import, so this works once per process.
+    """
+    geocoder = SlowGeocoder(
+        geocoder_latency) if geocoder_latency else geocoding.StubGeocoder()
+    with fresh_data_dir("load-test-", geocoder=geocoder):
+        import app as app_module  # builds its DispatchSystem in the current directory
+        logging.getLogger().setLevel(logging.WARNING)
+        seed(app_module.ds, couriers, customers)
+        yield app_module.app
+
+
+def seed(ds, couriers: int, customers: int, rng: Optional[random.Random] = None) -> None:
+    rng = rng or random.Random(0)
+    with ds.unit_of_work():
+        for courier_id in range(1, couriers + 1):
+            home = ds.add_address({"street": f"Depot {courier_id}", "house_number": courier_id % 200 + 1,
+                                   "city": rng.choice(CITIES), "postal_code": str(6100000 + courier_id),
+                                   "country": "Israel",
+                                   "coordinates": (rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))})
+            ds.add_courier({"name": f"courier-{courier_id}", "courier_id": courier_id, "address_id": home.id,
+                            "current_location": home.id, "password": PASSWORD})
+        for n in range(customers):
+            ds.add_customer({"name": f"customer {n}", "customer_id": customer_id(n), "address": [],
+                             "phone_number": "050-0000000", "email": f"customer{n}@example.com",
+                             "password": PASSWORD, "credit": 0})
+
+
+def customer_id(n: int) -> str:
+    return str(200_000_000 + n)
+
+
+# ---------- transports: (method, path, form) -> status code ----------
+
+class FlaskClientTransport:
+    """Requests through Flask's test client; one client (cookie jar) per virtual user."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    @contextmanager
+    def session(self) -> Iterator[Callable[[str, str, Optional[dict]], int]]:
+        client = self.app.test_client()
+
+        def send(method: str, path: str, form: Optional[dict] = None) -> int:
+            return client.open(path, method=method, data=form).status_code
+        yield send
+
+
+class WsgiTransport:
+    """Requests over HTTP to a threaded WSGI server on a local port."""
+
+    def __init__(self, app) -> None:
+        import requests
+        from werkzeug.serving import make_server
+        self._requests = requests
+        logging.getLogger("werkzeug").setLevel(
+            logging.WARNING)  # no access log line per request
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @contextmanager
+    def session(self) -> Iterator[Callable[[str, str, Optional[dict]], int]]:
+        with self._requests.Session() as http:
+            def send(method: str, path: str, form: Optional[dict] = None) -> int:
+                return http.request(method, self.base_url + path, data=form, allow_redirects=False).status_code
+            yield send
+
+    def close(self) -> None:
+        self.server.shutdown()
+
+
+# ---------- virtual users ----------
+
+def login(send, user: str) -> Tuple[str, int]:
+    return "POST /authenticate", send("POST", "/authenticate",
+                                      {"user_type": "customers", "username": user, "password": PASSWORD})
+
+
+def create_order(send, rng: random.Random) -> Tuple[str, int]:
+    n = rng.randrange(100_000)
+    return "POST /create_order", send("POST", "/create_order", {
+        "street": f"Street {n % 700}", "house_number": str(n % 150 + 1), "city": rng.choice(CITIES),
+        "postal_code": str(6100000 + n), "country": "Israel", "message": ""})
+
+
+def list_orders(send) -> Tuple[str, int]:
+    return "GET /orders/<user_type>", send("GET", "/orders/customers")
+
+
+ACTIONS = ("authenticate", "create_order", "orders")
+
+
+class Recorder:
+    """Latencies and failures per route, shared by the virtual users."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def timed(self, request: Callable[[], Tuple[str, int]]) -> None:
+        start = time.perf_counter()
+        try:
+            route, status = request()
+            failed = status >= 400
+        except Exception:
+            route, failed = "error", True
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            if failed:
+                self.errors[route] += 1
+
+
+def virtual_user(transport, number: int, customers: int, mix: Dict[str, float], deadline: float,
+                 think: float, recorder: Recorder) -> None:
+    rng = random.Random(number)
+    user = customer_id(number % customers)
+    actions, weights = list(mix), list(mix.values())
+    with transport.session() as send:
+        recorder.timed(lambda: login(send, user))
+        while time.perf_counter() < deadline:
+            action = rng.choices(actions, weights)[0]
+            if action == "authenticate":
+                recorder.timed(lambda: login(send, user))
+            elif action == "create_order":
+                recorder.timed(lambda: create_order(send, rng))
+            else:
+                recorder.timed(lambda: list_orders(send))
+            if think:
+                time.sleep(rng.expovariate(1 / think))
+
+
+def run(users: int, duration: float, mix: Dict[str, float], transport_name: str = "client", couriers: int = 50,
+        think: float = 0.0, geocoder_latency: float = 0.0) -> dict:
+    with app_environment(couriers, users, geocoder_latency) as app:
+        transport = WsgiTransport(
+            app) if transport_name == "wsgi" else FlaskClientTransport(app)
+        recorder = Recorder()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=virtual_user,
+                                    args=(transport, n, users, mix, start + duration, think, recorder))
+                   for n in range(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if isinstance(transport, WsgiTransport):
+            transport.close()
+
+    routes = []
+    for route, latencies in sorted(recorder.latencies.items()):
+        routes.append({"route": route, "requests": len(latencies), "errors": recorder.errors[route],
+                       "throughput_rps": len(latencies) / elapsed,
+                       "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95),
+                       "p99_ms": percentile(latencies, 99), "max_ms": max(latencies)})
+    total = sum(r["requests"] for r in routes)
+    return {"users": users, "duration_s": elapsed, "transport": transport_name, "mix": mix,
+            "think_s": think, "geocoder_latency_s": geocoder_latency,
+            "throughput_rps": total / elapsed, "routes": routes}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20,
+                        help="concurrent virtual users")
+    parser.add_argument("--duration", type=float,
+                        default=30, help="seconds to run")
+    parser.add_argument("--mix", type=parse_mix, default="authenticate=1,create_order=2,orders=7",
+                        help="relative weights of the actions, e.g. authenticate=1,create_order=2,orders=7")
+    parser.add_argument(
+        "--transport", choices=["client", "wsgi"], default="client")
+    parser.add_argument("--couriers", type=int, default=50)
+    parser.add_argument("--think-ms", type=float, default=0,
+                        help="mean pause between a user's requests")
+    parser.add_argument("--geocoder-latency-ms", type=float, default=0,
+                        help="delay added to every geocoding call")
+    parser.add_argument(
+        "--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    output = os.path.abspath(args.output) if args.output else None
+
+    result = run(args.users, args.duration, args.mix, args.transport, args.couriers,
+                 args.think_ms / 1000, args.geocoder_latency_ms / 1000)
+
+    print(f"{args.users} users for {result['duration_s']:.1f}s over {args.transport}: "
+          f"{result['throughput_rps']:.1f} requests/s")
+    print(f"{'route':>24} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9}")
+    for r in result["routes"]:
+        print(f"{r['route']:>24} {r['requests']:>9} {r['errors']:>7} {r['throughput_rps']:>8.1f} "
+              f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['max_ms']:>9.2f}")
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
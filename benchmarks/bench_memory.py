@@ -0,0 +1,137 @@
+"""
+Benchmark the memory held by the live order and address stores once they have loaded large data files.
+
+Each store is created over a file of generated records, as a worker process
+does at startup, and the memory it still holds after loading is measured.
+The records as parsed from the file (a list of dicts) are measured alongside
+for reference, with the slotted models built from them.
+
+Run from the repository root:
+    python -m benchmarks.bench_memory [--orders 1000000] [--addresses 500000]
+"""
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import serialization
+import storage
+from address import Address
+from address_repository import AddressRepository
+from benchmarks.common import fresh_data_dir
+from order import Order
+from order_store import OrderStore
+
+STATUSES = ["created", "confirmed - assigned to courier",
+            "on-delivery", "delivered"]
+CITIES = ["Haifa", "Tel Aviv", "Jerusalem", "Beer Sheva", "Netanya", "Ashdod"]
+STREETS = [f"Street {n}" for n in range(2000)]
+
+
+def order_records(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    for package_id in range(1, count + 1):
+        yield {
+            "package_id": package_id,
+            "customer_id": str(rng.randrange(100_000_000, 100_050_000)),
+            "courier_id": rng.choice([None, rng.randrange(1, 500)]),
+            "origin_id": rng.randrange(1, 10_000),
+            "destination_id": rng.randrange(1, 10_000),
+            "status": "".join(rng.choice(STATUSES)),
+            "created_at": (start + timedelta(seconds=rng.randrange(30_000_000))).isoformat(timespec="seconds"),
+        }
+
+
+def address_records(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    for address_id in range(1, count + 1):
+        yield {
+            "id": address_id,
+            "street": "".join(rng.choice(STREETS)),
+            "house_number": str(rng.randrange(1, 200)),
+            "city": "".join(rng.choice(CITIES)),
+            "postal_code": str(rng.randrange(1_000_000, 9_999_999)),
+            "country": "".join("Israel"),
+            "apartment": rng.choice([None, rng.randrange(1, 40)]),
+            "floor": rng.choice([None, rng.randrange(0, 20)]),
+            "coordinates": [rng.uniform(29.5, 33.3), rng.uniform(34.2, 35.7)],
+            "message": None,
+            "coordinates_pending": False,
+            "geocode_failed": False,
+        }
+
+
+def measure(build) -> int:
+    """Return the bytes still allocated by the object build() returns."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def write_file(path: Path, records) -> None:
+    with path.open("w", encoding="utf-8") as file:
+        json.dump(list(records), file)
+
+
+def loaded(repository: storage.Repository) -> storage.Repository:
+    len(repository)  # the json backend parses its file on first use
+    return repository
+
+
+def run(orders: int, addresses: int) -> list:
+    results = []
+    with fresh_data_dir("bench-memory-", backend="json"):
+        orders_path, addresses_path = Path(
+            "data/orders.json"), Path("data/addresses.json")
+        write_file(orders_path, order_records(orders))
+        write_file(addresses_path, address_records(addresses))
+        representations = [
+            ("orders", orders, "parsed dicts",
+             lambda: serialization.load_file(orders_path)),
+            ("orders", orders, "OrderStore",
+             lambda: OrderStore(orders_path, journal=False)),
+            ("orders", orders, "Order (__slots__)",
+             lambda: [Order.from_dict(r) for r in serialization.load_file(orders_path)]),
+            ("addresses", addresses, "parsed dicts",
+             lambda: serialization.load_file(addresses_path)),
+            ("addresses", addresses, "JsonRepository",
+             lambda: loaded(storage.JsonRepository(addresses_path, "id",
+                                                   shared=storage.SHARED_VALUES["addresses"]))),
+            ("addresses", addresses, "AddressRepository",
+             lambda: AddressRepository(addresses_path)),
+            ("addresses", addresses, "Address (__slots__)",
+             lambda: [Address.from_dict(r) for r in serialization.load_file(addresses_path)]),
+        ]
+        for entity, count, name, build in representations:
+            if count:
+                size = measure(build)
+                results.append({"entity": entity, "records": count, "representation": name,
+                                "mb": size / 1e6, "bytes_per_record": size / count})
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--addresses", type=int, default=500_000)
+    args = parser.parse_args()
+
+    print(f"{'entity':>10} {'records':>9} {'representation':>22} {'MB':>9} {'bytes/rec':>10}")
+    for r in run(args.orders, args.addresses):
+        print(f"{r['entity']:>10} {r['records']:>9} {r['representation']:>22} "
+              f"{r['mb']:>9.1f} {r['bytes_per_record']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark the dashboard aggregates: Python loops over Order objects versus the NumPy order table.
+
+Run from the repository root:
+    python -m benchmarks.bench_order_analytics [--orders 1000000] [--couriers 500]
+"""
+import argparse
+import random
+import time
+from collections import Counter
+
+from order import Order
+from order_analytics import CLOSED_STATUSES, OrderAnalytics
+
+STATUSES = ["created", "confirmed - assigned to courier",
+            "on-delivery", "delivered", "canceled"]
+DESTINATIONS = 10_000
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def loop_aggregates(orders):
+    by_status = Counter(o._status for o in orders)
+    by_courier = Counter(o._courier_id for o in orders
+                         if o._courier_id is not None and o._status not in CLOSED_STATUSES)
+    return by_status, by_courier
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--couriers", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    coordinates = {d: (rng.uniform(29.5, 33.3), rng.uniform(34.2, 35.7))
+                   for d in range(DESTINATIONS)}
+    records = [{"package_id": package_id, "courier_id": rng.choice([None, rng.randrange(args.couriers)]),
+                "destination_id": rng.randrange(DESTINATIONS), "status": rng.choice(STATUSES)}
+               for package_id in range(1, args.orders + 1)]
+
+    class Records:
+        """Stands in for the order store: the parts of it OrderAnalytics uses."""
+
+        def data_version(self):
+            return 0
+
+        def add_listener(self, listener):
+            pass
+
+        def scan(self):
+            return iter(records)
+
+    analytics = OrderAnalytics(Records(), coordinates.get)
+    _, build_ms = timed(analytics.status_counts)
+    objects, objects_ms = timed(lambda: [Order.from_dict(r) for r in records])
+    _, loop_ms = timed(lambda: loop_aggregates(objects))
+    _, status_ms = timed(analytics.status_counts)
+    _, courier_ms = timed(lambda: analytics.orders_per_courier(open_only=True))
+    _, area_ms = timed(analytics.open_orders_by_area)
+    _, filter_ms = timed(lambda: analytics.count(
+        status="on-delivery", courier_id=7))
+
+    print(f"{args.orders} orders")
+    print(f"  build table:                      {build_ms:9.1f} ms (once)")
+    print(f"  view_orders()-style Order objects:{objects_ms:9.1f} ms")
+    print(f"  Python loop, status + courier:    {loop_ms:9.1f} ms")
+    print(f"  NumPy status counts:              {status_ms:9.1f} ms")
+    print(f"  NumPy open orders per courier:    {courier_ms:9.1f} ms")
+    print(f"  NumPy open orders per area:       {area_ms:9.1f} ms")
+    print(f"  NumPy filtered count:             {filter_ms:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark encoding and decoding an orders file with every available serializer.
+
+Run from the repository root:
+    python -m benchmarks.bench_serialization [--orders 100000] [--repeat 3]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import serialization
+
+STATUSES = ["created", "confirmed", "on_delivery", "delivered"]
+
+
+def sample_orders(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    return [{
+        "package_id": package_id,
+        "customer_id": str(rng.randrange(100_000_000, 999_999_999)),
+        "courier_id": rng.choice([None, rng.randrange(1, 500)]),
+        "origin_id": rng.randrange(1, 10_000),
+        "destination_id": rng.randrange(1, 10_000),
+        "status": rng.choice(STATUSES),
+        "created_at": (start + timedelta(seconds=rng.randrange(30_000_000))).isoformat(timespec="seconds"),
+    } for package_id in range(1, count + 1)]
+
+
+def best_of(repeat: int, func) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(name: str, orders: list, repeat: int) -> dict:
+    serializer = serialization.get(name)
+    data = serializer.dumps(orders)
+    encode = best_of(repeat, lambda: serializer.dumps(orders))
+    decode = best_of(repeat, lambda: serialization.loads(data))
+    assert serialization.loads(data) == orders
+    return {
+        "format": name,
+        "size_mb": len(data) / 1e6,
+        "encode_s": encode,
+        "decode_s": decode,
+        "encode_orders_per_s": len(orders) / encode,
+        "decode_orders_per_s": len(orders) / decode,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    orders = sample_orders(args.orders)
+    formats = ["pretty", "json"] + \
+        (["msgpack"] if serialization.msgpack is not None else [])
+    print(f"{'format':>8} {'size MB':>9} {'encode s':>9} {'decode s':>9} {'enc/s':>11} {'dec/s':>11}")
+    for name in formats:
+        r = run(name, orders, args.repeat)
+        print(f"{r['format']:>8} {r['size_mb']:>9.2f} {r['encode_s']:>9.3f} {r['decode_s']:>9.3f} "
+              f"{r['encode_orders_per_s']:>11,.0f} {r['decode_orders_per_s']:>11,.0f}")
+    if serialization.msgpack is None:
+        print("(msgpack not installed; pip install msgpack to include it)")
+
+
+if __name__ == "__main__":
+    main()
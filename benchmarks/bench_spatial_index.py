@@ -0,0 +1,85 @@
+"""
+Benchmark nearest-courier lookup: linear scan (the old assignment loop) versus GridSpatialIndex.
+
+Run from the repository root:
+    python -m benchmarks.bench_spatial_index [--sizes 10000 100000] [--queries 1000]
+"""
+import argparse
+import random
+import time
+
+from spatial_index import GridSpatialIndex
+
+# Rough bounding box of Israel, where the sample data lives
+LAT_RANGE = (29.5, 33.3)
+LON_RANGE = (34.2, 35.7)
+
+
+def random_point(rng: random.Random):
+    return (rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))
+
+
+def linear_nearest(positions, point):
+    best_id, best_distance = None, float('inf')
+    x2, y2 = point
+    for courier_id, (x1, y1) in positions.items():
+        distance = ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
+        if distance < best_distance:
+            best_id, best_distance = courier_id, distance
+    return best_id
+
+
+def run(size: int, queries: int, cell_size: float, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    positions = {courier_id: random_point(rng) for courier_id in range(size)}
+    points = [random_point(rng) for _ in range(queries)]
+
+    start = time.perf_counter()
+    index = GridSpatialIndex(cell_size)
+    for courier_id, point in positions.items():
+        index.insert(courier_id, point)
+    build = time.perf_counter() - start
+
+    linear_queries = min(queries, 100)
+    start = time.perf_counter()
+    for point in points[:linear_queries]:
+        linear_nearest(positions, point)
+    linear = (time.perf_counter() - start) / linear_queries
+
+    start = time.perf_counter()
+    for point in points:
+        index.nearest(point)
+    nearest = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    for point in points:
+        index.k_nearest(point, 10)
+    k_nearest = (time.perf_counter() - start) / queries
+
+    return {
+        "couriers": size,
+        "build_s": build,
+        "linear_nearest_ms": linear * 1000,
+        "grid_nearest_ms": nearest * 1000,
+        "grid_k10_ms": k_nearest * 1000,
+        "speedup": linear / nearest if nearest else float('inf'),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10_000, 100_000])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--cell-size", type=float, default=0.01)
+    args = parser.parse_args()
+
+    print(f"{'couriers':>10} {'build s':>9} {'linear ms':>10} {'grid ms':>9} {'k=10 ms':>9} {'speedup':>9}")
+    for size in args.sizes:
+        r = run(size, args.queries, args.cell_size)
+        print(f"{r['couriers']:>10} {r['build_s']:>9.3f} {r['linear_nearest_ms']:>10.3f} "
+              f"{r['grid_nearest_ms']:>9.4f} {r['grid_k10_ms']:>9.4f} {r['speedup']:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
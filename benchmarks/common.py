@@ -0,0 +1,60 @@
+"""
+Helpers shared by the benchmarks and the delivery simulator.
+"""
+import gc
+import math
+import os
+import tempfile
+from contextlib import contextmanager, redirect_stdout
+from typing import Any, Iterator, List, Optional
+
+import config
+import geocoding
+import id_allocator
+import storage
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Return the p-th percentile (nearest rank) of values, or 0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+@contextmanager
+def fresh_data_dir(prefix: str, backend: Optional[str] = None, journal: Optional[bool] = None,
+                   geocoder: Any = None) -> Iterator[str]:
+    """
+    Run in an empty temporary directory with a data/ folder and fresh stores
+    and id allocators, and yield its path. backend, journal and geocoder, when
+    given, replace the configured storage backend, ORDERS_JOURNAL and geocoder
+    until the block ends. The models print a line for most changes, so stdout
+    is discarded meanwhile.
+    """
+    saved = (os.getcwd(), config.STORAGE_BACKEND,
+             config.SQLITE_PATH, config.ORDERS_JOURNAL)
+    with tempfile.TemporaryDirectory(prefix=prefix) as workdir:
+        os.chdir(workdir)
+        os.mkdir("data")
+        storage.reset()
+        id_allocator.reset()
+        if backend is not None:
+            storage.set_backend(backend, "data/dispatch.sqlite3")
+        if journal is not None:
+            config.ORDERS_JOURNAL = journal
+        if geocoder is not None:
+            geocoding.set_geocoder(geocoder)
+        try:
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                yield workdir
+        finally:
+            # A DispatchSystem sits in reference cycles; collect it now, or it would go on
+            # listening to Courier changes and resolve its data/ paths in the next directory
+            gc.collect()
+            storage.reset()
+            id_allocator.reset()
+            if geocoder is not None:
+                geocoding.set_geocoder(None)
+            os.chdir(saved[0])
+            config.STORAGE_BACKEND, config.SQLITE_PATH, config.ORDERS_JOURNAL = saved[1:]
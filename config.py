@@ -0,0 +1,93 @@
+"""
+Runtime settings for the dispatch system.
+Every value can be overridden through an environment variable of the same name prefixed with DISPATCH_.
+"""
+import os
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Storage backend for all entities: "json" (one file per entity) or "sqlite"
+STORAGE_BACKEND = os.environ.get("DISPATCH_STORAGE_BACKEND", "json")
+# SQLite database used by the "sqlite" backend
+SQLITE_PATH = os.environ.get("DISPATCH_SQLITE_PATH", "data/dispatch.sqlite3")
+
+# Encoding of the data files written by the "json" backend: "json" (compact), "pretty" or "msgpack".
+# Files in any of these encodings are always readable.
+SERIALIZER = os.environ.get("DISPATCH_SERIALIZER", "json")
+
+# IDs each worker process leases at a time from the shared order/address ID counters
+ID_BLOCK_SIZE = _env_int("DISPATCH_ID_BLOCK_SIZE", 100)
+
+# Orders: append each change to a journal instead of rewriting orders.json. On by default; with it
+# off every order change made outside a batch() rewrites the whole orders file (O(orders) per change)
+ORDERS_JOURNAL = _env_flag("DISPATCH_ORDERS_JOURNAL", True)
+# Number of journal records after which the journal is folded into orders.json
+ORDERS_COMPACT_THRESHOLD = _env_int("DISPATCH_ORDERS_COMPACT_THRESHOLD", 1000)
+
+# Login sessions: seconds of inactivity after which a session expires
+SESSION_TTL = _env_float("DISPATCH_SESSION_TTL", 8 * 3600)
+# Number of sessions each worker caches in memory; the least recently used is dropped first
+SESSION_CACHE_SIZE = _env_int("DISPATCH_SESSION_CACHE_SIZE", 10_000)
+# SQLite table of the sessions, shared by all workers; empty keeps sessions in each worker's memory only
+SESSION_PATH = os.environ.get("DISPATCH_SESSION_PATH", "data/sessions.sqlite3")
+# Seconds a worker trusts its cached copy of a session before checking the shared table again
+SESSION_RECHECK_SECONDS = _env_float("DISPATCH_SESSION_RECHECK_SECONDS", 30.0)
+
+# Geocoding: "nominatim" for the public API, "stub" for the offline test geocoder
+GEOCODER = os.environ.get("DISPATCH_GEOCODER", "nominatim")
+# On-disk geocoding cache shared by all workers; empty keeps the cache in memory only
+GEOCODE_CACHE_PATH = os.environ.get(
+    "DISPATCH_GEOCODE_CACHE_PATH", "data/geocode_cache.sqlite3")
+# Number of geocoding results kept in the in-memory LRU tier
+GEOCODE_CACHE_SIZE = _env_int("DISPATCH_GEOCODE_CACHE_SIZE", 4096)
+# Maximum Nominatim requests per second (its usage policy allows 1); 0 disables the limit.
+# The offline stub geocoder is never limited
+GEOCODE_RATE_LIMIT = _env_float("DISPATCH_GEOCODE_RATE_LIMIT", 1.0)
+# Seconds to wait for the geocoding provider to connect or answer before the attempt fails
+GEOCODE_TIMEOUT = _env_float("DISPATCH_GEOCODE_TIMEOUT", 10.0)
+# Store new addresses immediately and geocode them on background workers
+GEOCODING_DEFERRED = _env_flag("DISPATCH_GEOCODING_DEFERRED")
+# Number of background geocoding workers used in deferred mode
+GEOCODING_WORKERS = _env_int("DISPATCH_GEOCODING_WORKERS", 2)
+
+# Cell size, in degrees, of the grid used to index courier positions (~1 km)
+COURIER_INDEX_CELL_SIZE = _env_float("DISPATCH_COURIER_INDEX_CELL_SIZE", 0.01)
+# Most order x courier matrix cells, summed over its rounds, solved exactly in batch assignment;
+# bigger batches use the greedy pass
+ASSIGNMENT_MATRIX_LIMIT = _env_int("DISPATCH_ASSIGNMENT_MATRIX_LIMIT", 250_000)
+# Open (confirmed or on-delivery) orders a courier can hold before it stops getting new ones; 0 for no limit
+COURIER_CAPACITY = _env_int("DISPATCH_COURIER_CAPACITY", 3)
+# Seconds between the batched writes of courier GPS positions; 0 writes every ping immediately
+LOCATION_FLUSH_SECONDS = _env_float("DISPATCH_LOCATION_FLUSH_SECONDS", 5.0)
+# Seconds a ping's timestamp may run ahead of the server clock; later ones are taken as "now"
+LOCATION_MAX_CLOCK_SKEW = _env_float("DISPATCH_LOCATION_MAX_CLOCK_SKEW", 30.0)
+
+# Record call counts, latencies and I/O volumes and serve them on /metrics (Prometheus format)
+METRICS = _env_flag("DISPATCH_METRICS")
+
+# Tracing: share of requests whose span trace is written (0 to 1)
+TRACE_SAMPLE_RATE = _env_float("DISPATCH_TRACE_SAMPLE_RATE", 0.0)
+# Requests taking at least this many milliseconds are always traced and their breakdown logged; 0 disables
+TRACE_SLOW_MS = _env_float("DISPATCH_TRACE_SLOW_MS", 0.0)
+# File the traces are appended to, one OTLP/JSON line per trace
+TRACE_PATH = os.environ.get("DISPATCH_TRACE_PATH", "data/traces.jsonl")
@@ -1,20 +1,54 @@
-import json
-from typing import Dict, Any, List, Union, Optional
+import weakref
+from typing import Dict, Any, Callable, ClassVar, Iterator, List, Union, Optional
 from dataclasses import dataclass
+import storage
+from storage import Repository
 
 COURIER_JSON = "data/courier.json"
 
 
-@dataclass
+@dataclass(slots=True)
 class Courier:
     """
     Represents a courier with ID, name, password, location, and address.
+    Couriers that are not on shift are never assigned orders.
     """
     name: str
     courier_id: int
     address_id: int
     current_location: int
     password: str
+    on_shift: bool = True
+
+    # Callbacks notified as listener(courier_id, courier) after a courier is
+    # created, updated or deleted (courier is None on delete). Inside a unit of
+    # work they are called once it commits, when the stores' locks are released.
+    _listeners: ClassVar[List[Any]] = []
+
+    @classmethod
+    def add_listener(cls, listener: Callable[[int, Optional['Courier']], None]) -> None:
+        """
+        Registers a callback for courier changes.
+        Bound methods are held weakly so that listening does not keep their owner alive.
+        """
+        if hasattr(listener, "__self__"):
+            cls._listeners.append(weakref.WeakMethod(listener))
+        else:
+            cls._listeners.append(lambda: listener)
+
+    @classmethod
+    def _notify(cls, courier_id: int, courier: Optional['Courier']) -> None:
+        storage.after_commit(lambda: cls._call_listeners(courier_id, courier))
+
+    @classmethod
+    def _call_listeners(cls, courier_id: int, courier: Optional['Courier']) -> None:
+        alive = []
+        for ref in cls._listeners:
+            listener = ref()
+            if listener is not None:
+                listener(courier_id, courier)
+                alive.append(ref)
+        cls._listeners[:] = alive
 
     def __str__(self):
         """Return formatted courier info."""
@@ -33,7 +67,8 @@ class Courier:
             "name": self.name,
             "address_id": self.address_id,
             "current_location": self.current_location,
-            "password": self.password}
+            "password": self.password,
+            "on_shift": self.on_shift}
 
     @classmethod
     def from_dict(cls, data: Dict) -> 'Courier':
@@ -43,84 +78,57 @@ class Courier:
             courier_id=data["courier_id"],
             address_id=data["address_id"],
             current_location=data["current_location"],
-            password=data["password"]
+            password=data["password"],
+            on_shift=data.get("on_shift", True)
         )
 
     @staticmethod
-    def _load_all_from_json(json_file: str = COURIER_JSON) -> List[Dict]:
+    def _repository(json_file: str = COURIER_JSON) -> Repository:
         """
-        Helper static method to load all raw courier dictionaries from the JSON file.
-        Returns an empty list if the file doesn't exist or is invalid.
+        Helper static method returning the repository that stores the couriers
+        (the courier JSON file or its SQLite table, depending on the storage backend).
         """
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return []
-        except json.JSONDecodeError:
-            print(
-                f"Warning: {json_file} is empty or contains invalid JSON. Starting with empty data.")
-            return []
-
-    @staticmethod
-    def _save_all_to_json(couriers_data: List[Dict], json_file: str = COURIER_JSON):
-        """
-        Helper static method to save a list of raw courier dictionaries to the JSON file.
-        """
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(couriers_data, f, indent=4, ensure_ascii=False)
+        return storage.repository("couriers", json_file)
 
     @classmethod
     def create_courier(cls, courier: 'Courier') -> bool:
         """
-        Adds a new courier to the JSON file.
+        Adds a new courier to the courier repository.
+        Returns False if a courier with the same ID already exists.
         """
-        all_couriers_data = cls._load_all_from_json()
-        all_couriers_data.append(courier.to_dict())
-        cls._save_all_to_json(all_couriers_data)
+        if not cls._repository().insert(courier.to_dict()):
+            print(
+                f"Error: Courier with ID {courier.courier_id} already exists.")
+            return False
+        cls._notify(courier.courier_id, courier)
         print(f"Courier {courier.name} created successfully.")
         return True
 
     @classmethod
     def get_courier_by_id(cls, courier_id: int) -> Optional['Courier']:
         """
-        Retrieves a courier by their ID from the JSON file.
+        Retrieves a courier by their ID.
         Returns the Courier object if found, otherwise None.
-        Note: This re-reads the entire file for each operation.
         """
-        all_couriers_data = cls._load_all_from_json()
-        for data in all_couriers_data:
-            if data['courier_id'] == courier_id:
-                return cls.from_dict(data)
+        data = cls._repository().get(courier_id)
+        if data is not None:
+            return cls.from_dict(data)
         print(f"Courier with ID {courier_id} not found.")
         return None
 
     @classmethod
     def update_courier(cls, courier_id: int, new_data: Dict[str, Union[str, int]]) -> bool:
         """
-        Updates an existing courier's information in the JSON file.
-        new_data can contain 'name', 'password', 'current_location', 'address_id'.
+        Updates an existing courier's information.
+        new_data can contain 'name', 'password', 'current_location', 'address_id', 'on_shift'.
         Returns True if successful, False if the courier is not found.
-        Note: This re-reads and re-writes the entire file for each operation.
-        """
-        all_couriers_data = cls._load_all_from_json()
-        found = False
-        for i, data in enumerate(all_couriers_data):
-            if data['courier_id'] == courier_id:
-                if 'name' in new_data:
-                    data['name'] = new_data['name']
-                if 'password' in new_data:
-                    data['password'] = new_data['password']
-                if 'current_location' in new_data:
-                    data['current_location'] = new_data['current_location']
-                if 'address_id' in new_data:
-                    data['address_id'] = new_data['address_id']
-                all_couriers_data[i] = data
-                found = True
-                break
-
-        if found:
-            cls._save_all_to_json(all_couriers_data)
+        """
+        changes = {field: new_data[field]
+                   for field in ('name', 'password', 'current_location', 'address_id', 'on_shift')
+                   if field in new_data}
+        repository = cls._repository()
+        if repository.update(courier_id, changes):
+            cls._notify(courier_id, cls.from_dict(repository.get(courier_id)))
             print(f"Courier with ID {courier_id} updated successfully.")
             return True
         else:
@@ -130,17 +138,11 @@ class Courier:
     @classmethod
     def delete_courier(cls, courier_id: int) -> bool:
         """
-        Deletes a courier by their ID from the JSON file.
+        Deletes a courier by their ID.
         Returns True if successful, False if the courier is not found.
-        Note: This re-reads and re-writes the entire file for each operation.
         """
-        all_couriers_data = cls._load_all_from_json()
-        initial_count = len(all_couriers_data)
-        all_couriers_data = [
-            d for d in all_couriers_data if d['courier_id'] != courier_id]
-
-        if len(all_couriers_data) < initial_count:
-            cls._save_all_to_json(all_couriers_data)
+        if cls._repository().delete(courier_id):
+            cls._notify(courier_id, None)
             print(f"Courier with ID {courier_id} deleted successfully.")
             return True
         else:
@@ -151,11 +153,24 @@ class Courier:
     @classmethod
     def read_couriers(cls) -> List['Courier']:
         """
-        Returns a list of all couriers from the JSON file.
-        Note: This re-reads the entire file for each operation.
+        Returns a list of all couriers.
+        """
+        return [cls.from_dict(d) for d in cls._repository().all()]
+
+    @classmethod
+    def scan_records(cls, where: Optional[Dict[str, Any]] = None, after: Optional[int] = None,
+                     limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yields stored courier records in ID order, starting after the ID `after`.
+        """
+        return cls._repository().scan(where, after, limit)
+
+    @classmethod
+    def data_version(cls) -> int:
+        """
+        Returns a number that changes whenever another process changed the stored couriers.
         """
-        all_couriers_data = cls._load_all_from_json()
-        return [cls.from_dict(d) for d in all_couriers_data]
+        return cls._repository().data_version()
 
     @classmethod
     def courier_exists(cls, courier_id: int) -> bool:
@@ -163,8 +178,4 @@ class Courier:
         Checks if a courier with the given ID already exists.
         Returns True if the courier exists, False otherwise.
         """
-        all_couriers_data = cls._load_all_from_json()
-        for data in all_couriers_data:
-            if data['courier_id'] == courier_id:
-                return True
-        return False
+        return courier_id in cls._repository()
@@ -0,0 +1,169 @@
+"""
+Courier availability: which couriers can take another order right now.
+
+A courier is off-shift while its record says so (Courier.on_shift is False),
+on-delivery while it holds at least one open order (confirmed or on its way)
+and idle otherwise. An on-shift courier can take new orders until it holds
+`capacity` open orders (config.COURIER_CAPACITY; 0 means no limit).
+
+The open orders of every courier are kept from the order store's change
+listener, so the load of a courier is a dictionary lookup instead of a scan
+of the orders. The listener only records the latest version of each changed
+order, so however many writes happen between two queries, what waits to be
+applied is bounded by the number of orders. When the store's data_version()
+changes the counts are rebuilt from its status index, which only reads the
+open orders. The store is never read while self._lock is held, as its
+writers hold the store's lock when they notify the listener.
+"""
+import logging
+import threading
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import config
+from order import PackageStatus
+from storage import Repository
+
+
+_logger = logging.getLogger(__name__)
+
+# Orders in these statuses occupy their courier
+OPEN_STATUSES = (PackageStatus.CONFIRMED.value,
+                 PackageStatus.ON_DELIVERY.value)
+
+
+class CourierState(Enum):
+    IDLE = "idle"
+    ON_DELIVERY = "on-delivery"
+    OFF_SHIFT = "off-shift"
+
+
+class CourierAvailability:
+    """
+    Open-order counts and shifts of the couriers, kept up to date incrementally.
+
+    Order changes arrive through the store's listener and are applied before
+    the next query. Shifts come from the courier records; the owner reports
+    them with set_on_shift() and set_off_shift().
+    """
+
+    def __init__(self, store: Repository, capacity: Optional[int] = None) -> None:
+        self.store = store
+        self.capacity = config.COURIER_CAPACITY if capacity is None else capacity
+        self._lock = threading.Lock()
+        # package_id -> latest order (None once deleted) not applied yet, filled by the
+        # store's listener under _changes_lock; _replaced is set by replace_all()
+        self._changes: Dict[Any, Optional[Dict[str, Any]]] = {}
+        self._replaced = False
+        self._changes_lock = threading.Lock()
+        self._version: Optional[int] = None
+        # package_id -> courier_id of every open order, and the reverse
+        self._courier_of: Dict[Any, Any] = {}
+        self._open: Dict[Any, Set[Any]] = {}
+        self._off_shift: Set[Any] = set()
+        store.add_listener(self._on_change)
+
+    def _on_change(self, package_id: Any, order: Optional[Dict[str, Any]]) -> None:
+        with self._changes_lock:
+            if package_id is None:
+                self._changes.clear()
+                self._replaced = True
+            else:
+                self._changes[package_id] = order
+
+    # ---------- maintenance ----------
+
+    def _put(self, package_id: Any, order: Optional[Dict[str, Any]]) -> None:
+        courier_id = self._courier_of.pop(package_id, None)
+        if courier_id is not None:
+            orders = self._open[courier_id]
+            orders.discard(package_id)
+            if not orders:
+                del self._open[courier_id]
+        if order is None or order.get("status") not in OPEN_STATUSES or order.get("courier_id") is None:
+            return
+        courier_id = order["courier_id"]
+        self._courier_of[package_id] = courier_id
+        self._open.setdefault(courier_id, set()).add(package_id)
+
+    def _take_changes(self) -> Tuple[Dict[Any, Optional[Dict[str, Any]]], bool]:
+        with self._changes_lock:
+            changes, replaced = self._changes, self._replaced
+            self._changes, self._replaced = {}, False
+        return changes, replaced
+
+    def _refresh(self) -> None:
+        """Apply the pending order changes, rebuilding if needed; called without self._lock."""
+        version = self.store.data_version()
+        changes, replaced = self._take_changes()
+        if replaced or version != self._version:
+            # The store already holds every change reported so far; later ones stay queued
+            orders = [order for status in OPEN_STATUSES for order in self.store.find_by(
+                "status", status)]
+            with self._lock:
+                self._courier_of = {}
+                self._open = {}
+                for order in orders:
+                    self._put(order.get("package_id"), order)
+                self._version = version
+            _logger.info(
+                f"Courier availability rebuilt from {len(orders)} open orders")
+            return
+        if changes:
+            with self._lock:
+                for package_id, order in changes.items():
+                    self._put(package_id, order)
+
+    def set_on_shift(self, courier_id: Any, on_shift: bool = True) -> None:
+        with self._lock:
+            if on_shift:
+                self._off_shift.discard(courier_id)
+            else:
+                self._off_shift.add(courier_id)
+
+    def set_off_shift(self, courier_ids: Iterable[Any]) -> None:
+        """Replace the set of off-shift couriers (after reading every courier record)."""
+        with self._lock:
+            self._off_shift = set(courier_ids)
+
+    # ---------- queries ----------
+
+    def _free_slots(self, courier_id: Any) -> Optional[int]:
+        if courier_id in self._off_shift:
+            return 0
+        if self.capacity <= 0:
+            return None
+        return max(0, self.capacity - len(self._open.get(courier_id, ())))
+
+    def load(self, courier_id: Any) -> int:
+        """Number of open orders the courier holds."""
+        self._refresh()
+        with self._lock:
+            return len(self._open.get(courier_id, ()))
+
+    def open_orders(self, courier_id: Any) -> List[Any]:
+        """Package IDs of the courier's open orders, in ascending order."""
+        self._refresh()
+        with self._lock:
+            return sorted(self._open.get(courier_id, ()))
+
+    def state(self, courier_id: Any) -> CourierState:
+        self._refresh()
+        with self._lock:
+            if courier_id in self._off_shift:
+                return CourierState.OFF_SHIFT
+            return CourierState.ON_DELIVERY if self._open.get(courier_id) else CourierState.IDLE
+
+    def free_slots(self, courier_ids: Iterable[Any]) -> Dict[Any, Optional[int]]:
+        """How many more orders each courier can take (None for no limit; 0 when off-shift or full)."""
+        self._refresh()
+        with self._lock:
+            return {courier_id: self._free_slots(courier_id) for courier_id in courier_ids}
+
+    def eligible(self) -> Callable[[Any], bool]:
+        """
+        Bring the counts up to date and return a predicate telling whether a
+        courier can take another order, for GridSpatialIndex.k_nearest().
+        """
+        self._refresh()
+        return lambda courier_id: self._free_slots(courier_id) != 0
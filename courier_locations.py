@@ -0,0 +1,233 @@
+"""
+Latest GPS positions of the couriers, fed by high-frequency location pings.
+
+record_many() keeps the newest position of each courier in memory and hands
+it straight to a callback (DispatchSystem moves the courier in its spatial
+index), so a ping costs a few dictionary updates and no file I/O. The
+positions that changed are written to the "courier_positions" store in one
+batch every config.LOCATION_FLUSH_SECONDS by a background thread, or by
+flush(). Positions received less than one interval before the process stops
+are lost, which the courier's next ping makes up for.
+
+Every ping carries the time it was taken; a ping older than the position
+already known for its courier (late or replayed) is ignored. A timestamp
+more than config.LOCATION_MAX_CLOCK_SKEW seconds in the future is replaced by
+the current time, so a device with a wrong clock cannot pin its courier to a
+position that later pings would never supersede. Worker
+processes pick up each other's flushed positions through sync().
+"""
+import logging
+import math
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+import config
+import metrics
+from storage import Repository
+
+
+_logger = logging.getLogger(__name__)
+
+POSITIONS_JSON = "data/courier_positions.json"
+
+PINGS = metrics.counter("courier_location_pings_total",
+                        "Courier location pings received", ("result",))
+
+Point = Tuple[float, float]
+
+
+class Ping(NamedTuple):
+    """One position report; timestamp is in Unix seconds, None for "now"."""
+    courier_id: Any
+    lat: float
+    lon: float
+    timestamp: Optional[float] = None
+
+
+def parse_point(lat: Any, lon: Any) -> Point:
+    """Return (lat, lon) as floats, or raise ValueError if they are not valid coordinates."""
+    try:
+        point = (float(lat), float(lon))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid coordinates: {lat!r}, {lon!r}") from None
+    # Also rejects NaN, which fails every comparison
+    if not (-90 <= point[0] <= 90 and -180 <= point[1] <= 180):
+        raise ValueError(f"Coordinates out of range: {lat!r}, {lon!r}")
+    return point
+
+
+def _flush_periodically(tracker_ref: "weakref.ref[LocationTracker]", stop: threading.Event,
+                        interval: float) -> None:
+    # Holds the tracker only weakly, so the thread ends once the tracker is collected
+    while not stop.wait(interval):
+        tracker = tracker_ref()
+        if tracker is None:
+            return
+        try:
+            tracker.flush()
+        except Exception:
+            _logger.exception(
+                "Writing courier positions failed; retrying at the next flush")
+        del tracker
+
+
+class LocationTracker:
+    """
+    In-memory courier positions with batched persistence.
+
+    on_position(courier_id, (lat, lon)) is called for every accepted ping
+    and for newer positions found by sync(), with the tracker's lock held, so
+    the calls for one courier arrive in the order of its pings.
+    """
+
+    def __init__(self, repository: Repository, on_position: Optional[Callable[[Any, Point], None]] = None,
+                 flush_interval: Optional[float] = None, clock: Callable[[], float] = time.time,
+                 max_clock_skew: Optional[float] = None) -> None:
+        self.repository = repository
+        self.flush_interval = config.LOCATION_FLUSH_SECONDS if flush_interval is None else flush_interval
+        self.max_clock_skew = config.LOCATION_MAX_CLOCK_SKEW if max_clock_skew is None else max_clock_skew
+        self._on_position = on_position
+        self._clock = clock
+        # courier_id -> (lat, lon, timestamp): every known position, and those not written yet
+        self._positions: Dict[Any, Tuple[float, float, float]] = {}
+        self._unsaved: Dict[Any, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        weakref.finalize(self, self._stop.set)
+
+    def position(self, courier_id: Any) -> Optional[Point]:
+        """The last reported (lat, lon) of a courier, or None."""
+        entry = self._positions.get(courier_id)
+        return (entry[0], entry[1]) if entry is not None else None
+
+    def last_seen(self, courier_id: Any) -> Optional[float]:
+        """When the courier's last known position was taken (Unix seconds), or None."""
+        entry = self._positions.get(courier_id)
+        return entry[2] if entry is not None else None
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def record(self, courier_id: Any, lat: Any, lon: Any, timestamp: Optional[float] = None) -> bool:
+        """Record one ping. Returns False if it is older than the courier's known position."""
+        return self.record_many([Ping(courier_id, lat, lon, timestamp)]) == 1
+
+    def record_many(self, pings: Iterable[Tuple]) -> int:
+        """
+        Record (courier_id, lat, lon[, timestamp]) pings and return how many were
+        accepted. Raises ValueError, recording nothing, if any ping is invalid.
+        """
+        now = self._clock()
+        latest = now + self.max_clock_skew
+        entries = []
+        for ping in pings:
+            ping = Ping(*ping)
+            lat, lon = parse_point(ping.lat, ping.lon)
+            try:
+                timestamp = now if ping.timestamp is None else float(
+                    ping.timestamp)
+            except (TypeError, ValueError):
+                raise ValueError(
+                    f"Invalid timestamp: {ping.timestamp!r}") from None
+            if not math.isfinite(timestamp):
+                raise ValueError(f"Invalid timestamp: {ping.timestamp!r}")
+            if timestamp > latest:
+                PINGS.inc(("future",))
+                timestamp = now
+            entries.append((ping.courier_id, (lat, lon, timestamp)))
+
+        accepted = 0
+        with self._lock:
+            for courier_id, entry in entries:
+                known = self._positions.get(courier_id)
+                if known is not None and known[2] > entry[2]:
+                    continue
+                self._positions[courier_id] = self._unsaved[courier_id] = entry
+                accepted += 1
+                if self._on_position is not None:
+                    self._on_position(courier_id, (entry[0], entry[1]))
+        PINGS.inc(("accepted",), accepted)
+        PINGS.inc(("stale",), len(entries) - accepted)
+        if accepted:
+            if self.flush_interval <= 0:
+                self.flush()
+            else:
+                self._start_flusher()
+        return accepted
+
+    def _start_flusher(self) -> None:
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None and not self._stop.is_set():
+                self._flusher = threading.Thread(
+                    target=_flush_periodically, args=(
+                        weakref.ref(self), self._stop, self.flush_interval),
+                    name="courier-location-flush", daemon=True)
+                self._flusher.start()
+
+    def flush(self) -> int:
+        """
+        Write the positions received since the last flush to the store in one
+        batch, keeping a newer position another process stored. Returns how
+        many positions were written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                unsaved, self._unsaved = self._unsaved, {}
+            if not unsaved:
+                return 0
+            updates, inserts = [], []
+            try:
+                with self.repository.batch():
+                    for courier_id, (lat, lon, timestamp) in unsaved.items():
+                        stored = self.repository.get(courier_id)
+                        if stored is not None and stored.get("timestamp", 0) > timestamp:
+                            continue
+                        record = {"courier_id": courier_id, "lat": lat,
+                                  "lon": lon, "timestamp": timestamp}
+                        (inserts if stored is None else updates).append(record)
+                    for record in updates:
+                        self.repository.update(record["courier_id"], record)
+                    if inserts:
+                        # One rewrite instead of one insert per new courier, each of
+                        # which copies the whole store on the json backend
+                        self.repository.replace_all(
+                            self.repository.all() + inserts)
+            except BaseException:
+                with self._lock:
+                    # Positions received meanwhile are newer; keep those
+                    for courier_id, entry in unsaved.items():
+                        self._unsaved.setdefault(courier_id, entry)
+                raise
+            return len(updates) + len(inserts)
+
+    def sync(self) -> None:
+        """Take in the positions other processes stored since the last call."""
+        version = self.repository.data_version()
+        if version == self._version:
+            return
+        records = self.repository.all()
+        with self._lock:
+            self._version = version
+            for record in records:
+                courier_id = record.get("courier_id")
+                entry = (record["lat"], record["lon"], record["timestamp"])
+                known = self._positions.get(courier_id)
+                if known is not None and known[2] >= entry[2]:
+                    continue
+                self._positions[courier_id] = entry
+                if self._on_position is not None:
+                    self._on_position(courier_id, (entry[0], entry[1]))
+
+    def close(self) -> None:
+        """Stop the background flushes and write what is left."""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
@@ -1,4 +1,7 @@
 class Customer:
+    __slots__ = ("name", "customer_id", "address",
+                 "phone_number", "email", "password", "credit")
+
     def __init__(self, name, customer_id, phone_number, email, password, credit):
 
         self.name = name
@@ -0,0 +1,350 @@
+"""
+Discrete-event simulation of a courier fleet driven through DispatchSystem.
+
+Orders arrive at random (a Poisson process) at destinations spread over a
+city. Each order is created and dispatched through DispatchSystem the way the
+web app does it (CREATED, then CONFIRMED when a courier is assigned). The
+assigned courier works through its orders one at a time. For each one it
+marks the order ON_DELIVERY, rides from its current location to the
+destination at a fixed speed, and marks the order DELIVERED on arrival. The
+destination then becomes the courier's current location. Simulated time
+jumps from event to event, so a day of deliveries runs in seconds to minutes.
+
+The report shows:
+- throughput
+- the wall-clock time of every dispatch call (the assignment latency)
+- the simulated wait from order to pickup and to delivery
+- the number of storage operations per store
+
+The slowdown against real time shows at which order rate the stores and the
+assignment code stop keeping up.
+
+Run from the repository root:
+    python delivery_simulator.py [--minutes 120] [--orders-per-minute 1 5 20] [--couriers 50]
+"""
+import argparse
+import heapq
+import logging
+import math
+import random
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import config
+import storage
+from benchmarks.common import fresh_data_dir, percentile
+from courier import Courier
+from dispatch_system import DispatchSystem
+from order import Order, PackageStatus
+
+_logger = logging.getLogger(__name__)
+
+# Repository calls counted per store; only the outermost call of nested ones is counted
+STORAGE_OPERATIONS = ("get", "all", "find_by", "query", "scan",
+                      "insert", "update", "delete", "replace_all", "batch")
+
+
+@dataclass
+class SimulationConfig:
+    """Parameters of one simulation run. Times are in simulated minutes."""
+    minutes: float = 120
+    orders_per_minute: float = 5
+    couriers: int = 50
+    destinations: int = 500
+    speed_kmh: float = 20
+    handover_minutes: float = 3
+    # Area the destinations and courier homes are spread over (greater Tel Aviv)
+    lat_range: Tuple[float, float] = (32.02, 32.15)
+    lon_range: Tuple[float, float] = (34.76, 34.86)
+    # Assign each order when it arrives (None), or batch-assign every this many minutes
+    batch_minutes: Optional[float] = None
+    # Open orders a courier may hold (0 for no limit); None keeps config.COURIER_CAPACITY
+    courier_capacity: Optional[int] = None
+    backend: str = "json"
+    journal: bool = True
+    seed: int = 0
+
+
+@dataclass
+class SimulationReport:
+    config: SimulationConfig
+    wall_seconds: float = 0.0
+    orders_created: int = 0
+    orders_assigned: int = 0
+    orders_delivered: int = 0
+    # Wall-clock milliseconds spent in each dispatch call
+    dispatch_ms: List[float] = field(default_factory=list)
+    # Simulated minutes from order creation to pickup / to delivery
+    pickup_wait: List[float] = field(default_factory=list)
+    delivery_time: List[float] = field(default_factory=list)
+    # (store, operation) -> number of calls, and store -> wall seconds spent in it
+    storage_calls: Counter = field(default_factory=Counter)
+    storage_seconds: Counter = field(default_factory=Counter)
+
+    @property
+    def realtime_factor(self) -> float:
+        """Simulated time per wall-clock time; below 1 the system is slower than real time."""
+        return self.config.minutes * 60 / self.wall_seconds if self.wall_seconds else float('inf')
+
+    def summary(self) -> Dict[str, Any]:
+        hours = self.config.minutes / 60
+        return {
+            "orders_per_minute": self.config.orders_per_minute,
+            "couriers": self.config.couriers,
+            "orders": self.orders_created,
+            "assigned": self.orders_assigned,
+            "delivered": self.orders_delivered,
+            "delivered_per_hour": self.orders_delivered / hours if hours else 0.0,
+            "wall_s": self.wall_seconds,
+            "realtime_factor": self.realtime_factor,
+            "dispatch_p50_ms": percentile(self.dispatch_ms, 50),
+            "dispatch_p95_ms": percentile(self.dispatch_ms, 95),
+            "dispatch_max_ms": max(self.dispatch_ms, default=0.0),
+            "pickup_wait_p95_min": percentile(self.pickup_wait, 95),
+            "delivery_p50_min": percentile(self.delivery_time, 50),
+            "storage_calls": sum(self.storage_calls.values()),
+            "storage_s": sum(self.storage_seconds.values()),
+        }
+
+
+def distance_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Great-circle distance between two (latitude, longitude) points."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * \
+        math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+class StorageCounter:
+    """Counts and times the repository calls made on a set of stores."""
+
+    def __init__(self, report: SimulationReport) -> None:
+        self.report = report
+        self._depth = threading.local()
+
+    def instrument(self, name: str, repository: storage.Repository) -> None:
+        """Wrap the repository's public operations (on this instance only)."""
+        for operation in STORAGE_OPERATIONS:
+            setattr(repository, operation, self._wrap(
+                name, operation, getattr(repository, operation)))
+
+    def _wrap(self, name: str, operation: str, method: Callable) -> Callable:
+        def counted(*args, **kwargs):
+            depth = getattr(self._depth, "value", 0)
+            if depth:
+                return method(*args, **kwargs)
+            self._depth.value = 1
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._depth.value = 0
+                self.report.storage_calls[(name, operation)] += 1
+                self.report.storage_seconds[name] += time.perf_counter() - \
+                    start
+        return counted
+
+
+@dataclass
+class _CourierState:
+    location: int
+    queue: Deque[int] = field(default_factory=deque)
+    busy: bool = False
+
+
+class DeliverySimulator:
+    """
+    Runs one simulation against a DispatchSystem whose stores are empty.
+    Use simulate() to run in a fresh temporary data directory.
+    """
+
+    def __init__(self, system: DispatchSystem, sim_config: SimulationConfig) -> None:
+        self.system = system
+        self.config = sim_config
+        self.report = SimulationReport(sim_config)
+        self.rng = random.Random(sim_config.seed)
+        self.now = 0.0
+        self._events: List[Tuple[float, int, Callable, tuple]] = []
+        self._sequence = 0
+        self._couriers: Dict[int, _CourierState] = {}
+        self._coordinates: Dict[int, Tuple[float, float]] = {}
+        self._destinations: List[int] = []
+        self._created_at: Dict[int, float] = {}
+        # Orders that found no courier, retried when a courier becomes free
+        self._waiting: Deque[int] = deque()
+
+    def schedule(self, delay: float, handler: Callable, *args) -> None:
+        self._sequence += 1
+        heapq.heappush(self._events, (self.now + delay,
+                       self._sequence, handler, args))
+
+    # ---------- setup ----------
+
+    def _random_point(self) -> Tuple[float, float]:
+        return (self.rng.uniform(*self.config.lat_range), self.rng.uniform(*self.config.lon_range))
+
+    def _add_address(self, number: int) -> int:
+        point = self._random_point()
+        address = self.system.add_address({
+            "street": f"Simulated street {number % 500}", "house_number": number % 200 + 1,
+            "city": "Tel Aviv", "postal_code": f"{6100000 + number}", "country": "Israel",
+            "coordinates": point})
+        self._coordinates[address.id] = point
+        return address.id
+
+    def setup(self) -> None:
+        """Create the destinations and the couriers, each at a home address."""
+        with self.system.unit_of_work():
+            self._destinations = [self._add_address(
+                n) for n in range(self.config.destinations)]
+            for courier_id in range(1, self.config.couriers + 1):
+                home = self._add_address(self.config.destinations + courier_id)
+                self.system.add_courier({"name": f"courier-{courier_id}", "courier_id": courier_id,
+                                         "address_id": home, "current_location": home, "password": "sim"})
+                self._couriers[courier_id] = _CourierState(home)
+
+    # ---------- events ----------
+
+    def _next_arrival(self) -> None:
+        if self.config.orders_per_minute > 0:
+            self.schedule(self.rng.expovariate(
+                self.config.orders_per_minute), self._order_arrives)
+
+    def _order_arrives(self) -> None:
+        self._next_arrival()
+        order = self.system.add_order({
+            "customer_id": f"sim-{self.rng.randrange(10_000)}", "courier_id": None, "origin_id": None,
+            "destination_id": self.rng.choice(self._destinations), "status": PackageStatus.CREATED})
+        package_id = order._package_id
+        self._created_at[package_id] = self.now
+        self.report.orders_created += 1
+        if self.config.batch_minutes is None:
+            self._dispatch(package_id)
+
+    def _dispatch(self, package_id: int) -> bool:
+        start = time.perf_counter()
+        assigned = self.system.dispatch_order(package_id)
+        self.report.dispatch_ms.append((time.perf_counter() - start) * 1000)
+        if not assigned:
+            self._waiting.append(package_id)
+            return False
+        self._assigned(package_id, Order.store().get(package_id)["courier_id"])
+        return True
+
+    def _batch_assign(self) -> None:
+        start = time.perf_counter()
+        assigned = self.system.assign_pending_orders()
+        self.report.dispatch_ms.append((time.perf_counter() - start) * 1000)
+        for package_id, courier_id in assigned.items():
+            self._assigned(package_id, courier_id)
+        self.schedule(self.config.batch_minutes, self._batch_assign)
+
+    def _assigned(self, package_id: int, courier_id: int) -> None:
+        self.report.orders_assigned += 1
+        courier = self._couriers[courier_id]
+        courier.queue.append(package_id)
+        if not courier.busy:
+            self._start_next(courier_id)
+
+    def _start_next(self, courier_id: int) -> None:
+        courier = self._couriers[courier_id]
+        if not courier.queue:
+            courier.busy = False
+            return
+        courier.busy = True
+        package_id = courier.queue.popleft()
+        self.system.update_order_status(package_id, PackageStatus.ON_DELIVERY)
+        self.report.pickup_wait.append(self.now - self._created_at[package_id])
+        destination = Order.store().get(package_id)["destination_id"]
+        ride_minutes = distance_km(self._coordinates[courier.location], self._coordinates[destination]) \
+            / self.config.speed_kmh * 60
+        self.schedule(ride_minutes + self.config.handover_minutes, self._delivered,
+                      package_id, courier_id, destination)
+
+    def _delivered(self, package_id: int, courier_id: int, destination: int) -> None:
+        self.system.update_order_status(package_id, PackageStatus.DELIVERED)
+        Courier.update_courier(courier_id, {"current_location": destination})
+        self._couriers[courier_id].location = destination
+        self.report.orders_delivered += 1
+        self.report.delivery_time.append(
+            self.now - self._created_at.pop(package_id))
+        # A courier is free again: give orders that found nobody another chance
+        if self._waiting and self.config.batch_minutes is None:
+            self._dispatch(self._waiting.popleft())
+        self._start_next(courier_id)
+
+    # ---------- running ----------
+
+    def run(self) -> SimulationReport:
+        """Simulate config.minutes of operation and return the report."""
+        self._next_arrival()
+        if self.config.batch_minutes is not None:
+            self.schedule(self.config.batch_minutes, self._batch_assign)
+        start = time.perf_counter()
+        while self._events and self._events[0][0] <= self.config.minutes:
+            self.now, _, handler, args = heapq.heappop(self._events)
+            handler(*args)
+        self.report.wall_seconds = time.perf_counter() - start
+        return self.report
+
+
+def simulate(sim_config: SimulationConfig) -> SimulationReport:
+    """Run one simulation in a fresh temporary data directory and return its report."""
+    with fresh_data_dir("delivery-sim-", sim_config.backend, sim_config.journal):
+        return _run(sim_config)
+
+
+def _run(sim_config: SimulationConfig) -> SimulationReport:
+    system = DispatchSystem(
+        "managers.json", "addresses.json", deferred_geocoding=False)
+    if sim_config.courier_capacity is not None:
+        system.availability.capacity = sim_config.courier_capacity
+    simulator = DeliverySimulator(system, sim_config)
+    simulator.setup()
+    counter = StorageCounter(simulator.report)
+    counter.instrument("orders", Order.store())
+    counter.instrument("couriers", Courier._repository())
+    counter.instrument("addresses", system.address_repo._records)
+    return simulator.run()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--minutes", type=float, default=120,
+                        help="simulated minutes per run")
+    parser.add_argument("--orders-per-minute", type=float, nargs="+", default=[1, 5, 20],
+                        help="order arrival rates to simulate, one run each")
+    parser.add_argument("--couriers", type=int, default=50)
+    parser.add_argument("--destinations", type=int, default=500)
+    parser.add_argument("--speed-kmh", type=float, default=20)
+    parser.add_argument("--batch-minutes", type=float, default=None,
+                        help="batch-assign pending orders every this many minutes instead of one by one")
+    parser.add_argument("--capacity", type=int, default=None,
+                        help="open orders a courier may hold, 0 for no limit (default: DISPATCH_COURIER_CAPACITY)")
+    parser.add_argument(
+        "--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--no-journal", dest="journal", action="store_false",
+                        help="rewrite orders.json on every change instead of using the order journal (json backend)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print(f"{'orders/min':>10} {'orders':>7} {'delivered':>9} {'deliv/h':>8} {'wall s':>8} {'x realtime':>10} "
+          f"{'disp p50':>9} {'disp p95':>9} {'wait p95':>9} {'store ops':>10} {'store s':>8}")
+    for rate in args.orders_per_minute:
+        report = simulate(SimulationConfig(
+            minutes=args.minutes, orders_per_minute=rate, couriers=args.couriers,
+            destinations=args.destinations, speed_kmh=args.speed_kmh, batch_minutes=args.batch_minutes,
+            courier_capacity=args.capacity, backend=args.backend, journal=args.journal, seed=args.seed))
+        s = report.summary()
+        print(f"{rate:>10g} {s['orders']:>7} {s['delivered']:>9} {s['delivered_per_hour']:>8.0f} "
+              f"{s['wall_s']:>8.2f} {s['realtime_factor']:>10.0f} {s['dispatch_p50_ms']:>8.2f}ms "
+              f"{s['dispatch_p95_ms']:>7.2f}ms {s['pickup_wait_p95_min']:>6.0f}min "
+              f"{s['storage_calls']:>10} {s['storage_s']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
-import json
 import logging
+import threading
 from re import M
-from typing import List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import config
+import metrics
+import storage
+import tracing
 from courier import Courier
 from manager import Manager
 from customer import Customer
@@ -9,46 +13,103 @@ from customerList import add_customer, get_customer_by_id, update_customer, dele
 from address_repository import AddressRepository
 from pathlib import Path
 from address import Address
+from geocoding import GeocodingQueue
+from spatial_index import GridSpatialIndex
+import assignment
+from courier_availability import CourierAvailability, CourierState
+from courier_locations import LocationTracker
+import order_analytics
+from order_analytics import OrderAnalytics
 from order import Order
 from order import PackageStatus
 
 
 _logger = logging.getLogger(__name__)
 
+CALL_SECONDS = metrics.histogram(
+    "dispatch_call_seconds", "Duration of DispatchSystem method calls", ("method",))
 
+
+@metrics.instrument_methods(CALL_SECONDS)
 class DispatchSystem:
     """
     A class to manage the dispatch system, including couriers and their operations.
     """
 
-    def __init__(self, managers_file: str, address_file: str):
+    def __init__(self, managers_file: str, address_file: str, deferred_geocoding: Optional[bool] = None,
+                 storage_backend: Optional[str] = None):
+        # storage_backend ("json" or "sqlite") overrides config.STORAGE_BACKEND for the whole process
+        if storage_backend is not None:
+            storage.set_backend(storage_backend)
         self.managers_file: Path = Path("data") / managers_file
         address_path: Path = Path("data") / address_file
+        self.managers = storage.repository("managers", self.managers_file)
 
-        if not self.managers_file.exists():
+        if config.STORAGE_BACKEND == "json" and not self.managers_file.exists():
             self._save_all_managers([])
 
         self.address_repo = AddressRepository(address_path)
 
+        # Spatial index of courier positions, built on first use and kept up
+        # to date through Courier change notifications; rebuilt when another
+        # worker process changes the stored couriers. The stores are never read
+        # while _courier_index_lock is held: a thread committing changes holds
+        # their locks and may then need this one.
+        self.courier_index = GridSpatialIndex(config.COURIER_INDEX_CELL_SIZE)
+        self._courier_locations: Dict[int, int] = {}
+        self._couriers_at: Dict[int, Set[int]] = {}
+        self._courier_index_built = False
+        self._courier_version: Optional[int] = None
+        # Counts the courier changes applied to the index, so a rebuild notices those made while it read
+        self._courier_changes = 0
+        self._courier_index_lock = threading.RLock()
+        Courier.add_listener(self._on_courier_changed)
+
+        # Open orders and shifts of the couriers, kept from the order store's change
+        # notifications; assignment only considers couriers with a free slot.
+        # Choosing a courier and recording the assignment happen under _assignment_lock,
+        # taken inside an order store batch so that nothing else waits on one while holding the other.
+        self.availability = CourierAvailability(Order.store())
+        self._assignment_lock = threading.Lock()
+
+        # Latest GPS positions reported by the couriers; they place a courier in
+        # the spatial index instead of the coordinates of its current_location address
+        self.locations = LocationTracker(
+            storage.repository("courier_positions", Path(
+                "data") / "courier_positions.json"),
+            self._on_courier_position)
+
+        # NumPy column table of the orders for dashboard aggregates, built on first use
+        self._order_analytics: Optional[OrderAnalytics] = None
+        self._analytics_lock = threading.Lock()
+
+        # Deferred geocoding: new addresses are stored as "pending coordinates"
+        # and resolved by a background worker pool.
+        self.deferred_geocoding: bool = (config.GEOCODING_DEFERRED
+                                         if deferred_geocoding is None else deferred_geocoding)
+        self._coordinate_waiters: Dict[int,
+                                       List[Callable[[Optional[Address]], None]]] = {}
+        self._waiters_lock = threading.Lock()
+        self.geocoding_queue: Optional[GeocodingQueue] = None
+        if self.deferred_geocoding:
+            self.geocoding_queue = GeocodingQueue(
+                workers=config.GEOCODING_WORKERS)
+            for address in self.address_repo.get_all():
+                if address.coordinates_pending:
+                    self._enqueue_geocoding(address)
+
     def _load_all_managers(self) -> List[dict]:
-        try:
-            with open(self.managers_file, "r") as file:
-                return json.load(file)
-        except FileNotFoundError:
-            _logger.warning("Managers file not found.")
-            return []
+        return self.managers.all()
 
     def _save_all_managers(self, managers: List[dict]) -> None:
-        with open(self.managers_file, "w") as file:
-            json.dump(managers, file, indent=4)
+        self.managers.replace_all(managers)
 
     def add_manager(self, manager_dict: dict) -> bool:
         """
         Adds a new manager to the system.
         Returns True if added successfully, False if manager already exists.
         """
-        managers = self._load_all_managers()
-        if any(m["manager_id"] == manager_dict["manager_id"] for m in managers):
+        if manager_dict["manager_id"] in self.managers:
             _logger.warning(
                 f"Manager ID {manager_dict['manager_id']} already exists.")
             return False
@@ -61,19 +122,34 @@ class DispatchSystem:
             manager_dict["email"],
             manager_dict["password"]
         )
-        managers.append(manager.to_dict())
-        self._save_all_managers(managers)
+        self.managers.insert(manager.to_dict())
         _logger.info(f"Manager {manager.name} added successfully.")
         return True
 
     def get_manager_by_id(self, manager_id: str) -> Optional[Manager]:
-        managers = self._load_all_managers()
-        for m in managers:
-            if m["manager_id"] == manager_id:
-                return Manager.from_dict(m)
+        m = self.managers.get(manager_id)
+        if m is not None:
+            return Manager.from_dict(m)
         _logger.info(f"Manager ID {manager_id} not found.")
         return None
 
+    def get_user_record(self, user_type: str, user_id: str) -> Optional[dict]:
+        """
+        Returns the stored record of a manager, customer or courier, or None.
+        The lookup goes straight to the repository's key index, without building
+        the model object, so a login attempt never reads the whole user list.
+        """
+        if user_type == 'managers':
+            return self.managers.get(user_id)
+        if user_type == 'customers':
+            return get_customer_by_id(user_id)
+        if user_type == 'couriers':
+            try:
+                return Courier._repository().get(int(user_id))
+            except ValueError:
+                return None
+        return None
+
     def list_all_managers(self) -> List[Manager]:
         return [Manager.from_dict(m) for m in self._load_all_managers()]
 
@@ -90,11 +166,10 @@ class DispatchSystem:
             courier_dict["current_location"],
             courier_dict["password"]
         )
-        if Courier.courier_exists(courier.courier_id):
+        if not Courier.create_courier(courier):
             _logger.error(
                 f"Courier with ID {courier.courier_id} already exists")
             return False
-        Courier.create_courier(courier)
         _logger.info(f"Courier {courier.name} added successfully.")
         return True
 
@@ -103,8 +178,7 @@ class DispatchSystem:
         Deletes a courier by their ID.
         Returns True if deleted successfully, False if courier does not exist.
         """
-        if Courier.courier_exists(courier_id):
-            Courier.delete_courier(courier_id)
+        if Courier.delete_courier(courier_id):
             _logger.info(f"Courier with ID {courier_id} deleted successfully.")
             return True
         _logger.warning(f"Courier with ID {courier_id} not found.")
@@ -120,23 +194,96 @@ class DispatchSystem:
         _logger.info(f"Courier with ID {courier_id} not found.")
         return None
 
+    def set_courier_on_shift(self, courier_id: int, on_shift: bool) -> bool:
+        """
+        Starts or ends a courier's shift; couriers off shift are not assigned new orders.
+        Returns False if the courier does not exist.
+        """
+        return Courier.update_courier(courier_id, {"on_shift": on_shift})
+
+    def courier_state(self, courier_id: int) -> CourierState:
+        """Returns whether the courier is idle, on delivery (holds open orders) or off shift."""
+        self._ensure_courier_index()
+        return self.availability.state(courier_id)
+
+    @tracing.traced("add_address")
     def add_address(self, address_data: dict) -> Address:
         """
         Creates and stores a new Address from dictionary data.
-        Returns the new address ID.
+        In deferred geocoding mode the address is stored right away and its
+        coordinates are fetched in the background.
+        Returns the new Address.
         """
-        new_address = Address(**address_data)
+        if not self.deferred_geocoding:
+            new_address = Address(**address_data)
+            self.address_repo.add(new_address)
+            return new_address
+
+        new_address = Address(**address_data, defer_geocoding=True)
         self.address_repo.add(new_address)
+        if new_address.coordinates_pending:
+            self._enqueue_geocoding(new_address)
         return new_address
 
+    def _enqueue_geocoding(self, address: Address) -> None:
+        address_id = address.id
+        self.geocoding_queue.submit(
+            address.query_string(),
+            lambda coordinates: self._on_coordinates(address_id, coordinates))
+
+    def _on_coordinates(self, address_id: int, coordinates) -> None:
+        """Store geocoding results and run everything that was waiting for them."""
+        self.address_repo.update_by_id(
+            address_id, {"coordinates": coordinates, "coordinates_pending": False,
+                         "geocode_failed": coordinates is None})
+        self._reindex_couriers_at(address_id)
+        if coordinates is None:
+            _logger.warning(f"Address {address_id} could not be geocoded.")
+        with self._waiters_lock:
+            waiters = self._coordinate_waiters.pop(address_id, [])
+        address = self.get_address_by_id(address_id)
+        for callback in waiters:
+            try:
+                callback(address)
+            except Exception:
+                _logger.exception(
+                    f"Callback waiting on address {address_id} failed.")
+
+    def is_address_pending(self, address_id: int) -> bool:
+        """Returns True if the address is still waiting for its coordinates."""
+        address = self.get_address_by_id(address_id)
+        return bool(address and address.coordinates_pending)
+
+    def when_coordinates_ready(self, address_id: int, callback: Callable[[Optional[Address]], None]) -> bool:
+        """
+        Calls callback(address) once the address has coordinates (or failed to get them).
+        Returns True if the call was deferred, False if it ran immediately.
+        """
+        with self._waiters_lock:
+            if self.is_address_pending(address_id):
+                self._coordinate_waiters.setdefault(
+                    address_id, []).append(callback)
+                return True
+        callback(self.get_address_by_id(address_id))
+        return False
+
     def get_address_by_id(self, address_id: int):
         return self.address_repo.get_by_id(address_id)
 
     def delete_address_by_id(self, address_id: int) -> bool:
-        return self.address_repo.delete_by_id(address_id)
+        deleted = self.address_repo.delete_by_id(address_id)
+        if deleted:
+            self._reindex_couriers_at(address_id)
+        return deleted
 
     def update_address_by_id(self, address_id: int, new_data: dict) -> bool:
-        return self.address_repo.update_by_id(address_id, new_data)
+        updated = self.address_repo.update_by_id(address_id, new_data)
+        if updated and "coordinates" in new_data:
+            self._reindex_couriers_at(address_id)
+            if self._order_analytics is not None:
+                self._order_analytics.set_destination_coordinates(
+                    address_id, new_data["coordinates"])
+        return updated
 
     def list_all_addresses(self):
         return self.address_repo.get_all()
@@ -152,51 +299,86 @@ class DispatchSystem:
 
     @staticmethod
     def view_orders() -> List[Order]:
-        try:
-            with open("data/orders.json", "r") as file:
-                orders = json.load(file)
-            orders_list = []
-            for order in orders:
-                orders_list.append(Order(order.get("customer_id"), order.get("courier_id"), order.get("origin_id"),
-                                         order.get('destination_id'), order.get("package_id"), order.get("status"), auto_save=False))
-            return orders_list
-        except FileNotFoundError:
-            print("Orders file not found")
-            return []
+        return [Order.from_dict(order) for order in Order.store().all()]
+
+    def order_analytics(self) -> Optional[OrderAnalytics]:
+        """
+        Returns the columnar order table used for dashboard aggregates (status
+        counts, orders per courier, open orders per area), or None if numpy is
+        not installed. The table is built on first use and kept current from
+        the order store's change notifications.
+        """
+        if order_analytics.np is None:
+            return None
+        with self._analytics_lock:
+            if self._order_analytics is None:
+                self._order_analytics = OrderAnalytics(
+                    Order.store(), self._destination_coordinates)
+            return self._order_analytics
+
+    def _destination_coordinates(self, address_id: int):
+        address = self.address_repo.get_by_id(address_id)
+        return address.coordinates if address is not None and not address.coordinates_pending else None
+
+    @staticmethod
+    def query_orders(status: Optional[str] = None, customer_id=None, courier_id=None,
+                     created_from: Optional[str] = None, created_to: Optional[str] = None,
+                     sort_by: Optional[str] = None, descending: bool = False,
+                     page: int = 1, per_page: int = 20) -> Tuple[List[Order], int]:
+        """
+        Returns one page of orders matching the given filters, and the total number of matches.
+        created_from / created_to are inclusive ISO dates or timestamps; a plain
+        date in created_to covers that whole day.
+        Filtering, sorting and paging are done by the order store, so only the
+        orders on the requested page are turned into Order objects.
+        """
+        where = {field: value for field, value in (("status", status),
+                                                   ("customer_id", customer_id),
+                                                   ("courier_id", courier_id))
+                 if value is not None}
+        ranges = {}
+        if created_from or created_to:
+            if created_to and len(created_to) == 10:
+                created_to += "T23:59:59"
+            ranges["created_at"] = (created_from or None, created_to or None)
+        page = max(page, 1)
+        records, total = Order.store().query(where, ranges, sort_by, descending,
+                                             offset=(page - 1) * per_page, limit=per_page)
+        return [Order.from_dict(record) for record in records], total
+
+    def scan_records(self, entity: str, where: Optional[Dict[str, Any]] = None, after=None,
+                     limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the stored records of "orders", "couriers" or "addresses" in key order,
+        starting after the key `after` (the cursor of the previous page).
+        Records are read from storage in small chunks, so exporting a whole
+        collection never loads all of it at once.
+        """
+        if entity == "orders":
+            return Order.store().scan(where, after, limit)
+        if entity == "couriers":
+            return Courier.scan_records(where, after, limit)
+        if entity == "addresses":
+            if where:
+                raise ValueError("Addresses cannot be filtered")
+            return self.address_repo.scan_records(after, limit)
+        raise ValueError(f"Unknown entity: {entity}")
 
     @staticmethod
     def find_order_by_package_id(package_id) -> Optional[Order]:
-        try:
-            with open("data/orders.json", "r") as file:
-                orders = json.load(file)
-            for order in orders:
-                if order.get("package_id") == package_id:
-                    this_order = Order(order.get("customer_id"), order.get("courier_id"), order.get("origin_id"),
-                                       order.get('destination_id'), order.get("package_id"), order.get("status"), auto_save=False)
-                    return this_order
+        order = Order.store().get(package_id)
+        if order is None:
             print(f"Order {package_id} not found")
             return None
-        except FileNotFoundError:
-            print("Orders file not found")
-            return None
+        return Order.from_dict(order)
 
     @staticmethod
     def delete_order(package_id) -> bool:
-        try:
-            with open("data/orders.json", "r") as file:
-                orders = json.load(file)
-            new_orders = [order for order in orders if order.get(
-                "package_id") != package_id]
-            if len(new_orders) == len(orders):
-                print(f"Order {package_id} not found")
-                return False
-            with open("data/orders.json", "w") as file:
-                json.dump(new_orders, file, indent=4)
-            print(f"Order {package_id} deleted successfully")
-            return True
-        except FileNotFoundError:
-            print("Orders file not found")
+        if not Order.delete_by_package_id(package_id):
+            print(f"Order {package_id} not found")
             return False
+        print(f"Order {package_id} deleted successfully")
+        return True
 
     def save_customer(self, customer_dict):
         existing = get_customer_by_id(customer_dict["customer_id"])
@@ -252,11 +434,145 @@ class DispatchSystem:
         delete_customer(customer_id)
         return True
 
+    def _courier_point(self, courier_id: int, location_id: Optional[int]) -> Optional[Tuple[float, float]]:
+        """
+        Where a courier belongs in the spatial index: its last reported GPS
+        position, or else the coordinates of its current location.
+        """
+        if location_id is None:
+            return None
+        position = self.locations.position(courier_id)
+        if position is not None:
+            return position
+        address = self.get_address_by_id(location_id)
+        return address.coordinates if address and address.coordinates else None
+
+    def _index_courier(self, courier_id: int, location_id: Optional[int],
+                       point: Optional[Tuple[float, float]]) -> None:
+        """Place a courier in the spatial index; the caller holds _courier_index_lock."""
+        old_location = self._courier_locations.pop(courier_id, None)
+        if old_location is not None:
+            self._couriers_at.get(old_location, set()).discard(courier_id)
+        self.courier_index.remove(courier_id)
+        if location_id is None:
+            return
+        self._courier_locations[courier_id] = location_id
+        self._couriers_at.setdefault(location_id, set()).add(courier_id)
+        if point is not None:
+            self.courier_index.insert(courier_id, point)
+
+    def _ensure_courier_index(self) -> None:
+        self.locations.sync()
+        while True:
+            version = Courier.data_version()
+            with self._courier_index_lock:
+                if self._courier_index_built and version == self._courier_version:
+                    return
+                changes = self._courier_changes
+            couriers = [(courier, self._courier_point(courier.courier_id, courier.current_location))
+                        for courier in Courier.read_couriers()]
+            with self._courier_index_lock:
+                if self._courier_changes != changes:
+                    continue  # a courier changed while the stores were read; read them again
+                self.courier_index.clear()
+                self._courier_locations.clear()
+                self._couriers_at.clear()
+                for courier, point in couriers:
+                    self._index_courier(courier.courier_id,
+                                        courier.current_location, point)
+                self.availability.set_off_shift(
+                    [courier.courier_id for courier, _ in couriers if not courier.on_shift])
+                self._courier_version = version
+                self._courier_index_built = True
+                return
+
+    def _on_courier_changed(self, courier_id: int, courier: Optional[Courier]) -> None:
+        if not self._courier_index_built:
+            return
+        location_id = courier.current_location if courier else None
+        point = self._courier_point(courier_id, location_id)
+        with self._courier_index_lock:
+            self._courier_changes += 1
+            self._index_courier(courier_id, location_id, point)
+            self.availability.set_on_shift(
+                courier_id, courier.on_shift if courier else True)
+
+    def _on_courier_position(self, courier_id: int, position: Tuple[float, float]) -> None:
+        with self._courier_index_lock:
+            if courier_id in self._courier_locations:
+                self._courier_changes += 1
+                self.courier_index.insert(courier_id, position)
+
+    def record_locations(self, pings: Iterable[tuple]) -> int:
+        """
+        Records (courier_id, lat, lon[, timestamp]) GPS pings of registered couriers.
+        Each accepted ping moves the courier in the spatial index at once; the
+        positions are written to storage in periodic batches.
+        Returns the number of pings accepted; pings of unknown couriers and
+        pings older than the courier's last position are ignored.
+        Raises ValueError, recording nothing, if a ping has invalid coordinates.
+        """
+        self._ensure_courier_index()
+        with self._courier_index_lock:
+            known = [ping for ping in pings if ping[0]
+                     in self._courier_locations]
+        return self.locations.record_many(known)
+
+    def _reindex_couriers_at(self, address_id: int) -> None:
+        """Re-position the couriers located at an address whose coordinates changed."""
+        with self._courier_index_lock:
+            courier_ids = list(self._couriers_at.get(address_id, ()))
+        points = {courier_id: self._courier_point(
+            courier_id, address_id) for courier_id in courier_ids}
+        with self._courier_index_lock:
+            self._courier_changes += 1
+            for courier_id, point in points.items():
+                # Skip couriers that moved elsewhere meanwhile
+                if self._courier_locations.get(courier_id) == address_id:
+                    self._index_courier(courier_id, address_id, point)
+
+    def nearest_couriers(self, coordinates, k: int = 1) -> List[tuple]:
+        """
+        Returns up to k (courier_id, distance) pairs closest to the given coordinates, nearest first.
+        """
+        self._ensure_courier_index()
+        return self.courier_index.k_nearest(coordinates, k)
+
+    @staticmethod
+    def unit_of_work():
+        """
+        Context manager that stages every change made inside it (addresses, orders,
+        couriers, ...) and commits each touched store once when it exits.
+        If the block raises, nothing is written and every store rolls back.
+        """
+        return storage.unit_of_work()
+
+    @tracing.traced("dispatch_order")
+    def dispatch_order(self, package_id) -> bool:
+        """
+        Assigns the closest courier to the order and sets the order's origin to
+        that courier's current location, committing both in one write.
+        Returns True if a courier was assigned, False otherwise.
+        """
+        with self.unit_of_work():
+            if not self.assign_closest_courier_to_order(package_id):
+                return False
+            order = self.find_order_by_package_id(package_id)
+            courier = self.get_courier_by_id(
+                order._courier_id) if order and order._courier_id else None
+            if not courier:
+                return False
+            return Order.update_by_package_id(package_id, "origin_id", courier.current_location)
+
+    @tracing.traced("assign_closest_courier")
     def assign_closest_courier_to_order(self, package_id) -> bool:
         """
         Assigns the closest courier to the order by calculating the distance between
         the courier's current_location and the order's destination_id using their Address coordinates.
-        Assumes all couriers are available.
+        Couriers are looked up through the spatial index instead of scanning the whole fleet,
+        skipping those that are off shift or already hold config.COURIER_CAPACITY open orders.
+        If the destination is still waiting for its coordinates, the order is
+        dispatched once they arrive and False is returned for now.
         Returns True if successful, False otherwise.
         """
         order = self.find_order_by_package_id(package_id)
@@ -264,46 +580,120 @@ class DispatchSystem:
             _logger.error(f"Order with package ID {package_id} not found.")
             return False
 
-        couriers = Courier.read_couriers()
-        if not couriers:
+        self._ensure_courier_index()
+        if not self._courier_locations:
             _logger.error("No couriers available.")
+            self.update_order_status(package_id, PackageStatus.NOT_ASSIGNED)
             return False
 
-        # Get Address objects for destination and couriers' locations
+        # Get the Address object of the destination
         destination_address = self.get_address_by_id(order._destination_id)
         if not destination_address:
             _logger.error(
                 f"Destination address ID {order._destination_id} not found.")
             return False
-
-        closest_courier = None
-        min_distance = float('inf')
-        for courier in couriers:
-            courier_address = self.get_address_by_id(courier.current_location)
-            if not courier_address or not courier_address.coordinates or not destination_address.coordinates:
-                continue
-            # Calculate Euclidean distance between coordinates
-            x1, y1 = courier_address.coordinates
-            x2, y2 = destination_address.coordinates
-            distance = ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
-            if distance < min_distance:
-                min_distance = distance
-                closest_courier = courier
-
-        if not closest_courier:
-            _logger.error(
-                "No available couriers with valid addresses to assign.")
-            self.update_order_status(package_id, PackageStatus.NOT_ASSIGNED)
-            return False
-
-        # Assign the closest courier using the static method
-        if Order.update_by_package_id(order._package_id, "courier_id", closest_courier.courier_id):
+        if destination_address.coordinates_pending:
             _logger.info(
-                f"Order {package_id} assigned to courier {closest_courier.courier_id}.")
-            self.update_order_status(package_id, PackageStatus.CONFIRMED)
-            return True
-        else:
-            _logger.error(
-                f"Failed to update order {package_id} with courier {closest_courier.courier_id}.")
-            self.update_order_status(package_id, PackageStatus.NOT_ASSIGNED)
+                f"Destination of order {package_id} is still being geocoded; assignment deferred.")
+            self.when_coordinates_ready(
+                destination_address.id, lambda _: self.dispatch_order(package_id))
             return False
+
+        with Order.store().batch(), self._assignment_lock:
+            # Nearest available courier by Euclidean distance between coordinates
+            nearest = None
+            if destination_address.coordinates:
+                with tracing.span("courier.nearest", couriers=len(self._courier_locations)):
+                    nearest = self.courier_index.nearest(destination_address.coordinates,
+                                                         predicate=self.availability.eligible())
+
+            if not nearest:
+                _logger.error(
+                    "No available couriers with valid addresses to assign.")
+                self.update_order_status(
+                    package_id, PackageStatus.NOT_ASSIGNED)
+                return False
+            closest_courier_id = nearest[0]
+
+            # Assign the closest courier; courier and status are written together
+            if Order.update_by_package_id(order._package_id, "courier_id", closest_courier_id):
+                _logger.info(
+                    f"Order {package_id} assigned to courier {closest_courier_id}.")
+                self.update_order_status(package_id, PackageStatus.CONFIRMED)
+                return True
+            else:
+                _logger.error(
+                    f"Failed to update order {package_id} with courier {closest_courier_id}.")
+                self.update_order_status(
+                    package_id, PackageStatus.NOT_ASSIGNED)
+                return False
+
+    def assign_pending_orders(self) -> Dict[int, int]:
+        """
+        Assigns every order in CREATED or NOT_ASSIGNED status in one batch.
+        The order x courier distance matrix is solved as a whole (Hungarian
+        algorithm), falling back to a greedy nearest-free-courier pass when its
+        rounds would solve more than config.ASSIGNMENT_MATRIX_LIMIT cells in
+        total, as happens when orders far outnumber couriers. Only couriers
+        on shift with free capacity take part, and none is given more orders
+        than it has free slots; orders left over stay unassigned. Orders whose
+        destination is still being geocoded are skipped.
+        All courier, origin and status changes are persisted in one write.
+        Returns a dict mapping package_id to the assigned courier_id.
+        """
+        pending = [order for status in (PackageStatus.CREATED, PackageStatus.NOT_ASSIGNED)
+                   for order in Order.store().find_by("status", status.value)]
+        package_ids = []
+        order_points = []
+        unassignable = []
+        for order in sorted(pending, key=lambda order: order["package_id"]):
+            destination = self.get_address_by_id(order.get("destination_id"))
+            if destination and destination.coordinates_pending:
+                continue
+            if not destination or not destination.coordinates:
+                unassignable.append(order["package_id"])
+                continue
+            package_ids.append(order["package_id"])
+            order_points.append(destination.coordinates)
+
+        self._ensure_courier_index()
+        with Order.store().batch(), self._assignment_lock:
+            with self._courier_index_lock:
+                candidates = [
+                    cid for cid in self._courier_locations if cid in self.courier_index]
+            slots = self.availability.free_slots(candidates)
+            with self._courier_index_lock:
+                courier_ids = [cid for cid, free in slots.items(
+                ) if free != 0 and cid in self.courier_index]
+                courier_points = [self.courier_index.position(cid)
+                                  for cid in courier_ids]
+                locations = dict(self._courier_locations)
+
+            if not courier_ids:
+                chosen = [None] * len(package_ids)
+            elif assignment.np is not None and assignment.assignment_cells(
+                    len(package_ids), [slots[cid] for cid in courier_ids],
+                    config.ASSIGNMENT_MATRIX_LIMIT) <= config.ASSIGNMENT_MATRIX_LIMIT:
+                chosen = assignment.optimal_assignment(
+                    order_points, courier_ids, courier_points, [slots[cid] for cid in courier_ids])
+            else:
+                chosen = assignment.greedy_assignment(
+                    order_points, self.courier_index, {cid: slots[cid] for cid in courier_ids})
+
+            assigned: Dict[int, int] = {}
+            for package_id, courier_id in zip(package_ids, chosen):
+                if courier_id is None:
+                    unassignable.append(package_id)
+                    continue
+                Order.store().update(package_id, {
+                    "courier_id": courier_id,
+                    "origin_id": locations.get(courier_id),
+                    "status": PackageStatus.CONFIRMED.value,
+                })
+                assigned[package_id] = courier_id
+            for package_id in unassignable:
+                self.update_order_status(
+                    package_id, PackageStatus.NOT_ASSIGNED)
+        _logger.info(
+            f"Batch assignment: {len(assigned)} orders assigned, {len(unassignable)} left unassigned.")
+        return assigned
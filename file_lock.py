@@ -0,0 +1,152 @@
+"""
+Advisory file locks and atomic file replacement shared between processes.
+
+Several Flask workers may run the dispatch system against the same data
+directory. The locks are held on a separate "<name>.lock" file, so the
+protected file itself can be replaced with os.replace() while the lock is
+held, and atomic_write() makes sure readers only ever see a complete file.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterator, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def lock_path_for(path: Union[str, Path]) -> Path:
+    """Return the lock file that guards path."""
+    path = Path(path)
+    return path.with_name(path.name + ".lock")
+
+
+def _open_lock_file(path: Union[str, Path]) -> int:
+    lock_path = lock_path_for(path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    return os.open(str(lock_path), os.O_RDWR | os.O_CREAT, 0o644)
+
+
+def _lock_fd(fd: int, shared: bool) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        return
+    os.lseek(fd, 0, os.SEEK_SET)
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue  # LK_LOCK gives up after ~10 seconds; keep waiting
+
+
+def _unlock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path: Union[str, Path], shared: bool = False) -> Iterator[None]:
+    """
+    Hold an advisory lock guarding path for the enclosed block.
+    Any number of shared holders may overlap, while an exclusive holder excludes
+    everyone else. The lock belongs to the open lock file, so threads of one
+    process exclude each other too. Without fcntl (Windows) every lock is exclusive.
+    """
+    fd = _open_lock_file(path)
+    try:
+        _lock_fd(fd, shared)
+        try:
+            yield
+        finally:
+            _unlock_fd(fd)
+    finally:
+        os.close(fd)
+
+
+class FileLock:
+    """
+    Reentrant reader-writer lock guarding one file, for a store object that
+    lives for the whole process.
+
+    Threads of the process take turns on an internal RLock, and a thread that
+    holds the lock may enter it again in either mode. Towards other processes
+    the lock is a shared (shared()) or exclusive (exclusive()) file_lock(). Entering
+    exclusive() while only holding shared() upgrades the lock, but not atomically;
+    callers that read before they write should take exclusive() from the start.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._thread_lock = threading.RLock()
+        self._fd: Optional[int] = None
+        self._depth = 0
+        self._exclusive = False
+
+    @contextmanager
+    def _hold(self, exclusive: bool) -> Iterator[None]:
+        with self._thread_lock:
+            if self._depth == 0:
+                fd = _open_lock_file(self.path)
+                try:
+                    _lock_fd(fd, shared=not exclusive)
+                except BaseException:
+                    os.close(fd)
+                    raise
+                self._fd = fd
+                self._exclusive = exclusive
+            elif exclusive and not self._exclusive:
+                _lock_fd(self._fd, shared=False)
+                self._exclusive = True
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fd, self._fd = self._fd, None
+                    try:
+                        _unlock_fd(fd)
+                    finally:
+                        os.close(fd)
+
+    def shared(self):
+        """Context manager holding the lock for reading."""
+        return self._hold(exclusive=False)
+
+    def exclusive(self):
+        """Context manager holding the lock for writing."""
+        return self._hold(exclusive=True)
+
+
+@contextmanager
+def atomic_write(path: Union[str, Path], encoding: Optional[str] = "utf-8") -> Iterator[IO]:
+    """
+    Open path for writing through a temporary file in the same directory
+    (in binary mode when encoding is None).
+    The temporary file is flushed to disk and renamed over path when the block
+    exits, so readers see either the old or the new content, never a partial
+    file; if the block raises, path is left untouched.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(
+        f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with (tmp_path.open("wb") if encoding is None else tmp_path.open("w", encoding=encoding)) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,356 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import requests
+
+import config
+import metrics
+import tracing
+
+
+_logger = logging.getLogger(__name__)
+
+Coordinates = Tuple[float, float]
+
+# Calls that reached the geocoding provider (cache misses), labelled by geocoder class
+REQUEST_SECONDS = metrics.histogram(
+    "geocode_request_seconds", "Duration of geocoding provider calls", ("geocoder",))
+CACHE_LOOKUPS = metrics.counter(
+    "geocode_cache_lookups_total", "Geocoding cache lookups by result", ("result",))
+
+_MISSING = object()
+
+
+class GeocodingError(Exception):
+    """Raised when the geocoding provider could not be reached."""
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a geocoding query so that trivially different spellings share a cache key."""
+    return re.sub(r"\s+", " ", query.strip().lower())
+
+
+class NominatimGeocoder:
+    """
+    Geocoder backed by the OpenStreetMap Nominatim search API.
+    """
+    url = "https://nominatim.openstreetmap.org/search"
+    headers = {
+        "User-Agent": "DeliverySim/1.0 (tmunot1234567@gmail.com)"
+    }
+
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        self.timeout = config.GEOCODE_TIMEOUT if timeout is None else timeout
+
+    def geocode(self, query: str) -> Optional[Coordinates]:
+        """
+        Return (latitude, longitude) for the query, or None if nothing was found.
+        Raises GeocodingError if the request itself failed or timed out.
+        """
+        params = {
+            "q": query,
+            "format": "json",
+            "limit": 1
+        }
+        try:
+            response = requests.get(
+                self.url, params=params, headers=self.headers, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except requests.RequestException as e:
+            raise GeocodingError(str(e)) from e
+        if data:
+            coordinates = (float(data[0]["lat"]), float(data[0]["lon"]))
+            print(f"[Geocoding] Coordinates found: {coordinates}")
+            return coordinates
+        print("[Geocoding] No coordinates found for the given address.")
+        return None
+
+
+class StubGeocoder:
+    """
+    Offline geocoder for tests and benchmarks.
+    Returns deterministic coordinates derived from the query text and counts the calls made.
+    """
+
+    def __init__(self, known: Optional[Dict[str, Optional[Coordinates]]] = None) -> None:
+        self.known = {normalize_query(q): c for q, c in (known or {}).items()}
+        self.calls = 0
+
+    def geocode(self, query: str) -> Optional[Coordinates]:
+        self.calls += 1
+        key = normalize_query(query)
+        if key in self.known:
+            return self.known[key]
+        digest = hashlib.sha1(key.encode("utf-8")).digest()
+        lat = 29.5 + digest[0] / 255 * 3.8
+        lon = 34.2 + digest[1] / 255 * 1.5
+        return (round(lat, 6), round(lon, 6))
+
+
+class GeocodingCache:
+    """
+    Two-tier cache of geocoding results keyed by the normalized query string.
+
+    The memory tier is an LRU of at most `capacity` entries. The disk tier is a
+    small SQLite table, so results survive restarts and are shared between
+    worker processes. "Not found" answers are cached too; provider errors are not.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, capacity: int = 4096) -> None:
+        self.path = Path(path) if path is not None else None
+        self.capacity = capacity
+        self._memory: "OrderedDict[str, Optional[Coordinates]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                "query TEXT PRIMARY KEY, lat REAL, lon REAL)")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key: str, coordinates: Optional[Coordinates]) -> None:
+        self._memory[key] = coordinates
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def get(self, query: str):
+        """Return cached coordinates (possibly None), or the module's _MISSING marker."""
+        key = normalize_query(query)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+        conn = self._connection()
+        row = None
+        if conn is not None:
+            row = conn.execute(
+                "SELECT lat, lon FROM geocode WHERE query = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return _MISSING
+            self.disk_hits += 1
+            coordinates = (row[0], row[1]) if row[0] is not None else None
+            self._remember(key, coordinates)
+            return coordinates
+
+    def put(self, query: str, coordinates: Optional[Coordinates]) -> None:
+        key = normalize_query(query)
+        with self._lock:
+            self._remember(key, coordinates)
+        conn = self._connection()
+        if conn is not None:
+            lat, lon = coordinates if coordinates is not None else (None, None)
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO geocode (query, lat, lon) VALUES (?, ?, ?)",
+                    (key, lat, lon))
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        """Return hit/miss counters and the overall hit rate."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+class CachingGeocoder:
+    """
+    Geocoder that consults a GeocodingCache before falling back to another geocoder.
+    """
+
+    def __init__(self, backend, cache: GeocodingCache) -> None:
+        self.backend = backend
+        self.cache = cache
+
+    def geocode(self, query: str) -> Optional[Coordinates]:
+        with tracing.span("geocode") as span:
+            cached = self.cache.get(query)
+            if cached is not _MISSING:
+                CACHE_LOOKUPS.inc(("hit",))
+                if span:
+                    span.set("geocode.cache", "hit")
+                return cached
+            CACHE_LOOKUPS.inc(("miss",))
+            if span:
+                span.set("geocode.cache", "miss")
+            start = time.perf_counter()
+            coordinates = self.backend.geocode(query)
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start, (type(self.backend).__name__,))
+            self.cache.put(query, coordinates)
+            return coordinates
+
+
+class RateLimiter:
+    """
+    Spaces calls so that at most `rate` of them start per second, across all threads.
+    A rate of 0 or less disables the limit.
+    """
+
+    def __init__(self, rate: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            self._sleep(slot - now)
+
+
+class RateLimitedGeocoder:
+    """
+    Geocoder wrapper that waits for a RateLimiter slot before each call to the wrapped geocoder.
+    """
+
+    def __init__(self, backend, limiter: RateLimiter) -> None:
+        self.backend = backend
+        self.limiter = limiter
+
+    def geocode(self, query: str) -> Optional[Coordinates]:
+        self.limiter.acquire()
+        return self.backend.geocode(query)
+
+
+class GeocodingQueue:
+    """
+    Background worker pool that resolves geocoding queries off the request path.
+
+    submit() returns immediately; the callback is invoked on a worker thread
+    with the coordinates, or with None if the address could not be geocoded
+    after `retries` attempts.
+    """
+
+    def __init__(self, geocoder=None, workers: int = 2, retries: int = 3,
+                 retry_delay: float = 1.0) -> None:
+        self.geocoder = geocoder
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue: "queue.Queue" = queue.Queue()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name=f"geocoding-worker-{i}",
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, query: str, callback: Callable[[Optional[Coordinates]], None]) -> None:
+        """Queue a query for geocoding."""
+        self._queue.put((query, callback))
+
+    def pending(self) -> int:
+        """Return the number of queries waiting for a worker."""
+        return self._queue.qsize()
+
+    def join(self) -> None:
+        """Block until every submitted query has been processed."""
+        self._queue.join()
+
+    def stop(self) -> None:
+        """Stop the workers once the queries already submitted are done."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _resolve(self, query: str) -> Optional[Coordinates]:
+        geocoder = self.geocoder or get_geocoder()
+        for attempt in range(1, self.retries + 1):
+            try:
+                return geocoder.geocode(query)
+            except GeocodingError as e:
+                _logger.warning(
+                    f"Geocoding attempt {attempt}/{self.retries} failed for '{query}': {e}")
+                if attempt < self.retries:
+                    time.sleep(self.retry_delay * attempt)
+        return None
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                query, callback = item
+                coordinates = self._resolve(query)
+                try:
+                    callback(coordinates)
+                except Exception:
+                    _logger.exception(
+                        f"Geocoding callback failed for '{query}'")
+            finally:
+                self._queue.task_done()
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    """Return the process-wide geocoder, building it from config on first use."""
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            if config.GEOCODER == "stub":
+                backend = StubGeocoder()
+            else:
+                backend = NominatimGeocoder()
+                if config.GEOCODE_RATE_LIMIT > 0:
+                    backend = RateLimitedGeocoder(
+                        backend, RateLimiter(config.GEOCODE_RATE_LIMIT))
+            cache = GeocodingCache(config.GEOCODE_CACHE_PATH or None,
+                                   capacity=config.GEOCODE_CACHE_SIZE)
+            _geocoder = CachingGeocoder(backend, cache)
+        return _geocoder
+
+
+def _cache_hit_ratio() -> Dict[Tuple[str, ...], float]:
+    cache = getattr(_geocoder, "cache", None)
+    return {(): cache.stats()["hit_rate"]} if isinstance(cache, GeocodingCache) else {}
+
+
+metrics.gauge("geocode_cache_hit_ratio", "Share of geocoding lookups answered by the cache since start",
+              (), _cache_hit_ratio)
+
+
+def set_geocoder(geocoder) -> None:
+    """Replace the process-wide geocoder, e.g. with a cached StubGeocoder in tests."""
+    global _geocoder
+    with _geocoder_lock:
+        _geocoder = geocoder
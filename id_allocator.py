@@ -0,0 +1,96 @@
+"""
+Unique integer IDs for orders and addresses, safe across worker processes.
+
+An IdAllocator leases blocks of IDs (hi/lo allocation): the durable counter
+file holds the first ID nobody has leased yet. Leasing a block locks the file,
+advances the counter by block_size and releases the lock; the IDs of the block
+are then handed out from memory with no I/O. Two processes never lease the same
+block, so they never hand out the same ID. IDs left in a block when a process
+exits are skipped, which leaves gaps but never duplicates.
+"""
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import config
+from file_lock import atomic_write, file_lock
+
+
+_logger = logging.getLogger(__name__)
+
+
+class IdAllocator:
+    """
+    Hands out increasing unique IDs leased in blocks from a counter file.
+
+    seed() gives the first ID to use when the counter file does not exist yet
+    (typically the highest stored ID + 1), so existing data is only looked at
+    once, when the counter is created. Without a path the allocator only counts
+    in memory, which is unique within one process.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, block_size: Optional[int] = None,
+                 seed: Optional[Callable[[], int]] = None) -> None:
+        self.path = Path(path) if path is not None else None
+        self.block_size = max(
+            1, config.ID_BLOCK_SIZE if block_size is None else block_size)
+        self._seed = seed or (lambda: 1)
+        self._lock = threading.Lock()
+        self._next = 0
+        self._limit = 0  # first ID past the current block
+
+    def next_id(self) -> int:
+        """Return a new ID, leasing the next block first when the current one is used up."""
+        with self._lock:
+            if self._next >= self._limit:
+                self._next, self._limit = self._lease()
+            value = self._next
+            self._next += 1
+            return value
+
+    def _lease(self) -> Tuple[int, int]:
+        if self.path is None:
+            start = self._limit or self._seed()
+            return start, start + self.block_size
+        with file_lock(self.path):
+            start = self._read_counter()
+            if start is None:
+                start = self._seed()
+            self._write_counter(start + self.block_size)
+        return start, start + self.block_size
+
+    def _read_counter(self) -> Optional[int]:
+        try:
+            return int(self.path.read_text(encoding="utf-8").strip())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            _logger.warning(
+                f"Unreadable ID counter {self.path} ({e}); reseeding it")
+            return None
+
+    def _write_counter(self, value: int) -> None:
+        with atomic_write(self.path) as file:
+            file.write(f"{value}\n")
+
+
+_allocators: Dict[str, IdAllocator] = {}
+_allocators_lock = threading.Lock()
+
+
+def for_path(path: Union[str, Path], seed: Optional[Callable[[], int]] = None) -> IdAllocator:
+    """Return the process-wide allocator for a counter file, creating it on first use."""
+    key = str(Path(path).resolve())
+    with _allocators_lock:
+        allocator = _allocators.get(key)
+        if allocator is None:
+            allocator = IdAllocator(path, seed=seed)
+            _allocators[key] = allocator
+        return allocator
+
+
+def reset() -> None:
+    """Forget every allocator; the next for_path() call leases a fresh block."""
+    with _allocators_lock:
+        _allocators.clear()
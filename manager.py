@@ -3,6 +3,8 @@ from typing import Dict
 
 
 class Manager:
+    __slots__ = ("name", "manager_id", "phone_number", "email", "password")
+
     def __init__(self, name, manager_id, phone_number, email, password):
 
         self.name = name
@@ -1,54 +1,31 @@
-import json
-import os
+import storage
 
-JSON_FILE = '/data/managers.json'
+JSON_FILE = 'data/managers.json'
+
+
+def _repository():
+    return storage.repository("managers", JSON_FILE)
 
 
 def load_managers():
-    if not os.path.exists(JSON_FILE):
-        return []
-    with open(JSON_FILE, 'r') as file:
-        try:
-            return json.load(file)
-        except json.JSONDecodeError:
-            # print error message if needed
-            return []
+    return _repository().all()
 
 
 def save_managers(managers):
-    with open(JSON_FILE, 'w') as file:
-        json.dump(managers, file, indent=4)
+    _repository().replace_all(managers)
 
 
 def get_manager_by_id(manager_id):
-    managers = load_managers()
-    for manager in managers:
-        if manager['id'] == manager_id:
-            return manager
-    return None
+    return _repository().get(manager_id)
 
 
 def add_manager(manager):
-    managers = load_managers()
-    managers.append(manager.to_dict())
-    save_managers(managers)
+    _repository().insert(manager.to_dict())
 
 
 def update_manager(manager_id, updated_manager):
-    managers = load_managers()
-    for i, manager in enumerate(managers):
-        if manager['manager_id'] == manager_id:
-            managers[i] = updated_manager.to_dict()
-            save_managers(managers)
-            return True
-    return False
+    return _repository().update(manager_id, updated_manager.to_dict())
 
 
 def delete_manager(manager_id):
-    managers = load_managers()
-    for i, manager in enumerate(managers):
-        if manager['manager_id'] == manager_id:
-            del managers[i]
-            save_managers(managers)
-            return True
-    return False
+    return _repository().delete(manager_id)
@@ -0,0 +1,250 @@
+"""
+In-process metrics (counters and histograms) rendered in the Prometheus text format.
+
+Recording is off unless config.METRICS is set (DISPATCH_METRICS=1), and the
+instrumentation then costs a single flag check per call. Values are kept per
+worker process; each worker serves its own numbers on /metrics, so scrape
+the workers individually (or run one).
+
+    REQUESTS = metrics.counter("requests_total", "Requests served", ("route",))
+    REQUESTS.inc(("index",))
+
+    @metrics.timed(LATENCY, ("index",))
+    def index(): ...
+"""
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import config
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = config.METRICS
+
+LabelValues = Tuple[str, ...]
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True) -> None:
+    """Turn recording on or off for the whole process (config.METRICS sets the initial state)."""
+    global _enabled
+    _enabled = on
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name,
+             value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values: LabelValues = (), amount: float = 1) -> None:
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(
+                label_values, 0) + amount
+
+    def value(self, label_values: LabelValues = ()) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in values]
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set, with their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (the last one is +Inf), sum]
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_values: LabelValues = ()) -> None:
+        if not _enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [
+                    [0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, label_values: LabelValues = ()) -> int:
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def sum(self, label_values: LabelValues = ()) -> float:
+        series = self._series.get(label_values)
+        return series[1] if series else 0.0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((labels, list(counts), total)
+                            for labels, (counts, total) in self._series.items())
+        lines = []
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float(
+                    "inf") else f'le="{_number(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(
+                f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(
+                f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A value read from a callback when the metrics are rendered: {label values: value}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str],
+                 read: Callable[[], Dict[LabelValues, float]]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.read = read
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+                for labels, value in sorted(self.read().items())]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add a metric; registering the same name again returns the metric already there."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, label_names))
+
+
+def histogram(name: str, documentation: str, label_names: Sequence[str] = (),
+              buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, label_names, buckets))
+
+
+def gauge(name: str, documentation: str, label_names: Sequence[str],
+          read: Callable[[], Dict[LabelValues, float]]) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, label_names, read))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def timed(metric: Histogram, label_values: LabelValues = ()) -> Callable[[Callable], Callable]:
+    """
+    Decorator that observes the duration of every call (exceptions included) in metric.
+    For a generator function the duration runs until the generator is exhausted
+    or closed, since creating it does none of the work.
+    """
+    def decorate(func: Callable) -> Callable:
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return (yield from func(*args, **kwargs))
+                start = time.perf_counter()
+                try:
+                    return (yield from func(*args, **kwargs))
+                finally:
+                    metric.observe(time.perf_counter() - start, label_values)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - start, label_values)
+        return wrapper
+    return decorate
+
+
+def instrument_methods(metric: Histogram, names: Optional[Iterable[str]] = None) -> Callable[[type], type]:
+    """
+    Class decorator timing the public methods of a class (or the given ones)
+    in a histogram labelled by method name. Static and class methods are covered too,
+    and generator methods are timed over their whole iteration (see timed()).
+    """
+    def decorate(cls: type) -> type:
+        for name in names or [n for n in vars(cls) if not n.startswith("_")]:
+            attribute = inspect.getattr_static(cls, name)
+            if isinstance(attribute, (staticmethod, classmethod)):
+                setattr(cls, name, type(attribute)(
+                    timed(metric, (name,))(attribute.__func__)))
+            elif inspect.isfunction(attribute):
+                setattr(cls, name, timed(metric, (name,))(attribute))
+        return cls
+    return decorate
@@ -0,0 +1,69 @@
+"""
+Import the JSON data files into the SQLite storage backend.
+
+Usage (from the repository root):
+    python migrate_storage.py [--data-dir data] [--db data/dispatch.sqlite3] [--replace]
+
+Records whose key already exists in the database are left untouched unless
+--replace is given, in which case every table is replaced by the JSON data.
+Afterwards run the app with DISPATCH_STORAGE_BACKEND=sqlite.
+"""
+import argparse
+from pathlib import Path
+from typing import Dict
+
+import storage
+from order_store import OrderStore
+
+# entity -> JSON file name inside the data directory
+JSON_FILES = {
+    "orders": "orders.json",
+    "couriers": "courier.json",
+    "customers": "customers.json",
+    "managers": "managers.json",
+    "addresses": "addresses.json",
+    "courier_positions": "courier_positions.json",
+}
+
+
+def migrate(data_dir: Path, db_path: Path, replace: bool = False) -> Dict[str, int]:
+    """Copy every JSON store into the SQLite database. Returns the number of records imported per entity."""
+    db = storage.SqliteDatabase(db_path)
+    imported: Dict[str, int] = {}
+    try:
+        for entity, file_name in JSON_FILES.items():
+            json_path = data_dir / file_name
+            key, indexed = storage.ENTITIES[entity]
+            if entity == "orders":
+                # Also replays a pending orders journal
+                records = OrderStore(json_path, journal=True).all()
+            else:
+                records = storage.JsonRepository(json_path, key).all()
+            target = storage.SqliteRepository(db, entity, key, indexed)
+            with target.batch():
+                if replace:
+                    target.replace_all(records)
+                    imported[entity] = len(records)
+                else:
+                    imported[entity] = sum(target.insert(r) for r in records)
+    finally:
+        db.close()
+    return imported
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Import JSON data files into SQLite storage.")
+    parser.add_argument("--data-dir", type=Path, default=Path("data"))
+    parser.add_argument("--db", type=Path,
+                        default=Path("data/dispatch.sqlite3"))
+    parser.add_argument("--replace", action="store_true",
+                        help="replace existing tables instead of only adding missing records")
+    args = parser.parse_args()
+
+    for entity, count in migrate(args.data_dir, args.db, args.replace).items():
+        print(f"{entity}: {count} records imported")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
-import json
-import os
 from typing import Dict, Any, List, Optional
+from datetime import datetime
 from enum import Enum
+from pathlib import Path
+import id_allocator
+import storage
+import tracing
+from storage import Repository
 
 
 class PackageStatus(Enum):
@@ -15,14 +19,12 @@ class PackageStatus(Enum):
 
 class Order:
     _json_filename = "data/orders.json"
-    _package_number = 0
+    __slots__ = ("_package_id", "_customer_id", "_courier_id", "_origin_id", "_destination_id",
+                 "_status", "_created_at")
 
-    def __init__(self, customer_id, courier_id, origin_id, destination_id, package_id=None, status=PackageStatus.CONFIRMED, auto_save=True):
-        if Order._package_number == 0:
-            Order._initialize_package_number()
+    def __init__(self, customer_id, courier_id, origin_id, destination_id, package_id=None, status=PackageStatus.CONFIRMED, auto_save=True, created_at=None):
         if package_id is None:
-            self._package_id = Order._package_number
-            Order._package_number += 1
+            self._package_id = Order._package_ids().next_id()
         else:
             self._package_id = package_id
         self._customer_id = customer_id
@@ -30,6 +32,10 @@ class Order:
         self._origin_id = origin_id
         self._destination_id = destination_id
         self._status = status
+        # ISO timestamp of creation; stamped now for new orders
+        if created_at is None and auto_save:
+            created_at = datetime.now().isoformat(timespec="seconds")
+        self._created_at = created_at
         # Only save to JSON if auto_save is True
         if auto_save:
             self.create()  # save to JSON file
@@ -38,27 +44,15 @@ class Order:
         return f"Order(package_id={self._package_id}, customer_id={self._customer_id}, courier_id={self._courier_id}, origin_id={self._origin_id}, destination_id={self._destination_id}, status={self._status})"
 
     @classmethod
-    def _initialize_package_number(cls):
-        """Initialize _package_number based on existing orders in JSON file"""
-        try:
-            if os.path.exists(cls._json_filename):
-                with open(cls._json_filename, 'r', encoding='utf-8') as file:
-                    try:
-                        orders = json.load(file)
-                        if isinstance(orders, list) and orders:
-                            # Find the highest package_id and set _package_number to be higher
-                            max_id = max(order.get("package_id", 0)
-                                         for order in orders)
-                            cls._package_number = max_id + 1
-                        else:
-                            cls._package_number = 1
-                    except json.JSONDecodeError:
-                        cls._package_number = 1
-            else:
-                cls._package_number = 1
-        except Exception as e:
-            print(f"Error initializing package number: {e}")
-            cls._package_number = 1
+    def store(cls) -> Repository:
+        """Return the repository holding the orders (the in-memory OrderStore for the JSON backend)"""
+        return storage.repository("orders", cls._json_filename)
+
+    @classmethod
+    def _package_ids(cls) -> id_allocator.IdAllocator:
+        """Return the allocator of new package IDs, shared with the other worker processes (data/orders.ids)"""
+        return id_allocator.for_path(Path(cls._json_filename).with_suffix(".ids"),
+                                     seed=lambda: cls.store().max_key() + 1)
 
     def to_dict(self) -> Dict[str, Any]:
         """Convert order object to dictionary."""
@@ -70,52 +64,21 @@ class Order:
                 "origin_id": self._origin_id,
                 "destination_id": self._destination_id,
                 "status": self._status.value if hasattr(self._status, "value") else self._status,
+                "created_at": self._created_at,
             }
 
-    def _load_orders(self) -> List[Dict[str, Any]]:
-        """Load orders from JSON file"""
-        try:
-            if os.path.exists(self._json_filename):
-                with open(self._json_filename, 'r', encoding='utf-8') as file:
-                    try:
-                        orders = json.load(file)
-                        if not isinstance(orders, list):
-                            return []
-                        return orders
-                    except json.JSONDecodeError:
-                        return []
-            else:
-                return []
-        except Exception as e:
-            print(f"Error loading orders: {e}")
-            return []
-
-    def _save_orders(self, orders: List[Dict[str, Any]]) -> bool:
-        """Save orders to JSON file"""
-        try:
-            with open(self._json_filename, 'w', encoding='utf-8') as file:
-                json.dump(orders, file, indent=2, ensure_ascii=False)
-            return True
-        except Exception as e:
-            print(f"Error saving orders: {e}")
-            return False
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Order":
+        """Build an Order object from a stored record without saving it again."""
+        return cls(data.get("customer_id"), data.get("courier_id"), data.get("origin_id"),
+                   data.get("destination_id"), data.get("package_id"), data.get("status"), auto_save=False,
+                   created_at=data.get("created_at"))
 
+    @tracing.traced("order.persist")
     def create(self) -> bool:
-        """Create new order in JSON file"""
+        """Create new order in the order store"""
         try:
-            orders = self._load_orders()
-            # Check for duplicate package_id
-            for existing_order in orders:
-                if existing_order.get("package_id") == self._package_id:
-                    return False
-            # Add new order
-            order_dict = self.to_dict()
-            orders.append(order_dict)
-            # Save to file
-            if self._save_orders(orders):
-                return True
-            else:
-                return False
+            return Order.store().insert(self.to_dict())
         except Exception as e:
             print(f"Error creating order: {e}")
             return False
@@ -124,39 +87,17 @@ class Order:
     def update_by_package_id(cls, package_id, field_name: str, new_value) -> bool:
         """Update an order by package_id without creating an object"""
         try:
-            with open(cls._json_filename, 'r', encoding='utf-8') as file:
-                orders = json.load(file)
-            for order in orders:
-                if order.get("package_id") == package_id:
-                    order[field_name] = new_value
-                    with open(cls._json_filename, 'w', encoding='utf-8') as file:
-                        json.dump(orders, file, indent=2, ensure_ascii=False)
-                    return True
-            return False
-        except:
+            with tracing.span("order.update", field=field_name):
+                return cls.store().update(package_id, {field_name: new_value})
+        except Exception as e:
+            print(f"Error updating order: {e}")
             return False
 
     @classmethod
     def delete_by_package_id(cls, package_id: str) -> bool:
         """Delete an order by package_id"""
         try:
-            if not os.path.exists(cls._json_filename):
-                return False
-            with open(cls._json_filename, 'r', encoding='utf-8') as file:
-                orders = json.load(file)
-                if not isinstance(orders, list):
-                    return False
-            # Find and remove the order
-            original_count = len(orders)
-            orders = [order for order in orders if order.get(
-                "package_id") != package_id]
-            if len(orders) < original_count:
-                # Order was found and removed
-                with open(cls._json_filename, 'w', encoding='utf-8') as file:
-                    json.dump(orders, file, indent=2, ensure_ascii=False)
-                return True
-            else:
-                return False
+            return cls.store().delete(package_id)
         except Exception as e:
             print(f"Error deleting order: {e}")
             return False
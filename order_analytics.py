@@ -0,0 +1,297 @@
+"""
+Columnar NumPy table of the orders, for the manager dashboard's aggregates.
+
+The table keeps one array per field (package id, status code, courier id,
+destination id and destination coordinates) and is kept current from the
+order store's change listeners, so counting orders by status, by courier or
+by destination area is a handful of vectorized operations instead of a Python
+loop over Order objects.
+"""
+import logging
+import math
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; DispatchSystem skips the analytics without it
+    np = None
+
+from order import PackageStatus
+from storage import Repository
+
+
+_logger = logging.getLogger(__name__)
+
+Coordinates = Tuple[float, float]
+
+# Orders in these statuses are finished; every other status counts as open
+CLOSED_STATUSES = (PackageStatus.DELIVERED.value, PackageStatus.CANCELED.value)
+# Stands for a missing courier or destination in the integer columns
+NO_ID = -1
+
+
+def _as_id(value: Any) -> int:
+    return value if isinstance(value, int) and not isinstance(value, bool) and value >= 0 else NO_ID
+
+
+class OrderAnalytics:
+    """
+    Order aggregates computed over NumPy columns.
+
+    Changes made through the order store in this process arrive through its
+    listener and are applied before the next query; when the store's
+    data_version() changes (another process rewrote the orders, a batch was
+    rolled back) the table is rebuilt from a scan of the store. Pending changes
+    are kept per order, the latest one winning, so writes with no queries in
+    between never queue more than one change per order. Neither the store nor
+    coordinates() is called while self._lock is held.
+    coordinates(destination_id) returns the (latitude, longitude) of a
+    destination, or None if it is not known yet.
+    """
+
+    def __init__(self, store: Repository, coordinates: Optional[Callable[[Any], Optional[Coordinates]]] = None
+                 ) -> None:
+        if np is None:
+            raise RuntimeError(
+                "Order analytics need numpy (pip install numpy)")
+        self.store = store
+        self._coordinates = coordinates or (lambda destination_id: None)
+        self._lock = threading.Lock()
+        # package_id -> latest order (None once deleted) not applied yet, filled by the
+        # store's listener under _changes_lock; _replaced is set by replace_all()
+        self._changes: Dict[Any, Optional[Dict[str, Any]]] = {}
+        self._replaced = False
+        self._changes_lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._statuses: List[Any] = []
+        self._status_codes: Dict[Any, int] = {}
+        self._row_of: Dict[Any, int] = {}
+        self._size = 0  # rows in use, deleted ones included
+        self._deleted = 0
+        self._allocate(0)
+        store.add_listener(self._on_change)
+
+    def _on_change(self, package_id: Any, order: Optional[Dict[str, Any]]) -> None:
+        with self._changes_lock:
+            if package_id is None:
+                self._changes.clear()
+                self._replaced = True
+            else:
+                self._changes[package_id] = order
+
+    # ---------- maintenance ----------
+
+    def _allocate(self, capacity: int) -> None:
+        self.package_id = np.full(capacity, NO_ID, dtype=np.int64)
+        self.status = np.zeros(capacity, dtype=np.int32)
+        self.courier_id = np.full(capacity, NO_ID, dtype=np.int64)
+        self.destination_id = np.full(capacity, NO_ID, dtype=np.int64)
+        self.lat = np.full(capacity, np.nan)
+        self.lon = np.full(capacity, np.nan)
+        self.alive = np.zeros(capacity, dtype=bool)
+
+    def _grow(self) -> None:
+        capacity = max(1024, 2 * len(self.alive))
+        old = (self.package_id, self.status, self.courier_id, self.destination_id,
+               self.lat, self.lon, self.alive)
+        self._allocate(capacity)
+        for new, column in zip((self.package_id, self.status, self.courier_id, self.destination_id,
+                                self.lat, self.lon, self.alive), old):
+            new[:self._size] = column[:self._size]
+
+    def _status_code(self, status: Any) -> int:
+        code = self._status_codes.get(status)
+        if code is None:
+            code = self._status_codes[status] = len(self._statuses)
+            self._statuses.append(status)
+        return code
+
+    def _put(self, package_id: Any, order: Optional[Dict[str, Any]], coordinates: Optional[Coordinates]) -> None:
+        row = self._row_of.get(package_id)
+        if order is None:
+            if row is not None:
+                self.alive[row] = False
+                del self._row_of[package_id]
+                self._deleted += 1
+            return
+        if row is None:
+            if self._size == len(self.alive):
+                self._grow()
+            row = self._row_of[package_id] = self._size
+            self._size += 1
+        destination_id = _as_id(order.get("destination_id"))
+        self.package_id[row] = _as_id(package_id)
+        self.status[row] = self._status_code(order.get("status"))
+        self.courier_id[row] = _as_id(order.get("courier_id"))
+        self.destination_id[row] = destination_id
+        self.lat[row], self.lon[row] = coordinates if coordinates else (
+            math.nan, math.nan)
+        self.alive[row] = True
+
+    def _locate(self, changes: Iterable[Tuple[Any, Optional[Dict[str, Any]]]]
+                ) -> List[Tuple[Any, Optional[Dict[str, Any]], Optional[Coordinates]]]:
+        """Pair each change with the coordinates of its destination, looking each destination up once."""
+        known: Dict[int, Optional[Coordinates]] = {}
+        located = []
+        for package_id, order in changes:
+            coordinates = None
+            if order is not None:
+                destination_id = _as_id(order.get("destination_id"))
+                if destination_id != NO_ID:
+                    if destination_id not in known:
+                        known[destination_id] = self._coordinates(
+                            destination_id)
+                    coordinates = known[destination_id]
+            located.append((package_id, order, coordinates))
+        return located
+
+    def _compact(self) -> None:
+        """Drop the rows of deleted orders."""
+        keep = np.flatnonzero(self.alive[:self._size])
+        new_row = np.cumsum(self.alive[:self._size]) - 1
+        for column in (self.package_id, self.status, self.courier_id, self.destination_id,
+                       self.lat, self.lon, self.alive):
+            column[:len(keep)] = column[keep]
+        self.alive[len(keep):self._size] = False
+        self._row_of = {package_id: int(
+            new_row[row]) for package_id, row in self._row_of.items()}
+        self._size = len(keep)
+        self._deleted = 0
+
+    def _take_changes(self) -> Tuple[Dict[Any, Optional[Dict[str, Any]]], bool]:
+        with self._changes_lock:
+            changes, replaced = self._changes, self._replaced
+            self._changes, self._replaced = {}, False
+        return changes, replaced
+
+    def _refresh(self) -> None:
+        """Bring the columns up to date; called without self._lock."""
+        version = self.store.data_version()
+        changes, replaced = self._take_changes()
+        if replaced or version != self._version:
+            # The store already holds every change reported so far; later ones stay queued
+            located = self._locate((order.get("package_id"), order)
+                                   for order in self.store.scan())
+            with self._lock:
+                self._row_of = {}
+                self._size = self._deleted = 0
+                self._allocate(0)
+                for change in located:
+                    self._put(*change)
+                self._version = version
+            _logger.info(
+                f"Order analytics table rebuilt with {len(located)} orders")
+            return
+        if changes:
+            located = self._locate(changes.items())
+            with self._lock:
+                for change in located:
+                    self._put(*change)
+                if self._deleted > 1024 and self._deleted > self._size // 2:
+                    self._compact()
+
+    def set_destination_coordinates(self, destination_id: int, coordinates: Optional[Coordinates]) -> None:
+        """Move every order bound for a destination whose coordinates changed."""
+        with self._lock:
+            rows = self.destination_id[:self._size] == destination_id
+            self.lat[:self._size][rows], self.lon[:self._size][rows] = (
+                coordinates if coordinates else (math.nan, math.nan))
+
+    # ---------- queries ----------
+
+    def _status_mask(self, statuses: Iterable[Any]):
+        # A lookup table indexed by status code beats np.isin on a million rows
+        table = np.zeros(len(self._statuses), dtype=bool)
+        table[[self._status_codes[s]
+               for s in statuses if s in self._status_codes]] = True
+        return table[self.status[:self._size]]
+
+    def _mask(self, status: Union[None, str, Iterable[str]] = None, courier_id: Optional[int] = None):
+        mask = self.alive[:self._size].copy()
+        if status is not None:
+            mask &= self._status_mask(
+                [status] if isinstance(status, str) else status)
+        if courier_id is not None:
+            mask &= self.courier_id[:self._size] == courier_id
+        return mask
+
+    def _open_mask(self):
+        return self.alive[:self._size] & ~self._status_mask(CLOSED_STATUSES)
+
+    def count(self, status: Union[None, str, Iterable[str]] = None, courier_id: Optional[int] = None) -> int:
+        """Return the number of orders in the given status(es) and/or assigned to the given courier."""
+        self._refresh()
+        with self._lock:
+            return int(np.count_nonzero(self._mask(status, courier_id)))
+
+    def status_counts(self) -> Dict[Any, int]:
+        """Return the number of orders per status."""
+        self._refresh()
+        with self._lock:
+            counts = np.bincount(self.status[:self._size][self.alive[:self._size]],
+                                 minlength=len(self._statuses))
+            return {status: int(n) for status, n in zip(self._statuses, counts) if n}
+
+    def orders_per_courier(self, status: Union[None, str, Iterable[str]] = None,
+                           open_only: bool = False) -> Dict[int, int]:
+        """Return the number of orders assigned to each courier, optionally only in some statuses or still open."""
+        self._refresh()
+        with self._lock:
+            mask = self._open_mask() if open_only else self._mask(status)
+            if open_only and status is not None:
+                mask &= self._mask(status)
+            ids = self.courier_id[:self._size][mask]
+            ids = ids[ids != NO_ID]
+            if not ids.size:
+                return {}
+            if ids.max() < 4 * ids.size + 1024:
+                counts = np.bincount(ids)
+                couriers = np.flatnonzero(counts)
+                return dict(zip(couriers.tolist(), counts[couriers].tolist()))
+            couriers, counts = np.unique(ids, return_counts=True)
+            return dict(zip(couriers.tolist(), counts.tolist()))
+
+    def open_orders_by_area(self, cell_size: float = 0.01) -> Dict[Coordinates, int]:
+        """
+        Return the number of open orders per destination area: square grid cells
+        of cell_size degrees, keyed by their south-west corner.
+        Orders whose destination has no coordinates yet are left out.
+        """
+        self._refresh()
+        self._resolve_missing_coordinates()
+        with self._lock:
+            mask = self._open_mask()
+            lat, lon = self.lat[:self._size][mask], self.lon[:self._size][mask]
+            known = ~np.isnan(lat)
+            if not known.any():
+                return {}
+            rows = np.floor(lat[known] / cell_size).astype(np.int64)
+            cols = np.floor(lon[known] / cell_size).astype(np.int64)
+            row0, col0 = int(rows.min()), int(cols.min())
+            width = int(cols.max()) - col0 + 1
+            cell_ids = (rows - row0) * width + (cols - col0)
+            if (int(rows.max()) - row0 + 1) * width <= 4 * cell_ids.size + 1_000_000:
+                counts = np.bincount(cell_ids)
+                cells = np.flatnonzero(counts)
+                counts = counts[cells]
+            else:
+                cells, counts = np.unique(cell_ids, return_counts=True)
+            return {(round((row0 + cell // width) * cell_size, 6), round((col0 + cell % width) * cell_size, 6)): n
+                    for cell, n in zip(cells.tolist(), counts.tolist())}
+
+    def _resolve_missing_coordinates(self) -> None:
+        """Look up destinations that had no coordinates when their open orders were added (deferred geocoding)."""
+        with self._lock:
+            missing = self._open_mask() & np.isnan(self.lat[:self._size]) & (
+                self.destination_id[:self._size] != NO_ID)
+            destination_ids = np.unique(
+                self.destination_id[:self._size][missing]).tolist()
+        found = {destination_id: self._coordinates(
+            destination_id) for destination_id in destination_ids}
+        with self._lock:
+            for destination_id, coordinates in found.items():
+                if coordinates:
+                    rows = np.isnan(self.lat[:self._size]) & (
+                        self.destination_id[:self._size] == destination_id)
+                    self.lat[:self._size][rows], self.lon[:self._size][rows] = coordinates
@@ -0,0 +1,619 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import config
+import metrics
+import serialization
+import tracing
+from file_lock import FileLock, atomic_write
+from record_table import RecordTable, Row
+from storage import (LOAD_SECONDS, READ_BYTES, SAVE_SECONDS, SHARED_VALUES, WRITTEN_BYTES, Repository, file_stamp,
+                     record_io, sort_key)
+
+
+_logger = logging.getLogger(__name__)
+
+Bucket = Union[Tuple[Any], Dict[Any, None]]
+
+
+def _bucket_add(index: Dict[Any, Bucket], value: Any, package_id: Any) -> None:
+    bucket = index.get(value)
+    if bucket is None:
+        index[value] = (package_id,)
+    elif isinstance(bucket, tuple):
+        if bucket[0] != package_id:
+            index[value] = {bucket[0]: None, package_id: None}
+    else:
+        bucket[package_id] = None
+
+
+def _bucket_remove(index: Dict[Any, Bucket], value: Any, package_id: Any) -> None:
+    bucket = index.get(value)
+    if isinstance(bucket, tuple):
+        if bucket[0] == package_id:
+            del index[value]
+    elif bucket is not None:
+        bucket.pop(package_id, None)
+        if not bucket:
+            del index[value]
+
+
+class OrderStore(Repository):
+    """
+    Process-resident store of order records keyed by package_id.
+
+    The backing orders file is parsed once when the store is created. Lookups
+    are dictionary hits, and mutations made inside a batch() block are written
+    back to disk once when the outermost block exits. The orders are held in a
+    RecordTable, a tuple of values per order, and copied out as dicts.
+
+    The orders file is written with the configured serializer. In journal
+    mode every insert, update or delete is appended as one JSON line to
+    "<orders file>.journal" instead of rewriting the orders file. Once the
+    journal holds compact_threshold records it is folded into the orders file
+    by a background compaction. Loading always replays the orders file
+    followed by any journal that is still on disk. Journal mode is the
+    default (config.ORDERS_JOURNAL); without it each change made outside a
+    batch() rewrites the whole orders file.
+
+    Secondary indexes on customer_id, courier_id and status let query() pick
+    its candidates without scanning every order.
+
+    Worker processes sharing the files stay in step: every change (or whole
+    batch) happens under an exclusive file lock after catching up with what
+    other processes wrote, and reads check the files' stamps, so they only
+    replay newly appended journal records, or reload after another process
+    rewrote the orders file.
+    """
+
+    key = "package_id"
+    indexed_fields = ("customer_id", "courier_id", "status")
+    _instances: Dict[str, "OrderStore"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: Union[str, Path], journal: Optional[bool] = None,
+                 compact_threshold: Optional[int] = None,
+                 serializer: Optional[serialization.Serializer] = None) -> None:
+        self.path = Path(path)
+        self.serializer = serializer or serialization.configured()
+        self.journal = config.ORDERS_JOURNAL if journal is None else journal
+        self.compact_threshold = (config.ORDERS_COMPACT_THRESHOLD
+                                  if compact_threshold is None else compact_threshold)
+        self.journal_path = self.path.with_name(self.path.name + ".journal")
+        self._compacting_path = self.path.with_name(
+            self.path.name + ".journal.compacting")
+        self._orders = self._new_table()
+        # field -> value -> package_ids: a 1-tuple for a single order (most customers have few),
+        # otherwise a dict used as an insertion-ordered set
+        self._indexes: Dict[str, Dict[Any, Bucket]] = {}
+        # True while package_ids were inserted in increasing order, so that
+        # insertion order is also package_id order
+        self._ids_ascending = True
+        # package_ids in key order for scan(); rebuilt after inserts and deletes
+        self._scan_keys: Optional[List[Any]] = None
+        self._lock = threading.RLock()
+        # Cross-process locks: one guards the orders file and journal, one serializes compactions
+        self._file_lock = FileLock(self.path)
+        self._compaction_lock = FileLock(
+            self.path.with_name(self.path.name + ".compaction"))
+        # What this process last read or wrote, to notice changes made by others
+        self._snapshot_stamp: Optional[Tuple[int, int, int]] = None
+        self._journal_stamp: Optional[Tuple[int, int, int]] = None
+        self._journal_offset = 0
+        # Counts full reloads; see data_version()
+        self._version = 0
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._batch_depth = 0
+        self._dirty = False
+        self._pending: List[Dict[str, Any]] = []
+        self._journal_records = 0
+        with self._file_lock.exclusive(), self._lock:
+            needs_compaction = self._load()
+        if needs_compaction:
+            # Fold leftovers from an interrupted compaction, or from a previous
+            # run in journal mode, back into the orders file.
+            self.compact()
+
+    @classmethod
+    def for_path(cls, path: Union[str, Path]) -> "OrderStore":
+        """Return the shared store for the given file, creating it on first use."""
+        key = str(Path(path).resolve())
+        with cls._instances_lock:
+            store = cls._instances.get(key)
+            if store is None:
+                store = cls(path)
+                cls._instances[key] = store
+            return store
+
+    @classmethod
+    def reset_instances(cls) -> None:
+        """Drop every shared store so the next for_path() call reloads from disk."""
+        with cls._instances_lock:
+            for store in cls._instances.values():
+                store.wait_for_compaction()
+            cls._instances.clear()
+
+    # ---------- loading ----------
+
+    def _new_table(self, orders: Iterable[Dict[str, Any]] = ()) -> RecordTable:
+        return RecordTable(self.key, orders, shared=SHARED_VALUES["orders"])
+
+    def _load(self) -> bool:
+        """Read the orders file and journals. Returns True if they should be compacted."""
+        self._orders = self._new_table()
+        self._version += 1
+        self._snapshot_stamp = file_stamp(self.path)
+        if self.path.exists() and self.path.stat().st_size > 0:
+            start = time.perf_counter()
+            try:
+                orders = serialization.load_file(self.path)
+                if metrics.enabled():
+                    record_io(LOAD_SECONDS, READ_BYTES, self.path.stem,
+                              start, self.path.stat().st_size)
+            except serialization.DecodeError:
+                _logger.warning(
+                    f"{self.path} contains invalid data. Starting with no orders.")
+                orders = []
+            if isinstance(orders, list):
+                self._orders = self._new_table(orders)
+
+        interrupted, _ = self._replay(self._compacting_path)
+        self._journal_stamp = file_stamp(self.journal_path)
+        self._journal_records, self._journal_offset = self._replay(
+            self.journal_path)
+        self._rebuild_indexes()
+        return bool(interrupted) or bool(self._journal_records and not self.journal)
+
+    def _replay(self, journal_path: Path, offset: int = 0, reindex: bool = False) -> Tuple[int, int]:
+        """
+        Apply the records of a journal file from byte offset on.
+        Returns the number of records applied and the offset of the end of the file.
+        """
+        if not journal_path.exists():
+            return 0, 0
+        count = 0
+        with journal_path.open("rb") as file:
+            file.seek(offset)
+            for line in file:
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append
+                    _logger.warning(
+                        f"Skipping unreadable record in {journal_path}")
+                    continue
+                if reindex:
+                    self._apply_indexed(record)
+                else:
+                    self._apply(record)
+                count += 1
+        return count, offset
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        op = record.get("op")
+        if op == "insert":
+            self._orders.put(record["order"])
+        elif op == "update":
+            self._orders.update(record["package_id"], record["changes"])
+        elif op == "delete":
+            self._orders.pop(record["package_id"])
+
+    def _apply_indexed(self, record: Dict[str, Any]) -> None:
+        """Apply a journal record written by another process, keeping the indexes current."""
+        op = record.get("op")
+        package_id = record["order"].get(
+            "package_id") if op == "insert" else record.get("package_id")
+        old = self._orders.get(package_id)
+        if old is not None:
+            self._index_remove(old)
+        elif op == "insert":
+            self._note_new_id(package_id)
+        self._apply(record)
+        order = self._orders.get(package_id)
+        if order is not None:
+            self._index_add(order)
+        elif old is not None:
+            self._scan_keys = None
+        if order is not None or old is not None:
+            self._notify(package_id, order)
+
+    # ---------- changes made by other processes ----------
+
+    def _refresh(self) -> None:
+        """
+        Catch up with what other processes wrote since this store last read or
+        wrote the files. The caller holds the file lock.
+        """
+        snapshot, journal = file_stamp(
+            self.path), file_stamp(self.journal_path)
+        if snapshot == self._snapshot_stamp and journal == self._journal_stamp:
+            return
+        if (snapshot == self._snapshot_stamp and journal is not None and self._journal_stamp is not None
+                and journal[2] == self._journal_stamp[2] and journal[1] >= self._journal_offset):
+            # The journal was only appended to: replay the new records
+            count, self._journal_offset = self._replay(self.journal_path, self._journal_offset,
+                                                       reindex=True)
+            self._journal_records += count
+            self._journal_stamp = journal
+        else:
+            # The orders file was rewritten or the journal rotated
+            self._load()
+
+    def _sync(self) -> None:
+        """Refresh before a read; costs two stat() calls when nothing changed."""
+        if (file_stamp(self.path) != self._snapshot_stamp
+                or file_stamp(self.journal_path) != self._journal_stamp):
+            with self._file_lock.shared(), self._lock:
+                self._refresh()
+
+    # ---------- secondary indexes ----------
+
+    def _rebuild_indexes(self) -> None:
+        self._indexes = {field: {} for field in self.indexed_fields}
+        for field, index in self._indexes.items():
+            for package_id, row in zip(self._orders, self._orders.rows()):
+                _bucket_add(index, self._orders.value(row, field), package_id)
+        ids = list(self._orders)
+        self._ids_ascending = all(isinstance(pid, int) for pid in ids) and \
+            all(a < b for a, b in zip(ids, ids[1:]))
+        self._scan_keys = None
+
+    def _index_add(self, order: Dict[str, Any]) -> None:
+        package_id = order.get("package_id")
+        for field in self.indexed_fields:
+            _bucket_add(self._indexes[field], order.get(field), package_id)
+
+    def _note_new_id(self, package_id: Any) -> None:
+        """Call before adding a new package_id to keep the key-order bookkeeping current."""
+        if self._ids_ascending and self._orders:
+            last_id = next(reversed(self._orders))
+            if not (isinstance(package_id, int) and package_id > last_id):
+                self._ids_ascending = False
+        self._scan_keys = None
+
+    def _index_remove(self, order: Dict[str, Any]) -> None:
+        package_id = order.get("package_id")
+        for field in self.indexed_fields:
+            _bucket_remove(self._indexes[field], order.get(field), package_id)
+
+    # ---------- persistence ----------
+
+    def _write_snapshot(self, orders: List[Dict[str, Any]]) -> bool:
+        start = time.perf_counter()
+        try:
+            with atomic_write(self.path, encoding=None) as file:
+                data = self.serializer.dumps(orders)
+                file.write(data)
+        except OSError as e:
+            _logger.error(f"Error saving orders: {e}")
+            return False
+        if metrics.enabled():
+            record_io(SAVE_SECONDS, WRITTEN_BYTES,
+                      self.path.stem, start, len(data))
+        self._snapshot_stamp = file_stamp(self.path)
+        return True
+
+    def _append_journal(self, records: List[Dict[str, Any]]) -> bool:
+        data = "".join(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+                       for record in records).encode("utf-8")
+        start = time.perf_counter()
+        try:
+            with self.journal_path.open("ab+") as file:
+                if file.seek(0, os.SEEK_END) > 0:
+                    file.seek(-1, os.SEEK_END)
+                    if file.read(1) != b"\n":
+                        data = b"\n" + data  # never glue a record onto a torn line
+                file.write(data)
+        except OSError as e:
+            _logger.error(f"Error appending to order journal: {e}")
+            return False
+        if metrics.enabled():
+            record_io(SAVE_SECONDS, WRITTEN_BYTES,
+                      f"{self.path.stem}.journal", start, len(data))
+        self._journal_stamp = file_stamp(self.journal_path)
+        self._journal_offset = self._journal_stamp[1] if self._journal_stamp else 0
+        self._journal_records += len(records)
+        if self._journal_records >= self.compact_threshold:
+            self._schedule_compaction()
+        return True
+
+    def _write_pending(self) -> bool:
+        if not self._dirty:
+            return True
+        with tracing.span("storage.write", store=self.path.stem, records=len(self._pending)):
+            if self.journal:
+                ok = self._append_journal(self._pending)
+            else:
+                ok = self._write_snapshot(self._orders.records())
+        if ok:
+            self._pending = []
+            self._dirty = False
+        return ok
+
+    def _persist(self, record: Dict[str, Any]) -> bool:
+        self._pending.append(record)
+        self._dirty = True
+        if self._batch_depth:
+            return True
+        return self._write_pending()
+
+    def _schedule_compaction(self) -> None:
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(
+            target=self.compact, name="order-journal-compaction", daemon=True)
+        self._compaction_thread.start()
+
+    def wait_for_compaction(self) -> None:
+        """Block until a running background compaction has finished."""
+        thread = self._compaction_thread
+        if thread is not None:
+            thread.join()
+
+    def compact(self) -> bool:
+        """
+        Fold the journal into the orders file.
+        The journal is rotated under the store lock, so writers only wait for
+        the rename while the snapshot itself is written outside the lock.
+        """
+        with self._compaction_lock.exclusive():
+            with self._file_lock.exclusive(), self._lock:
+                self._refresh()
+                self._write_pending()
+                if self.journal_path.exists():
+                    if self._compacting_path.exists():
+                        # A previous compaction failed; keep its records too
+                        with self._compacting_path.open("a", encoding="utf-8") as target, \
+                                self.journal_path.open("r", encoding="utf-8") as source:
+                            target.write(source.read())
+                        self.journal_path.unlink()
+                    else:
+                        os.replace(self.journal_path, self._compacting_path)
+                self._journal_stamp = None
+                self._journal_offset = 0
+                self._journal_records = 0
+                orders = self._orders.records()
+            tmp_path = self.path.with_name(self.path.name + ".compacted.tmp")
+            start = time.perf_counter()
+            try:
+                with tmp_path.open("wb") as file:
+                    data = self.serializer.dumps(orders)
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+            except OSError as e:
+                _logger.error(f"Error saving orders: {e}")
+                return False
+            if metrics.enabled():
+                record_io(SAVE_SECONDS, WRITTEN_BYTES,
+                          self.path.stem, start, len(data))
+            # Swap the snapshot in and drop the folded journal in one step for other processes
+            with self._file_lock.exclusive(), self._lock:
+                os.replace(tmp_path, self.path)
+                self._snapshot_stamp = file_stamp(self.path)
+                if self._compacting_path.exists():
+                    self._compacting_path.unlink()
+            return True
+
+    @contextmanager
+    def batch(self) -> Iterator["OrderStore"]:
+        """
+        Group several mutations into a single write.
+        Pending changes are written once when the outermost batch exits; if the
+        batch raises, nothing is written and the state from before it is reloaded.
+        """
+        with self._file_lock.exclusive(), self._lock:
+            self._refresh()
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._pending = []
+                    self._dirty = False
+                    self._load()
+                raise
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._write_pending()
+
+    def flush(self) -> bool:
+        """Write pending changes to disk, if there are any."""
+        with self._file_lock.exclusive(), self._lock:
+            return self._write_pending()
+
+    # ---------- queries ----------
+
+    def __len__(self) -> int:
+        self._sync()
+        return len(self._orders)
+
+    def __contains__(self, package_id: Any) -> bool:
+        self._sync()
+        return package_id in self._orders
+
+    def get(self, package_id: Any) -> Optional[Dict[str, Any]]:
+        """Return a copy of the order record, or None if it does not exist."""
+        self._sync()
+        with self._lock:
+            return self._orders.get(package_id)
+
+    def all(self) -> List[Dict[str, Any]]:
+        """Return copies of all order records in insertion order."""
+        self._sync()
+        with self._lock:
+            return self._orders.records()
+
+    def max_package_id(self) -> int:
+        """Return the highest numeric package_id in the store, or 0 if empty."""
+        self._sync()
+        if self._ids_ascending:
+            return next(reversed(self._orders), 0)
+        ids = [pid for pid in self._orders if isinstance(pid, int)]
+        return max(ids, default=0)
+
+    max_key = max_package_id
+
+    def data_version(self) -> int:
+        """
+        Changes when the store reloads its files: after another process rewrote
+        them, or a batch was rolled back. Journal records appended by other
+        processes are replayed and reported to the listeners instead.
+        """
+        self._sync()
+        return self._version
+
+    def find_by(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        return self.query({field: value})[0]
+
+    def query(self, where: Optional[Dict[str, Any]] = None,
+              ranges: Optional[Dict[str, Tuple[Any, Any]]] = None,
+              order_by: Optional[str] = None, descending: bool = False,
+              offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Return one page of matching orders and the total number of matches.
+        Equality conditions on indexed fields narrow the candidates to one index
+        bucket; when no sort is needed only the requested page is copied.
+        """
+        where = where or {}
+        self._sync()
+        with self._lock:
+            table = self._orders
+            indexed = [f for f in where if f in self._indexes]
+            bucket: Optional[Bucket] = None
+            if indexed:
+                bucket = min((self._indexes[f].get(
+                    where[f], ()) for f in indexed), key=len)
+                # Buckets keep the order ids were indexed in, which updates can shuffle;
+                # walk them in store order so filtered pages match unfiltered ones
+                if self._ids_ascending:
+                    pids: List[Any] = sorted(bucket)
+                else:
+                    pids = [pid for pid in table if pid in bucket]
+                candidates: Iterable[Row] = (table.row(pid) for pid in (
+                    reversed(pids) if descending and order_by is None else pids))
+            else:
+                candidates = table.rows(descending)
+
+            if order_by == "package_id" and self._ids_ascending and bucket is None:
+                order_by = None  # insertion order is package_id order
+            if order_by is not None:
+                matches = [row for row in candidates if table.matches(
+                    row, where, ranges)]
+                # As storage.sort_records(): by value, then records without one last
+                matches.sort(key=lambda row: sort_key(
+                    table.value(row, order_by)), reverse=descending)
+                matches.sort(key=lambda row: table.value(
+                    row, order_by) is None)
+                end = None if limit is None else offset + limit
+                return [table.record(row) for row in matches[offset:end]], len(matches)
+
+            # Natural order: walk the candidates and copy only the requested page
+            only_bucket = not ranges and (
+                len(where) == (1 if bucket is not None else 0))
+            total = len(bucket) if bucket is not None else len(self._orders)
+            page: List[Dict[str, Any]] = []
+            seen = 0
+            for row in candidates:
+                if not only_bucket and not table.matches(row, where, ranges):
+                    continue
+                if seen >= offset and (limit is None or len(page) < limit):
+                    page.append(table.record(row))
+                seen += 1
+                if only_bucket and limit is not None and len(page) >= limit:
+                    break
+            return page, (total if only_bucket else seen)
+
+    def _scan_chunk(self, where: Optional[Dict[str, Any]], after: Any, size: int) -> List[Dict[str, Any]]:
+        self._sync()
+        with self._lock:
+            if self._scan_keys is None:
+                self._scan_keys = (list(self._orders) if self._ids_ascending
+                                   else sorted(self._orders, key=sort_key))
+            keys = self._scan_keys
+            # Binary search for the first package_id after the cursor
+            low, high = 0, len(keys)
+            if after is not None:
+                bound = sort_key(after)
+                while low < high:
+                    middle = (low + high) // 2
+                    if sort_key(keys[middle]) <= bound:
+                        low = middle + 1
+                    else:
+                        high = middle
+            chunk: List[Dict[str, Any]] = []
+            for position in range(low, len(keys)):
+                row = self._orders.row(keys[position])
+                if self._orders.matches(row, where, None):
+                    chunk.append(self._orders.record(row))
+                    if len(chunk) >= size:
+                        break
+            return chunk
+
+    # ---------- mutations ----------
+
+    def insert(self, order: Dict[str, Any]) -> bool:
+        """Add a new order record. Returns False if the package_id already exists."""
+        self._join_unit_of_work()
+        with self._file_lock.exclusive(), self._lock:
+            self._refresh()
+            package_id = order.get("package_id")
+            if package_id in self._orders:
+                return False
+            self._note_new_id(package_id)
+            self._orders.put(order)
+            self._index_add(order)
+            self._notify(package_id, order)
+            return self._persist({"op": "insert", "order": dict(order)})
+
+    def update(self, package_id: Any, changes: Dict[str, Any]) -> bool:
+        """Apply field changes to an order. Returns False if the order does not exist."""
+        self._join_unit_of_work()
+        with self._file_lock.exclusive(), self._lock:
+            self._refresh()
+            old = self._orders.get(package_id)
+            if old is None:
+                return False
+            self._index_remove(old)
+            order = self._orders.update(package_id, changes)
+            self._index_add(order)
+            self._notify(package_id, order)
+            return self._persist({"op": "update", "package_id": package_id,
+                                  "changes": dict(changes)})
+
+    def delete(self, package_id: Any) -> bool:
+        """Remove an order. Returns False if the order does not exist."""
+        self._join_unit_of_work()
+        with self._file_lock.exclusive(), self._lock:
+            self._refresh()
+            order = self._orders.pop(package_id)
+            if order is None:
+                return False
+            self._index_remove(order)
+            self._scan_keys = None
+            self._notify(package_id, None)
+            return self._persist({"op": "delete", "package_id": package_id})
+
+    def replace_all(self, orders: List[Dict[str, Any]]) -> None:
+        """Replace every order and rewrite the orders file, immediately even inside a unit of work."""
+        with self._compaction_lock.exclusive(), self._file_lock.exclusive(), self._lock:
+            self._orders = self._new_table(orders)
+            self._rebuild_indexes()
+            self._notify(None, None)
+            self._pending = []
+            self._dirty = False
+            if self._write_snapshot(self._orders.records()):
+                for path in (self.journal_path, self._compacting_path):
+                    if path.exists():
+                        path.unlink()
+                self._journal_stamp = None
+                self._journal_offset = 0
+                self._journal_records = 0
@@ -0,0 +1,151 @@
+"""
+Compact in-memory tables of dict records, used by the file-based stores.
+
+A dict costs a few hundred bytes per record before counting any of its values,
+because every record carries its own hash table of field names. A RecordTable
+keeps the field names once and each record as a tuple of its values in that
+order, and builds a dict only when a record is read. Values of the fields
+named in `shared` (statuses, customer and address IDs, cities, ...) are kept
+once per distinct value: json.loads creates a new string or large int for
+every occurrence, so a million orders would otherwise hold a million copies
+of a handful of statuses.
+
+Rows are kept in insertion order and keyed by the `key` field, so a table
+holds one record per key.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Stands for a field a record does not have; rows shorter than the layout lack the trailing fields
+_MISSING = object()
+
+Row = Tuple[Any, ...]
+
+
+class RecordTable:
+    """Dict records stored as tuples of their values over one shared field layout."""
+
+    def __init__(self, key: str, records: Iterable[Dict[str, Any]] = (), shared: Iterable[str] = ()) -> None:
+        self.key = key
+        self._fields: Tuple[str, ...] = ()
+        self._position: Dict[str, int] = {}
+        self._shared_fields = frozenset(shared)
+        self._shared_positions: Tuple[int, ...] = ()
+        self._shared_values: Dict[Any, Any] = {}
+        self._rows: Dict[Any, Row] = {}
+        for record in records:
+            self.put(record)
+
+    # ---------- rows ----------
+
+    def _add_field(self, field: str) -> int:
+        position = self._position[field] = len(self._fields)
+        self._fields += (field,)
+        if field in self._shared_fields:
+            self._shared_positions += (position,)
+        return position
+
+    def _row(self, record: Dict[str, Any]) -> Row:
+        if tuple(record) == self._fields:
+            values = list(record.values())
+        else:
+            values = [_MISSING] * len(self._fields)
+            for field, value in record.items():
+                position = self._position.get(field)
+                if position is None:
+                    position = self._add_field(field)
+                    values.append(value)
+                else:
+                    values[position] = value
+        shared = self._shared_values
+        for position in self._shared_positions:
+            value = values[position]
+            try:
+                values[position] = shared.setdefault(value, value)
+            except TypeError:  # unhashable; keep this record's own copy
+                pass
+        return tuple(values)
+
+    def record(self, row: Row) -> Dict[str, Any]:
+        """Build the dict of a row."""
+        record = dict(zip(self._fields, row))
+        if _MISSING in row:
+            record = {field: value for field,
+                      value in record.items() if value is not _MISSING}
+        return record
+
+    def value(self, row: Row, field: str) -> Any:
+        """Return a field of a row, or None if the record does not have it."""
+        position = self._position.get(field)
+        if position is None or position >= len(row):
+            return None
+        value = row[position]
+        return None if value is _MISSING else value
+
+    def matches(self, row: Row, where: Optional[Dict[str, Any]],
+                ranges: Optional[Dict[str, Tuple[Any, Any]]]) -> bool:
+        """storage.matches_query() for a row."""
+        for field, expected in (where or {}).items():
+            if self.value(row, field) != expected:
+                return False
+        for field, (low, high) in (ranges or {}).items():
+            value = self.value(row, field)
+            if value is None or (low is not None and value < low) or (high is not None and value > high):
+                return False
+        return True
+
+    def row(self, key_value: Any) -> Optional[Row]:
+        return self._rows.get(key_value)
+
+    def rows(self, descending: bool = False) -> Iterable[Row]:
+        """Rows in insertion order, or the reverse."""
+        return reversed(self._rows.values()) if descending else self._rows.values()
+
+    # ---------- records ----------
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key_value: Any) -> bool:
+        return key_value in self._rows
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._rows)
+
+    def __reversed__(self) -> Iterator[Any]:
+        return reversed(self._rows)
+
+    def get(self, key_value: Any) -> Optional[Dict[str, Any]]:
+        """Return a new dict of the record, or None if there is none."""
+        row = self._rows.get(key_value)
+        return self.record(row) if row is not None else None
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Return new dicts of every record in insertion order."""
+        return [self.record(row) for row in self._rows.values()]
+
+    def put(self, record: Dict[str, Any]) -> None:
+        """Add a record, or replace the one with the same key in its place."""
+        self._rows[record.get(self.key)] = self._row(record)
+
+    def update(self, key_value: Any, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Apply changes to a record and return its new dict, or None if there is none.
+        A changed key moves the record to the new key, keeping its place.
+        """
+        row = self._rows.get(key_value)
+        if row is None:
+            return None
+        record = self.record(row)
+        record.update(changes)
+        new_key = record.get(self.key)
+        if new_key == key_value:
+            self._rows[key_value] = self._row(record)
+        else:
+            self._rows = {(new_key if k == key_value else k): (self._row(record) if k == key_value else r)
+                          for k, r in self._rows.items() if k != new_key}
+        return record
+
+    def pop(self, key_value: Any) -> Optional[Dict[str, Any]]:
+        """Remove a record and return its dict, or None if there is none."""
+        row = self._rows.pop(key_value, None)
+        return self.record(row) if row is not None else None
@@ -0,0 +1,117 @@
+"""
+Encodings for the record files written by the file-based stores.
+
+The encoding of new files is chosen with DISPATCH_SERIALIZER:
+    "json"    compact JSON (the default)
+    "pretty"  indented JSON, the format the data files were originally written in
+    "msgpack" MessagePack, needs the optional msgpack package
+
+Binary files start with a short header naming their format, so reading never
+depends on the configuration: any store reads files in every format,
+including the legacy pretty-printed JSON, and writes them back in the
+configured one. File names keep their .json suffix whatever the encoding.
+
+There is deliberately no pickle format: unpickling runs code, so anyone able
+to write to the data directory could take over every worker.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; only the "msgpack" format needs it
+    msgpack = None
+
+import config
+
+
+class DecodeError(ValueError):
+    """Raised when a file's content cannot be decoded."""
+
+
+class Serializer:
+    """Converts a store's records to bytes and back."""
+    name = ""
+    header = b""
+
+    def dumps(self, records: Any) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+
+class JsonSerializer(Serializer):
+    """UTF-8 JSON; compact unless an indent is given."""
+
+    def __init__(self, indent: Optional[int] = None) -> None:
+        self.indent = indent
+        self.name = "json" if indent is None else "pretty"
+        self._separators = (",", ":") if indent is None else None
+
+    def dumps(self, records: Any) -> bytes:
+        return json.dumps(records, indent=self.indent, separators=self._separators,
+                          ensure_ascii=False).encode("utf-8")
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class MsgpackSerializer(Serializer):
+    name = "msgpack"
+    header = b"\x00msgpack\n"
+
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise RuntimeError(
+                "The msgpack format needs the msgpack package (pip install msgpack)")
+
+    def dumps(self, records: Any) -> bytes:
+        return self.header + msgpack.packb(records, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(memoryview(data)[len(self.header):], raw=False, strict_map_key=False)
+
+
+_FORMATS = {
+    "json": JsonSerializer,
+    "pretty": lambda: JsonSerializer(indent=4),
+    "msgpack": MsgpackSerializer,
+}
+_serializers: Dict[str, Serializer] = {}
+
+
+def get(name: str) -> Serializer:
+    """Return the serializer for a format name."""
+    serializer = _serializers.get(name)
+    if serializer is None:
+        try:
+            factory = _FORMATS[name]
+        except KeyError:
+            raise ValueError(
+                f"Unknown serializer: {name} (choose from {', '.join(_FORMATS)})")
+        serializer = _serializers[name] = factory()
+    return serializer
+
+
+def configured() -> Serializer:
+    """Return the serializer new files are written with."""
+    return get(config.SERIALIZER)
+
+
+def loads(data: bytes) -> Any:
+    """Decode data written by any of the serializers. Raises DecodeError if it is unreadable."""
+    if data.startswith(MsgpackSerializer.header):
+        serializer = get("msgpack")
+    else:
+        serializer = get("json")
+    try:
+        return serializer.loads(data)
+    except Exception as e:
+        raise DecodeError(f"Invalid {serializer.name} data: {e}") from e
+
+
+def load_file(path: Union[str, Path]) -> Any:
+    """Read and decode a whole file. Raises DecodeError if its content is unreadable."""
+    return loads(Path(path).read_bytes())
@@ -0,0 +1,148 @@
+"""
+Server-side login sessions.
+
+The session cookie only carries a random session id; the logged-in user is
+kept here. Sessions are stored in a small SQLite table shared by every worker
+process (config.SESSION_PATH), so a request can land on any worker, with an
+in-memory LRU in front of it, so resolving the user of a request is usually a
+single dict lookup.
+
+A session cached in memory is checked against the table at most every
+`recheck` seconds of use; that one statement also extends its lifetime there.
+A logout in one worker therefore takes effect in the others within `recheck`
+seconds, and a session may expire up to `recheck` seconds early in a worker
+it was not used in. Without a path the sessions live only in the memory of
+the process that created them.
+"""
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple, Union
+
+import config
+
+
+class UserSession(NamedTuple):
+    """The user a session id was issued to. user never contains the password."""
+    user_type: str
+    user_id: str
+    user: Dict[str, Any]
+
+
+class SessionStore:
+    """
+    Maps session ids to UserSession objects.
+
+    Each session expires ttl seconds after it was last used. When more than
+    max_sessions are cached the least recently used one is dropped from
+    memory, and from the store altogether if there is no shared table.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_sessions: Optional[int] = None,
+                 clock: Callable[[], float] = time.time, path: Optional[Union[str, Path]] = None,
+                 recheck: Optional[float] = None) -> None:
+        self.ttl = config.SESSION_TTL if ttl is None else ttl
+        self.max_sessions = max(
+            1, config.SESSION_CACHE_SIZE if max_sessions is None else max_sessions)
+        self.path = Path(path) if path is not None else None
+        self.recheck = config.SESSION_RECHECK_SECONDS if recheck is None else recheck
+        self._clock = clock
+        # session id -> (session, expires at, when the shared table was last checked)
+        self._sessions: "OrderedDict[str, Tuple[UserSession, float, float]]" = OrderedDict(
+        )
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "sid TEXT PRIMARY KEY, user_type TEXT, user_id TEXT, user TEXT, expires_at REAL)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, session_id: str, user_session: UserSession, expires_at: float, checked_at: float) -> None:
+        """Cache a session; the caller holds self._lock."""
+        self._sessions[session_id] = (user_session, expires_at, checked_at)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def create(self, user_type: str, user_id: str, user: Dict[str, Any]) -> str:
+        """Open a session for the user and return its new id."""
+        session_id = secrets.token_urlsafe(32)
+        now = self._clock()
+        user_session = UserSession(user_type, user_id, user)
+        conn = self._connection()
+        if conn is not None:
+            with conn:
+                # Expired sessions are dropped as new ones are opened
+                conn.execute(
+                    "DELETE FROM sessions WHERE expires_at <= ?", (now,))
+                conn.execute("INSERT INTO sessions (sid, user_type, user_id, user, expires_at) VALUES (?, ?, ?, ?, ?)",
+                             (session_id, user_type, user_id, json.dumps(user, default=str), now + self.ttl))
+        with self._lock:
+            self._remember(session_id, user_session, now + self.ttl, now)
+        return session_id
+
+    def get(self, session_id: Optional[str]) -> Optional[UserSession]:
+        """Return the session's user and extend its lifetime, or None if it is unknown or expired."""
+        if not session_id:
+            return None
+        now = self._clock()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                user_session, expires_at, checked_at = entry
+                if expires_at > now and (self.path is None or now - checked_at < self.recheck):
+                    self._sessions[session_id] = (
+                        user_session, now + self.ttl, checked_at)
+                    self._sessions.move_to_end(session_id)
+                    return user_session
+                del self._sessions[session_id]
+                if self.path is None:
+                    return None
+        conn = self._connection()
+        if conn is None:
+            return None
+        # Extends the session if it is still open, whichever worker last used it
+        with conn:
+            extended = conn.execute("UPDATE sessions SET expires_at = ? WHERE sid = ? AND expires_at > ?",
+                                    (now + self.ttl, session_id, now)).rowcount
+        if not extended:
+            return None
+        row = conn.execute(
+            "SELECT user_type, user_id, user FROM sessions WHERE sid = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        user_session = UserSession(row[0], row[1], json.loads(row[2]))
+        with self._lock:
+            self._remember(session_id, user_session, now + self.ttl, now)
+        return user_session
+
+    def delete(self, session_id: Optional[str]) -> None:
+        """Close a session; unknown ids are ignored."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        conn = self._connection()
+        if conn is not None and session_id:
+            with conn:
+                conn.execute(
+                    "DELETE FROM sessions WHERE sid = ?", (session_id,))
+
+    def __len__(self) -> int:
+        """The number of sessions cached in this process."""
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,147 @@
+import heapq
+import math
+import threading
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+Point = Tuple[float, float]
+Cell = Tuple[int, int]
+
+
+class GridSpatialIndex:
+    """
+    Uniform grid (bucket) index over 2D points such as (latitude, longitude).
+
+    Each item lives in the square cell that contains it. Nearest-neighbour
+    queries search rings of cells outwards from the query point and stop as
+    soon as no unvisited cell can hold a closer item, so a query only looks at
+    the items near the query point instead of the whole collection.
+    Distances are Euclidean in coordinate units, matching the assignment code.
+    """
+
+    def __init__(self, cell_size: float = 0.01) -> None:
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        self.cell_size = cell_size
+        self._positions: Dict[Hashable, Point] = {}
+        self._cells: Dict[Cell, Set[Hashable]] = {}
+        self._lock = threading.RLock()
+        # Bounding box of cells that have ever been occupied; limits ring growth
+        self._min_cell: Optional[Cell] = None
+        self._max_cell: Optional[Cell] = None
+
+    def _cell_of(self, point: Point) -> Cell:
+        return (math.floor(point[0] / self.cell_size), math.floor(point[1] / self.cell_size))
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, item_id: Hashable) -> bool:
+        return item_id in self._positions
+
+    def position(self, item_id: Hashable) -> Optional[Point]:
+        """Return the indexed position of an item, or None if it is not indexed."""
+        return self._positions.get(item_id)
+
+    def insert(self, item_id: Hashable, point: Point) -> None:
+        """Add an item, or move it if it is already indexed."""
+        point = (float(point[0]), float(point[1]))
+        with self._lock:
+            self.remove(item_id)
+            cell = self._cell_of(point)
+            self._positions[item_id] = point
+            self._cells.setdefault(cell, set()).add(item_id)
+            if self._min_cell is None:
+                self._min_cell = self._max_cell = cell
+            else:
+                self._min_cell = (min(self._min_cell[0], cell[0]), min(
+                    self._min_cell[1], cell[1]))
+                self._max_cell = (max(self._max_cell[0], cell[0]), max(
+                    self._max_cell[1], cell[1]))
+
+    update = insert
+
+    def remove(self, item_id: Hashable) -> bool:
+        """Remove an item. Returns False if it was not indexed."""
+        with self._lock:
+            point = self._positions.pop(item_id, None)
+            if point is None:
+                return False
+            cell = self._cell_of(point)
+            bucket = self._cells[cell]
+            bucket.discard(item_id)
+            if not bucket:
+                del self._cells[cell]
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._positions.clear()
+            self._cells.clear()
+            self._min_cell = self._max_cell = None
+
+    def _ring(self, center: Cell, radius: int) -> Iterable[Cell]:
+        cx, cy = center
+        if radius == 0:
+            yield center
+            return
+        for dx in range(-radius, radius + 1):
+            yield (cx + dx, cy - radius)
+            yield (cx + dx, cy + radius)
+        for dy in range(-radius + 1, radius):
+            yield (cx - radius, cy + dy)
+            yield (cx + radius, cy + dy)
+
+    def _max_radius(self, center: Cell) -> int:
+        return max(abs(center[0] - self._min_cell[0]), abs(center[0] - self._max_cell[0]),
+                   abs(center[1] - self._min_cell[1]), abs(center[1] - self._max_cell[1]))
+
+    def k_nearest(self, point: Point, k: int,
+                  predicate: Optional[Callable[[Hashable], bool]] = None) -> List[Tuple[Hashable, float]]:
+        """
+        Return up to k (item_id, distance) pairs closest to point, nearest first.
+        Items for which predicate(item_id) is False are skipped.
+        """
+        if k <= 0:
+            return []
+        with self._lock:
+            if not self._positions:
+                return []
+            x, y = point
+            center = self._cell_of(point)
+            max_radius = self._max_radius(center)
+            # Max-heap of the best k candidates as (-distance, tiebreak, item_id)
+            best: List[Tuple[float, int, Hashable]] = []
+            counter = 0
+            radius = 0
+            while radius <= max_radius:
+                if (2 * radius + 1) ** 2 > len(self._cells):
+                    # The ring has grown past the number of occupied cells; finish
+                    # by visiting the remaining occupied cells directly.
+                    cells = [c for c in self._cells
+                             if max(abs(c[0] - center[0]), abs(c[1] - center[1])) >= radius]
+                    radius = max_radius
+                else:
+                    cells = self._ring(center, radius)
+                for cell in cells:
+                    for item_id in self._cells.get(cell, ()):
+                        if predicate is not None and not predicate(item_id):
+                            continue
+                        px, py = self._positions[item_id]
+                        distance = math.hypot(px - x, py - y)
+                        counter += 1
+                        if len(best) < k:
+                            heapq.heappush(best, (-distance, counter, item_id))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(
+                                best, (-distance, counter, item_id))
+                # Every unvisited cell is at least `radius` whole cells away
+                if len(best) == k and -best[0][0] <= radius * self.cell_size:
+                    break
+                radius += 1
+            return [(item_id, -neg) for neg, _, item_id in sorted(best, reverse=True)]
+
+    def nearest(self, point: Point,
+                predicate: Optional[Callable[[Hashable], bool]] = None) -> Optional[Tuple[Hashable, float]]:
+        """Return the (item_id, distance) pair closest to point, or None if nothing matches."""
+        found = self.k_nearest(point, 1, predicate)
+        return found[0] if found else None
@@ -0,0 +1,855 @@
+"""
+Record repositories for the dispatch system's entities.
+
+Every entity (orders, couriers, customers, managers, addresses, courier positions) is stored as a
+collection of dict records keyed by a primary-key field. repository() returns
+the Repository for an entity according to config.STORAGE_BACKEND:
+
+- "json":   one JSON list file per entity, as the system has always used
+            (orders use the in-memory OrderStore).
+- "sqlite": one table per entity in a single SQLite database, with the primary
+            key and foreign-key columns indexed and batch() as a transaction.
+
+unit_of_work() groups the changes one thread makes to several repositories so
+that each repository is written once, or not at all if the work fails.
+"""
+import heapq
+import json
+import logging
+import re
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import config
+import metrics
+import serialization
+import tracing
+from file_lock import FileLock, atomic_write
+from record_table import RecordTable
+
+
+_logger = logging.getLogger(__name__)
+
+# Data file I/O of the json backend, labelled by file name (orders, courier, customers, ...)
+LOAD_SECONDS = metrics.histogram(
+    "storage_load_seconds", "Time spent reading and decoding a data file", ("store",))
+SAVE_SECONDS = metrics.histogram(
+    "storage_save_seconds", "Time spent encoding and writing a data file", ("store",))
+READ_BYTES = metrics.counter(
+    "storage_read_bytes_total", "Bytes read from data files", ("store",))
+WRITTEN_BYTES = metrics.counter(
+    "storage_written_bytes_total", "Bytes written to data files", ("store",))
+CACHE_LOOKUPS = metrics.counter(
+    "storage_cache_lookups_total",
+    "Reads served from the in-memory copy of a data file (hit) or after reloading it (miss)", ("store", "result"))
+
+
+def record_io(seconds: metrics.Histogram, volume: metrics.Counter, store: str, start: float, size: int) -> None:
+    """Observe one data file read or write that began at perf_counter() time start."""
+    seconds.observe(time.perf_counter() - start, (store,))
+    volume.inc((store,), size)
+
+
+# entity name -> (primary key, indexed columns)
+ENTITIES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "orders": ("package_id", ("customer_id", "courier_id", "destination_id", "status", "created_at")),
+    "couriers": ("courier_id", ("current_location",)),
+    "customers": ("customer_id", ()),
+    "managers": ("manager_id", ()),
+    "addresses": ("id", ()),
+    "courier_positions": ("courier_id", ()),
+}
+
+# entity name -> fields whose values repeat across records; the file-based stores keep one copy of each value
+SHARED_VALUES: Dict[str, Tuple[str, ...]] = {
+    "orders": ("customer_id", "courier_id", "origin_id", "destination_id", "status"),
+    "couriers": ("address_id", "current_location"),
+    "addresses": ("street", "city", "postal_code", "country"),
+}
+
+
+def file_stamp(path: Path) -> Optional[Tuple[int, int, int]]:
+    """Return the (mtime, size, inode) stamp of a file, or None if it does not exist."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def matches_query(record: Dict[str, Any], where: Optional[Dict[str, Any]],
+                  ranges: Optional[Dict[str, Tuple[Any, Any]]]) -> bool:
+    """Check a record against Repository.query() equality and range conditions."""
+    for field, value in (where or {}).items():
+        if record.get(field) != value:
+            return False
+    for field, (low, high) in (ranges or {}).items():
+        value = record.get(field)
+        if value is None or (low is not None and value < low) or (high is not None and value > high):
+            return False
+    return True
+
+
+def sort_key(value: Any) -> tuple:
+    """Sort key that puts None last and never compares numbers with strings."""
+    if value is None:
+        return (2, 0)
+    if isinstance(value, (int, float)):
+        return (0, value)
+    return (1, str(value))
+
+
+def sort_records(records: List[Dict[str, Any]], field: str, descending: bool = False) -> None:
+    """Sort records in place by field, keeping records without a value last in both directions."""
+    records.sort(key=lambda r: sort_key(r.get(field)), reverse=descending)
+    records.sort(key=lambda r: r.get(field) is None)
+
+
+class Repository(ABC):
+    """
+    A collection of dict records keyed by the `key` field.
+    Methods return copies, so callers may modify what they get back.
+    """
+    key: str
+    # Records read per step by scan()
+    scan_chunk_size = 500
+
+    @abstractmethod
+    def get(self, key_value: Any) -> Optional[Dict[str, Any]]:
+        """Return the record with the given key, or None."""
+
+    @abstractmethod
+    def all(self) -> List[Dict[str, Any]]:
+        """Return every record in insertion order."""
+
+    def find_by(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        """Return the records whose field equals value."""
+        return [r for r in self.all() if r.get(field) == value]
+
+    def query(self, where: Optional[Dict[str, Any]] = None,
+              ranges: Optional[Dict[str, Tuple[Any, Any]]] = None,
+              order_by: Optional[str] = None, descending: bool = False,
+              offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Return one page of matching records and the total number of matches.
+
+        where maps fields to required values; ranges maps fields to inclusive
+        (low, high) bounds, either of which may be None. Records are sorted by
+        order_by (insertion order if None) and the page is records[offset:offset + limit].
+        """
+        matches = [r for r in self.all() if matches_query(r, where, ranges)]
+        if order_by is not None:
+            sort_records(matches, order_by, descending)
+        elif descending:
+            matches.reverse()
+        end = None if limit is None else offset + limit
+        return matches[offset:end], len(matches)
+
+    def scan(self, where: Optional[Dict[str, Any]] = None, after: Any = None,
+             limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the records matching where in ascending key order, starting after the key `after`.
+
+        Records are read scan_chunk_size at a time and nothing is locked between
+        chunks, so exporting a whole collection never holds more than one chunk.
+        The key of the last record yielded is the cursor to resume from.
+        """
+        while limit is None or limit > 0:
+            size = self.scan_chunk_size if limit is None else min(
+                self.scan_chunk_size, limit)
+            chunk = self._scan_chunk(where, after, size)
+            yield from chunk
+            if len(chunk) < size:
+                return
+            after = chunk[-1].get(self.key)
+            if limit is not None:
+                limit -= len(chunk)
+
+    def _scan_chunk(self, where: Optional[Dict[str, Any]], after: Any, size: int) -> List[Dict[str, Any]]:
+        """Return up to size records matching where whose key sorts after `after`, in key order."""
+        return self._smallest_keys(self.all(), where, after, size)
+
+    def _smallest_keys(self, records: Iterable[Dict[str, Any]], where: Optional[Dict[str, Any]],
+                       after: Any, size: int) -> List[Dict[str, Any]]:
+        lower = None if after is None else sort_key(after)
+        candidates = (r for r in records if matches_query(r, where, None)
+                      and (lower is None or sort_key(r.get(self.key)) > lower))
+        return heapq.nsmallest(size, candidates, key=lambda r: sort_key(r.get(self.key)))
+
+    @abstractmethod
+    def insert(self, record: Dict[str, Any]) -> bool:
+        """Add a record. Returns False if its key already exists."""
+
+    @abstractmethod
+    def update(self, key_value: Any, changes: Dict[str, Any]) -> bool:
+        """Apply field changes to a record. Returns False if it does not exist."""
+
+    @abstractmethod
+    def delete(self, key_value: Any) -> bool:
+        """Remove a record. Returns False if it does not exist."""
+
+    @abstractmethod
+    def replace_all(self, records: List[Dict[str, Any]]) -> None:
+        """Replace the whole collection."""
+
+    @contextmanager
+    def batch(self) -> Iterator["Repository"]:
+        """
+        Group several changes into one write, discarding them if the block raises.
+        The default writes each change immediately.
+        """
+        yield self
+
+    def _join_unit_of_work(self) -> None:
+        """Called before every change: stage it in the thread's unit of work, if one is open."""
+        work = getattr(_active_work, "current", None)
+        if work is not None:
+            work.join(self)
+
+    def data_version(self) -> int:
+        """
+        Return a number that changes whenever another process changed the stored
+        records, so callers that keep derived data in memory know when to rebuild it.
+        """
+        return 0
+
+    def add_listener(self, listener: Callable[[Any, Optional[Dict[str, Any]]], None]) -> None:
+        """
+        Register listener(key, record), called with a copy of the record after
+        this process inserts or updates it, with record None after a delete,
+        and with key and record both None after replace_all().
+        Changes not reported this way (rolled-back batches, changes by other
+        processes) change data_version() instead. Bound methods are held weakly.
+        """
+        ref = weakref.WeakMethod(listener) if hasattr(
+            listener, "__self__") else (lambda: listener)
+        # Copied on write, so _notify() can iterate without a lock
+        self._listeners = getattr(self, "_listeners", []) + [ref]
+
+    def _notify(self, key_value: Any, record: Optional[Dict[str, Any]]) -> None:
+        refs = getattr(self, "_listeners", None)
+        if not refs:
+            return
+        alive = []
+        for ref in refs:
+            listener = ref()
+            if listener is not None:
+                listener(key_value, dict(record)
+                         if record is not None else None)
+                alive.append(ref)
+        if len(alive) < len(refs):
+            self._listeners = alive
+
+    def _notify_update(self, old_key: Any, record: Dict[str, Any]) -> None:
+        """Report an updated record, as a delete and an insert if its key changed."""
+        if record.get(self.key) != old_key:
+            self._notify(old_key, None)
+        self._notify(record.get(self.key), record)
+
+    def max_key(self) -> int:
+        """Return the highest numeric key, or 0 if there is none."""
+        keys = [r.get(self.key) for r in self.all()]
+        return max((k for k in keys if isinstance(k, int)), default=0)
+
+    def __contains__(self, key_value: Any) -> bool:
+        return self.get(key_value) is not None
+
+    def __len__(self) -> int:
+        return len(self.all())
+
+
+class JsonRepository(Repository):
+    """
+    Records kept as a list in a single file, written with the configured
+    serializer (compact JSON by default) and read back in any format.
+
+    The parsed records are cached per process in a RecordTable (one tuple of
+    values per record, one record per key) together with the file's
+    (mtime, size, inode) stamp. Every operation re-checks the stamp with one
+    stat() call and only re-parses the file when another writer changed it, so
+    repeated reads cost a dictionary lookup. Each change rewrites the file,
+    except inside batch(), where the file is written once when the batch ends
+    (or not at all if the batch raises).
+
+    Several processes may share the file: the file is parsed under a shared
+    lock, every change (or whole batch) re-reads and rewrites it under an
+    exclusive lock, and the new content replaces the file atomically, so no
+    process loses another's changes or reads a half-written file.
+    """
+
+    def __init__(self, path: Union[str, Path], key: str,
+                 serializer: Optional[serialization.Serializer] = None, shared: Tuple[str, ...] = ()) -> None:
+        self.path = Path(path)
+        self.key = key
+        self.serializer = serializer or serialization.configured()
+        self.shared = shared
+        self._lock = threading.RLock()
+        self._cache: Optional[RecordTable] = None
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        self._batch_records: Optional[RecordTable] = None
+        self._batch_depth = 0
+        self._batch_dirty = False
+        self._file_lock = FileLock(self.path)
+        self._version = 0
+
+    def _table(self, records: Iterable[Dict[str, Any]] = ()) -> RecordTable:
+        return RecordTable(self.key, records, shared=self.shared)
+
+    def _parse(self) -> RecordTable:
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            return self._table()
+        start = time.perf_counter()
+        try:
+            records = serialization.load_file(self.path)
+            if metrics.enabled():
+                record_io(LOAD_SECONDS, READ_BYTES, self.path.stem,
+                          start, self.path.stat().st_size)
+        except serialization.DecodeError:
+            _logger.warning(
+                f"{self.path} is empty or contains invalid data. Starting with empty data.")
+            return self._table()
+        return self._table(records if isinstance(records, list) else [])
+
+    def _read(self) -> RecordTable:
+        if self._batch_records is not None:
+            return self._batch_records
+        if self._cache is None or file_stamp(self.path) != self._stamp:
+            CACHE_LOOKUPS.inc((self.path.stem, "miss"))
+            with self._file_lock.shared():
+                self._stamp = file_stamp(self.path)
+                self._cache = self._parse()
+            self._version += 1
+        else:
+            CACHE_LOOKUPS.inc((self.path.stem, "hit"))
+        return self._cache
+
+    def invalidate(self) -> None:
+        """Drop the cached records so the next operation re-reads the file."""
+        with self._lock:
+            self._cache = None
+
+    def data_version(self) -> int:
+        with self._lock:
+            self._read()
+            return self._version
+
+    def _write(self, records: RecordTable) -> None:
+        if self._batch_depth:
+            self._batch_records = records
+            self._batch_dirty = True
+            return
+        start = time.perf_counter()
+        try:
+            with tracing.span("storage.write", store=self.path.stem), \
+                    self._file_lock.exclusive(), atomic_write(self.path, encoding=None) as f:
+                data = self.serializer.dumps(records.records())
+                f.write(data)
+        except BaseException:
+            self.invalidate()
+            raise
+        if metrics.enabled():
+            record_io(SAVE_SECONDS, WRITTEN_BYTES,
+                      self.path.stem, start, len(data))
+        self._cache = records
+        self._stamp = file_stamp(self.path)
+
+    @contextmanager
+    def batch(self) -> Iterator["JsonRepository"]:
+        with self._lock, self._file_lock.exclusive():
+            if self._batch_depth == 0:
+                self._batch_records = self._read()
+                self._batch_dirty = False
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    # Discard the batch; cached records may have been changed in place
+                    self._batch_records = None
+                    self.invalidate()
+                raise
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                records, dirty = self._batch_records, self._batch_dirty
+                self._batch_records = None
+                if dirty:
+                    self._write(records)
+
+    def get(self, key_value: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._read().get(key_value)
+
+    def __contains__(self, key_value: Any) -> bool:
+        with self._lock:
+            return key_value in self._read()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._read())
+
+    def all(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self._read().records()
+
+    def _scan_chunk(self, where: Optional[Dict[str, Any]], after: Any, size: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            records = self._read()
+            return self._smallest_keys(map(records.record, records.rows()), where, after, size)
+
+    # Changes are made to the cached table in place; a failed write or batch
+    # drops it (invalidate()), so the next read parses the file again.
+
+    def insert(self, record: Dict[str, Any]) -> bool:
+        self._join_unit_of_work()
+        with self._lock, self._file_lock.exclusive():
+            records = self._read()
+            if record.get(self.key) in records:
+                return False
+            records.put(record)
+            self._write(records)
+            self._notify(record.get(self.key), record)
+            return True
+
+    def update(self, key_value: Any, changes: Dict[str, Any]) -> bool:
+        self._join_unit_of_work()
+        with self._lock, self._file_lock.exclusive():
+            records = self._read()
+            record = records.update(key_value, changes)
+            if record is None:
+                return False
+            self._write(records)
+            self._notify_update(key_value, record)
+            return True
+
+    def delete(self, key_value: Any) -> bool:
+        self._join_unit_of_work()
+        with self._lock, self._file_lock.exclusive():
+            records = self._read()
+            if records.pop(key_value) is None:
+                return False
+            self._write(records)
+            self._notify(key_value, None)
+            return True
+
+    def replace_all(self, records: List[Dict[str, Any]]) -> None:
+        self._join_unit_of_work()
+        with self._lock, self._file_lock.exclusive():
+            self._write(self._table(records))
+            self._notify(None, None)
+
+
+class SqliteDatabase:
+    """
+    A SQLite database file shared by all SqliteRepository tables.
+    One connection is shared by the threads of a process and guarded by a lock;
+    batch() wraps the changes of all tables in a single transaction.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), timeout=30,
+                                    isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.lock = threading.RLock()
+        self._depth = 0
+        self.rollbacks = 0
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the enclosed statements atomically; nested calls join the outer transaction."""
+        with self.lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self.conn
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("ROLLBACK")
+                    self.rollbacks += 1
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.execute("COMMIT")
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+class SqliteRepository(Repository):
+    """
+    Records stored in one SQLite table.
+    The primary key and the indexed columns are real (indexed) columns, and the
+    full record is kept as JSON in the `data` column so no field is ever lost.
+    """
+
+    def __init__(self, db: SqliteDatabase, table: str, key: str, indexed: Tuple[str, ...] = ()) -> None:
+        self.db = db
+        self.table = table
+        self.key = key
+        self.indexed = tuple(indexed)
+        columns = "".join(f", {c}" for c in self.indexed)
+        with self.db.lock:
+            self.db.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ({key} PRIMARY KEY{columns}, data TEXT NOT NULL)")
+            existing = {row[1] for row in self.db.conn.execute(
+                f"PRAGMA table_info({table})")}
+            for column in self.indexed:
+                if column not in existing:
+                    # Column added after the table was created; backfill it from the records
+                    self.db.conn.execute(
+                        f"ALTER TABLE {table} ADD COLUMN {column}")
+                    self.db.conn.execute(
+                        f"UPDATE {table} SET {column} = json_extract(data, '$.{column}')")
+            for column in self.indexed:
+                self.db.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})")
+
+    def _row(self, record: Dict[str, Any]) -> tuple:
+        return ((record.get(self.key),) + tuple(record.get(c) for c in self.indexed)
+                + (json.dumps(record, ensure_ascii=False),))
+
+    def _upsert_sql(self, verb: str) -> str:
+        columns = ", ".join((self.key,) + self.indexed + ("data",))
+        marks = ", ".join("?" * (len(self.indexed) + 2))
+        return f"{verb} INTO {self.table} ({columns}) VALUES ({marks})"
+
+    @contextmanager
+    def batch(self) -> Iterator["SqliteRepository"]:
+        with self.db.transaction():
+            yield self
+
+    def get(self, key_value: Any) -> Optional[Dict[str, Any]]:
+        with self.db.lock:
+            row = self.db.conn.execute(
+                f"SELECT data FROM {self.table} WHERE {self.key} = ?", (key_value,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def all(self) -> List[Dict[str, Any]]:
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                f"SELECT data FROM {self.table} ORDER BY rowid").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def find_by(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        if field == self.key:
+            record = self.get(value)
+            return [record] if record else []
+        if field not in self.indexed:
+            return super().find_by(field, value)
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                f"SELECT data FROM {self.table} WHERE {field} = ? ORDER BY rowid", (value,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def _column(self, field: str) -> str:
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", field):
+            raise ValueError(f"Invalid field name: {field}")
+        if field == self.key or field in self.indexed:
+            return field
+        return f"json_extract(data, '$.{field}')"
+
+    def _conditions(self, where: Optional[Dict[str, Any]],
+                    ranges: Optional[Dict[str, Tuple[Any, Any]]]) -> Tuple[List[str], List[Any]]:
+        conditions: List[str] = []
+        params: List[Any] = []
+        for field, value in (where or {}).items():
+            if value is None:
+                conditions.append(f"{self._column(field)} IS NULL")
+            else:
+                conditions.append(f"{self._column(field)} = ?")
+                params.append(value)
+        for field, (low, high) in (ranges or {}).items():
+            column = self._column(field)
+            conditions.append(f"{column} IS NOT NULL")
+            if low is not None:
+                conditions.append(f"{column} >= ?")
+                params.append(low)
+            if high is not None:
+                conditions.append(f"{column} <= ?")
+                params.append(high)
+        return conditions, params
+
+    def query(self, where: Optional[Dict[str, Any]] = None,
+              ranges: Optional[Dict[str, Tuple[Any, Any]]] = None,
+              order_by: Optional[str] = None, descending: bool = False,
+              offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        conditions, params = self._conditions(where, ranges)
+        where_sql = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        direction = "DESC" if descending else "ASC"
+        if order_by is None:
+            order_sql = f" ORDER BY rowid {direction}"
+        else:
+            column = self._column(order_by)
+            # NULLs last in both directions, like sort_records()
+            order_sql = f" ORDER BY {column} IS NULL, {column} {direction}, rowid"
+        page_sql = " LIMIT ? OFFSET ?" if limit is not None else ""
+        page_params = [limit, offset] if limit is not None else []
+        with self.db.lock:
+            total = self.db.conn.execute(
+                f"SELECT COUNT(*) FROM {self.table}{where_sql}", params).fetchone()[0]
+            rows = self.db.conn.execute(
+                f"SELECT data FROM {self.table}{where_sql}{order_sql}{page_sql}",
+                params + page_params).fetchall()
+        if limit is None and offset:
+            rows = rows[offset:]
+        return [json.loads(row[0]) for row in rows], total
+
+    def _scan_chunk(self, where: Optional[Dict[str, Any]], after: Any, size: int) -> List[Dict[str, Any]]:
+        # SQLite sorts integers before text, like sort_key()
+        conditions, params = self._conditions(where, None)
+        if after is not None:
+            conditions.append(f"{self.key} > ?")
+            params.append(after)
+        where_sql = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                f"SELECT data FROM {self.table}{where_sql} ORDER BY {self.key} LIMIT ?",
+                params + [size]).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def insert(self, record: Dict[str, Any]) -> bool:
+        self._join_unit_of_work()
+        try:
+            with self.db.transaction() as conn:
+                conn.execute(self._upsert_sql("INSERT"), self._row(record))
+        except sqlite3.IntegrityError:
+            return False
+        self._notify(record.get(self.key), record)
+        return True
+
+    def update(self, key_value: Any, changes: Dict[str, Any]) -> bool:
+        self._join_unit_of_work()
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                f"SELECT data FROM {self.table} WHERE {self.key} = ?", (key_value,)).fetchone()
+            if row is None:
+                return False
+            record = json.loads(row[0])
+            record.update(changes)
+            if record.get(self.key) != key_value:
+                conn.execute(
+                    f"DELETE FROM {self.table} WHERE {self.key} = ?", (key_value,))
+                conn.execute(self._upsert_sql("INSERT"), self._row(record))
+            else:
+                assignments = ", ".join(
+                    f"{c} = ?" for c in self.indexed + ("data",))
+                values = self._row(record)[1:]
+                conn.execute(
+                    f"UPDATE {self.table} SET {assignments} WHERE {self.key} = ?", values + (key_value,))
+        self._notify_update(key_value, record)
+        return True
+
+    def delete(self, key_value: Any) -> bool:
+        self._join_unit_of_work()
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM {self.table} WHERE {self.key} = ?", (key_value,))
+        if cursor.rowcount == 0:
+            return False
+        self._notify(key_value, None)
+        return True
+
+    def replace_all(self, records: List[Dict[str, Any]]) -> None:
+        self._join_unit_of_work()
+        with self.db.transaction() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+            conn.executemany(self._upsert_sql("INSERT OR REPLACE"),
+                             [self._row(r) for r in records])
+        self._notify(None, None)
+
+    def data_version(self) -> int:
+        # PRAGMA data_version changes whenever another connection commits; rollbacks
+        # of this connection are added so cached copies of rolled-back rows are dropped too
+        with self.db.lock:
+            return self.db.conn.execute("PRAGMA data_version").fetchone()[0] + self.db.rollbacks
+
+    def max_key(self) -> int:
+        with self.db.lock:
+            row = self.db.conn.execute(
+                f"SELECT MAX({self.key}) FROM {self.table} WHERE typeof({self.key}) = 'integer'").fetchone()
+        return row[0] or 0
+
+    def __contains__(self, key_value: Any) -> bool:
+        with self.db.lock:
+            row = self.db.conn.execute(
+                f"SELECT 1 FROM {self.table} WHERE {self.key} = ?", (key_value,)).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self.db.lock:
+            return self.db.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+_active_work = threading.local()
+
+
+class UnitOfWork:
+    """
+    The repository changes made by one thread inside unit_of_work().
+    A repository joins the first time it is changed and then stays inside its
+    own batch() until the unit of work ends, so it is written exactly once.
+    """
+
+    def __init__(self) -> None:
+        self._joined: List[Tuple[Repository, Any]] = []
+        # Run by unit_of_work() once everything is committed; see after_commit()
+        self.after_commit: List[Callable[[], None]] = []
+
+    def join(self, repository: Repository) -> None:
+        if any(joined is repository for joined, _ in self._joined):
+            return
+        batch = repository.batch()
+        batch.__enter__()
+        self._joined.append((repository, batch))
+
+    def finish(self, exc_info: Optional[tuple] = None) -> None:
+        """
+        Commit the joined repositories in the order they joined, or roll them all
+        back if exc_info describes an error. A failed commit rolls back the
+        repositories that were not committed yet and is raised.
+        """
+        error = exc_info if exc_info and exc_info[0] is not None else None
+        with tracing.span("unit_of_work.commit" if error is None else "unit_of_work.rollback",
+                          stores=len(self._joined)):
+            self._finish(error)
+
+    def _finish(self, error: Optional[tuple]) -> None:
+        commit_error: Optional[BaseException] = None
+        for _, batch in self._joined:
+            try:
+                if error is None:
+                    batch.__exit__(None, None, None)
+                else:
+                    batch.__exit__(*error)
+            except BaseException as e:
+                if error is None:
+                    error = (type(e), e, e.__traceback__)
+                    commit_error = e
+                else:
+                    _logger.error(f"Error rolling back a unit of work: {e}")
+        self._joined = []
+        if commit_error is not None:
+            raise commit_error
+
+
+@contextmanager
+def unit_of_work() -> Iterator[UnitOfWork]:
+    """
+    Stage every repository change this thread makes inside the block.
+    Each changed repository is committed once when the block ends, in the order
+    they were first changed; if the block raises, every staged change is
+    discarded. A nested unit_of_work() joins the outer one. Under the SQLite
+    backend all repositories share one transaction, so the commit is atomic as
+    a whole; JSON files are committed one after the other.
+    """
+    outer = getattr(_active_work, "current", None)
+    if outer is not None:
+        yield outer
+        return
+    work = UnitOfWork()
+    _active_work.current = work
+    try:
+        yield work
+    except BaseException:
+        _active_work.current = None
+        work.finish(sys.exc_info())
+        raise
+    _active_work.current = None
+    work.finish()
+    for callback in work.after_commit:
+        try:
+            callback()
+        except Exception:
+            _logger.exception("Callback run after a unit of work failed")
+
+
+def after_commit(callback: Callable[[], None]) -> None:
+    """
+    Run callback once the thread's unit of work has committed and released the
+    repositories, or right away outside a unit of work. The callbacks of a unit
+    of work that rolls back are dropped.
+    """
+    work = getattr(_active_work, "current", None)
+    if work is None:
+        callback()
+    else:
+        work.after_commit.append(callback)
+
+
+_repositories: Dict[Tuple[str, str, str], Repository] = {}
+_databases: Dict[str, SqliteDatabase] = {}
+_registry_lock = threading.Lock()
+
+
+def _database(path: Union[str, Path]) -> SqliteDatabase:
+    key = str(Path(path).resolve())
+    if key not in _databases:
+        _databases[key] = SqliteDatabase(path)
+    return _databases[key]
+
+
+def repository(entity: str, json_path: Union[str, Path]) -> Repository:
+    """
+    Return the shared repository for an entity under the configured backend.
+    json_path is the entity's JSON file, used by the "json" backend.
+    """
+    key_field, indexed = ENTITIES[entity]
+    backend = config.STORAGE_BACKEND
+    if backend == "json" and entity == "orders":
+        from order_store import OrderStore
+        return OrderStore.for_path(json_path)
+    location = str(Path(json_path).resolve()
+                   ) if backend == "json" else config.SQLITE_PATH
+    cache_key = (backend, entity, location)
+    with _registry_lock:
+        repo = _repositories.get(cache_key)
+        if repo is None:
+            if backend == "json":
+                repo = JsonRepository(
+                    json_path, key_field, shared=SHARED_VALUES.get(entity, ()))
+            elif backend == "sqlite":
+                # Create every table as soon as the database is opened: DDL run later,
+                # inside a unit of work's transaction, would be rolled back with it
+                db = _database(location)
+                for name, (key, columns) in ENTITIES.items():
+                    if (backend, name, location) not in _repositories:
+                        _repositories[(backend, name, location)] = SqliteRepository(
+                            db, name, key, columns)
+                repo = _repositories[cache_key]
+            else:
+                raise ValueError(f"Unknown storage backend: {backend}")
+            _repositories[cache_key] = repo
+        return repo
+
+
+def set_backend(backend: str, sqlite_path: Optional[str] = None) -> None:
+    """Switch the process-wide storage backend ("json" or "sqlite")."""
+    if backend not in ("json", "sqlite"):
+        raise ValueError(f"Unknown storage backend: {backend}")
+    config.STORAGE_BACKEND = backend
+    if sqlite_path is not None:
+        config.SQLITE_PATH = sqlite_path
+
+
+def reset() -> None:
+    """Forget every shared repository and close SQLite connections (used by tests and tools)."""
+    from order_store import OrderStore
+    with _registry_lock:
+        _repositories.clear()
+        for db in _databases.values():
+            db.close()
+        _databases.clear()
+    OrderStore.reset_instances()
@@ -0,0 +1,24 @@
+import gc
+
+import pytest
+
+import geocoding
+import id_allocator
+import storage
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Run in an empty data directory, with fresh stores and the offline stub geocoder."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    storage.reset()
+    id_allocator.reset()
+    geocoding.set_geocoder(geocoding.StubGeocoder())
+    yield tmp_path / "data"
+    # Free the test's DispatchSystem now; left to the cycle collector it would keep
+    # receiving Courier changes made by later tests
+    gc.collect()
+    storage.reset()
+    id_allocator.reset()
+    geocoding.set_geocoder(None)
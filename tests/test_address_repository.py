@@ -0,0 +1,78 @@
+import json
+import multiprocessing
+
+import pytest
+
+import storage
+from address import Address
+from address_repository import AddressRepository
+
+
+def make_address(street, id=None):
+    return Address(street, 1, "Haifa", "123", "Israel", coordinates=(32.8, 35.0), id=id)
+
+
+@pytest.fixture
+def path(data_dir):
+    return data_dir / "addresses.json"
+
+
+def test_add_update_and_delete_by_id(path):
+    repo = AddressRepository(path)
+    first, second = make_address("Herzl"), make_address("Allenby")
+    repo.add(first)
+    repo.add(second)
+    assert repo.get_by_id(first.id) is first and len(repo) == 2
+    assert [a.id for a in repo.get_all()] == [first.id, second.id]
+
+    assert repo.update_by_id(second.id, {"city": "Akko", "unknown": 1})
+    assert repo.get_by_id(second.id).city == "Akko"
+    assert not repo.update_by_id(999, {"city": "Akko"})
+
+    assert repo.delete_by_id(first.id)
+    assert not repo.delete_by_id(first.id)
+    assert first.id not in repo and repo.get_by_id(first.id) is None
+    assert [r["id"] for r in storage.repository(
+        "addresses", path).all()] == [second.id]
+    assert AddressRepository(path).get_by_id(second.id).city == "Akko"
+
+
+def test_changing_the_id_rekeys_the_address(path):
+    repo = AddressRepository(path)
+    address = make_address("Herzl", id=5)
+    repo.add(address)
+    assert repo.update_by_id(5, {"id": 50})
+    assert repo.get_by_id(5) is None and repo.get_by_id(50) is address
+    assert [r["id"]
+            for r in storage.repository("addresses", path).all()] == [50]
+
+
+def _write_in_other_process(path, street):
+    storage.reset()
+    repo = AddressRepository(path)
+    repo.add(make_address(street, id=77))
+    repo.update_by_id(2, {"city": "Akko"})
+
+
+def test_sync_picks_up_addresses_written_by_another_process(path, monkeypatch):
+    path.write_text(json.dumps(
+        [make_address("Herzl", id=1).to_dict(), make_address("Yafo", id=2).to_dict()]))
+    repo = AddressRepository(path)
+    unchanged = repo.get_by_id(1)
+    assert repo.get_by_id(77) is None
+
+    worker = multiprocessing.Process(
+        target=_write_in_other_process, args=(path, "Allenby"))
+    worker.start()
+    worker.join()
+    assert worker.exitcode == 0
+
+    built = []
+    from_dict = Address.from_dict
+    monkeypatch.setattr(Address, "from_dict", staticmethod(
+        lambda data: built.append(data["id"]) or from_dict(data)))
+    assert repo.get_by_id(77).street == "Allenby"
+    assert repo.get_by_id(2).city == "Akko"
+    assert [a.id for a in repo.addresses] == [1, 2, 77]
+    # Only the changed records were turned into new Address objects
+    assert repo.get_by_id(1) is unchanged and sorted(built) == [2, 77]
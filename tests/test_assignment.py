@@ -0,0 +1,65 @@
+import itertools
+import random
+
+from assignment import assignment_cells, distance_matrix, greedy_assignment, hungarian, optimal_assignment
+from spatial_index import GridSpatialIndex
+
+
+def brute_force_cost(cost):
+    n, m = cost.shape
+    if n <= m:
+        return min(sum(cost[i, cols[i]] for i in range(n))
+                   for cols in itertools.permutations(range(m), n))
+    return brute_force_cost(cost.T)
+
+
+def test_hungarian_is_optimal():
+    rng = random.Random(3)
+    for n, m in [(3, 3), (3, 5), (5, 3), (6, 6)]:
+        points = [(rng.random(), rng.random()) for _ in range(n)]
+        couriers = [(rng.random(), rng.random()) for _ in range(m)]
+        cost = distance_matrix(points, couriers)
+        columns = hungarian(cost)
+        assigned = [(i, j) for i, j in enumerate(columns) if j >= 0]
+        assert len(assigned) == min(n, m)
+        assert len({j for _, j in assigned}) == len(assigned)
+        total = sum(cost[i, j] for i, j in assigned)
+        assert abs(total - brute_force_cost(cost)) < 1e-9
+
+
+def test_burst_is_spread_across_couriers():
+    orders = [(0.0, 0.0)] * 4
+    assignment = optimal_assignment(
+        orders, ["a", "b"], [(0.0, 0.1), (0.0, 5.0)])
+    assert sorted(assignment) == ["a", "a", "b", "b"]
+
+    index = GridSpatialIndex(1.0)
+    index.insert("a", (0.0, 0.1))
+    index.insert("b", (0.0, 5.0))
+    assert greedy_assignment(orders, index) == ["a", "b", "a", "b"]
+
+
+def test_full_couriers_are_skipped():
+    orders = [(0.0, 0.0)] * 4
+    assignment = optimal_assignment(orders, ["a", "b", "c"], [
+                                    (0.0, 0.1), (0.0, 5.0), (0.0, 0.2)], [1, None, 0])
+    assert sorted(assignment) == ["a", "b", "b", "b"]
+    assert optimal_assignment(orders, ["a"], [(0.0, 0.1)], [2]) == [
+        "a", "a", None, None]
+
+    index = GridSpatialIndex(1.0)
+    index.insert("a", (0.0, 0.1))
+    index.insert("b", (0.0, 5.0))
+    index.insert("c", (0.0, 0.2))
+    assert greedy_assignment(orders, index, {"a": 1, "b": 2}) == [
+        "a", "b", "b", None]
+
+
+def test_assignment_cells_counts_every_round():
+    assert assignment_cells(10, [None, None, None]) == 30 + 21 + 12 + 3
+    # A courier with one slot drops out after the first round; orders left over need no rounds
+    assert assignment_cells(5, [1, None]) == 10 + 3 + 2 + 1
+    assert assignment_cells(5, [1, 1, 0]) == 10
+    assert assignment_cells(0, [None]) == 0
+    # 20,000 orders and 5 couriers: small first matrix, far too much work overall
+    assert assignment_cells(20_000, [None] * 5, limit=250_000) > 250_000
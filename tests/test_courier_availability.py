@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from courier_availability import CourierAvailability, CourierState
+from order_store import OrderStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = tmp_path / "orders.json"
+    path.write_text(json.dumps([
+        {"package_id": 1, "courier_id": 7,
+            "status": "confirmed - assigned to courier"},
+        {"package_id": 2, "courier_id": 7, "status": "on-delivery"},
+        {"package_id": 3, "courier_id": 8, "status": "delivered"},
+        {"package_id": 4, "courier_id": None, "status": "created"},
+    ]))
+    return OrderStore(path, journal=False)
+
+
+def test_load_and_state_follow_order_changes(store):
+    availability = CourierAvailability(store, capacity=2)
+    assert availability.open_orders(7) == [1, 2]
+    assert availability.state(7) == CourierState.ON_DELIVERY
+    assert availability.state(8) == CourierState.IDLE
+    assert availability.free_slots([7, 8]) == {7: 0, 8: 2}
+
+    store.update(2, {"status": "delivered"})
+    store.update(
+        4, {"courier_id": 8, "status": "confirmed - assigned to courier"})
+    assert availability.load(7) == 1
+    assert availability.open_orders(8) == [4]
+    store.delete(1)
+    assert availability.state(7) == CourierState.IDLE
+
+    eligible = availability.eligible()
+    assert eligible(7) and eligible(8)
+    availability.set_on_shift(8, False)
+    assert availability.state(8) == CourierState.OFF_SHIFT
+    assert not availability.eligible()(8)
+
+
+def test_counts_are_rebuilt_when_the_store_reloads(store):
+    availability = CourierAvailability(store, capacity=0)
+    assert availability.free_slots([7]) == {7: None}
+    store.replace_all(
+        [{"package_id": 9, "courier_id": 5, "status": "on-delivery"}])
+    assert availability.load(7) == 0
+    assert availability.open_orders(5) == [9]
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store.update(9, {"status": "delivered"})
+            raise RuntimeError("dispatch failed")
+    assert availability.load(5) == 1
+
+
+def test_pending_changes_are_coalesced_by_order(store):
+    availability = CourierAvailability(store, capacity=2)
+    assert availability.load(7) == 2
+    for i in range(50):
+        store.update(2, {"status": "on-delivery" if i % 2 else "delivered"})
+        store.update(
+            4, {"courier_id": 8, "status": "on-delivery" if i % 2 else "created"})
+    assert len(availability._changes) == 2
+    assert availability.open_orders(
+        7) == [1, 2] and availability.open_orders(8) == [4]
+    assert availability._changes == {}
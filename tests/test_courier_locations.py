@@ -0,0 +1,82 @@
+import pytest
+
+from courier_locations import LocationTracker, parse_point
+from storage import JsonRepository
+
+
+@pytest.fixture
+def repository(tmp_path):
+    return JsonRepository(tmp_path / "courier_positions.json", "courier_id")
+
+
+def test_latest_position_is_kept_and_flushed_in_one_batch(repository):
+    moved = []
+    tracker = LocationTracker(repository, lambda courier_id, point: moved.append((courier_id, point)),
+                              flush_interval=60, clock=lambda: 1000.0)
+    assert tracker.record_many(
+        [(1, 32.08, 34.78), (2, "32.1", "34.8", 990), (1, 32.09, 34.79)]) == 3
+    assert tracker.position(1) == (32.09, 34.79)
+    assert moved[-1] == (1, (32.09, 34.79))
+    # Late pings are ignored
+    assert not tracker.record(2, 31.0, 35.0, timestamp=980)
+    assert tracker.position(2) == (32.1, 34.8)
+    assert repository.all() == []
+
+    assert tracker.flush() == 2
+    assert repository.get(1) == {"courier_id": 1,
+                                 "lat": 32.09, "lon": 34.79, "timestamp": 1000.0}
+    tracker.record(2, 32.2, 34.9, timestamp=995)
+    assert tracker.flush() == 1
+    assert repository.get(2)["lat"] == 32.2
+    assert tracker.flush() == 0
+    tracker.close()
+
+
+def test_invalid_pings_record_nothing(repository):
+    tracker = LocationTracker(repository, flush_interval=0)
+    with pytest.raises(ValueError):
+        tracker.record_many([(1, 32.0, 34.0), (2, 95.0, 34.0)])
+    with pytest.raises(ValueError):
+        parse_point("north", 34.0)
+    with pytest.raises(ValueError):
+        parse_point(float("nan"), 34.0)
+    for timestamp in ("inf", float("nan"), "-inf"):
+        with pytest.raises(ValueError):
+            tracker.record(1, 32.0, 34.0, timestamp=timestamp)
+    assert len(tracker) == 0
+    # With no flush interval every ping is written at once
+    tracker.record(3, 32.0, 34.0)
+    assert repository.get(3)["lon"] == 34.0
+
+
+def test_positions_flushed_by_another_process_are_synced(tmp_path):
+    path = tmp_path / "courier_positions.json"
+    writer = LocationTracker(JsonRepository(
+        path, "courier_id"), flush_interval=60)
+    moved = {}
+    reader = LocationTracker(JsonRepository(
+        path, "courier_id"), moved.__setitem__, flush_interval=60)
+    reader.record(1, 32.0, 34.0, timestamp=100)
+    writer.record_many([(1, 32.5, 34.5, 200), (2, 31.0, 35.0, 200)])
+    writer.flush()
+    reader.sync()
+    assert moved == {1: (32.5, 34.5), 2: (31.0, 35.0)}
+    # A newer position stored by another process is not overwritten
+    late = LocationTracker(JsonRepository(
+        path, "courier_id"), flush_interval=60)
+    late.record(1, 30.0, 30.0, timestamp=150)
+    assert late.flush() == 0
+    assert JsonRepository(path, "courier_id").get(1)["lat"] == 32.5
+
+
+def test_future_timestamps_are_taken_as_now(repository):
+    tracker = LocationTracker(
+        repository, flush_interval=0, clock=lambda: 1000.0, max_clock_skew=30)
+    tracker.record(2, 32.0, 34.0, timestamp=1020)
+    assert tracker.last_seen(2) == 1020
+    assert tracker.record(1, 32.1, 34.1, timestamp=10 ** 12)
+    assert tracker.last_seen(1) == 1000.0
+    assert repository.get(1)["timestamp"] == 1000.0
+    # so the courier's next pings still move it
+    assert tracker.record(1, 32.2, 34.2, timestamp=1001)
+    assert tracker.position(1) == (32.2, 34.2)
@@ -0,0 +1,27 @@
+from benchmarks.common import percentile
+from delivery_simulator import SimulationConfig, simulate
+
+
+def test_small_fleet_delivers_orders():
+    report = simulate(SimulationConfig(minutes=20, orders_per_minute=1, couriers=3, destinations=20, seed=1,
+                                       courier_capacity=0))
+    assert report.orders_created > 0
+    assert report.orders_assigned == report.orders_created
+    assert 0 < report.orders_delivered <= report.orders_assigned
+    assert len(report.dispatch_ms) == report.orders_created
+    assert report.storage_calls[("orders", "insert")] == report.orders_created
+    assert report.summary()["delivered"] == report.orders_delivered
+
+
+def test_full_couriers_leave_orders_waiting():
+    report = simulate(SimulationConfig(minutes=20, orders_per_minute=1, couriers=3, destinations=20, seed=1,
+                                       courier_capacity=1))
+    assert 0 < report.orders_delivered <= report.orders_assigned < report.orders_created
+    # Waiting orders are dispatched again each time a courier delivers one
+    assert len(report.dispatch_ms) > report.orders_created
+
+
+def test_percentile():
+    assert percentile([], 95) == 0.0
+    assert percentile([3, 1, 2, 4], 50) == 2
+    assert percentile([3, 1, 2, 4], 95) == 4
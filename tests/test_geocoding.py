@@ -0,0 +1,178 @@
+import threading
+
+import pytest
+import requests
+
+import config
+import geocoding
+from address import Address
+from dispatch_system import DispatchSystem
+from geocoding import (CachingGeocoder, GeocodingCache, GeocodingError, GeocodingQueue, NominatimGeocoder,
+                       RateLimitedGeocoder, RateLimiter, StubGeocoder, set_geocoder)
+from order import PackageStatus
+
+
+def test_repeat_address_is_served_from_cache(tmp_path):
+    stub = StubGeocoder()
+    cache = GeocodingCache(tmp_path / "geocode.sqlite3", capacity=2)
+    set_geocoder(CachingGeocoder(stub, cache))
+    try:
+        first = Address("Herzl", 10, "Tel Aviv", "12345", "Israel", id=1)
+        second = Address("  herzl", 10, "TEL AVIV", "12345", "Israel", id=2)
+    finally:
+        set_geocoder(None)
+    assert first.coordinates == second.coordinates
+    assert stub.calls == 1
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = tmp_path / "geocode.sqlite3"
+    stub = StubGeocoder({"1 nowhere": None})
+    CachingGeocoder(stub, GeocodingCache(path)).geocode("1 Nowhere")
+
+    restarted = GeocodingCache(path)
+    assert CachingGeocoder(stub, restarted).geocode("1 nowhere") is None
+    assert stub.calls == 1
+    assert restarted.stats()["disk_hits"] == 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_rate_limiter_spaces_calls():
+    clock = FakeClock()
+    limiter = RateLimiter(2, clock=clock, sleep=clock.sleep)
+    starts = []
+    for _ in range(4):
+        limiter.acquire()
+        starts.append(clock.now)
+    assert starts == [100.0, 100.5, 101.0, 101.5]
+    clock.now = 110.0  # idle time is not saved up for a burst
+    limiter.acquire()
+    limiter.acquire()
+    assert clock.now == 110.5
+
+
+def test_only_the_network_geocoder_is_rate_limited(monkeypatch):
+    monkeypatch.setattr(config, "GEOCODE_CACHE_PATH", "")
+    monkeypatch.setattr(config, "GEOCODE_RATE_LIMIT", 1.0)
+    for name, backend in (("stub", StubGeocoder), ("nominatim", RateLimitedGeocoder)):
+        monkeypatch.setattr(config, "GEOCODER", name)
+        set_geocoder(None)
+        assert type(geocoding.get_geocoder().backend) is backend
+    set_geocoder(None)
+
+
+def test_provider_requests_time_out(monkeypatch):
+    def hang(url, **kwargs):
+        assert kwargs["timeout"] == 2.5
+        raise requests.Timeout("read timed out")
+
+    monkeypatch.setattr(requests, "get", hang)
+    with pytest.raises(GeocodingError):
+        NominatimGeocoder(timeout=2.5).geocode("1 herzl tel aviv")
+
+
+class GatedGeocoder:
+    """Answers once released; raises GeocodingError for queries in `failing`."""
+
+    def __init__(self, failing=()):
+        self.release = threading.Event()
+        self.failing = set(failing)
+        self.calls = 0
+
+    def geocode(self, query):
+        self.release.wait(5)
+        self.calls += 1
+        if query in self.failing:
+            raise GeocodingError("provider unreachable")
+        return StubGeocoder().geocode(query)
+
+
+def test_queue_reports_none_after_failed_retries():
+    geocoder = GatedGeocoder(failing={"nowhere"})
+    geocoder.release.set()
+    queue = GeocodingQueue(geocoder, workers=1, retries=3, retry_delay=0)
+    results = []
+    queue.submit("nowhere", results.append)
+    queue.submit("1 herzl tel aviv", results.append)
+    queue.join()
+    queue.stop()
+    assert results[0] is None and results[1] is not None
+    assert geocoder.calls == 4
+
+
+def test_deferred_address_dispatches_its_order_once_geocoded(data_dir):
+    geocoder = GatedGeocoder()
+    set_geocoder(geocoder)
+    ds = DispatchSystem("managers.json", "addresses.json",
+                        deferred_geocoding=True)
+    home = ds.add_address({"street": "Allenby", "house_number": 1, "city": "Tel Aviv", "postal_code": "1",
+                           "country": "Israel", "coordinates": (32.07, 34.77)})
+    ds.add_courier({"name": "noa", "courier_id": 1, "address_id": home.id, "current_location": home.id,
+                    "password": "x"})
+
+    address = ds.add_address({"street": "Herzl", "house_number": 10, "city": "Tel Aviv", "postal_code": "2",
+                              "country": "Israel"})
+    assert address.coordinates is None and ds.is_address_pending(address.id)
+    order = ds.add_order({"customer_id": "c1", "courier_id": None, "origin_id": None,
+                          "destination_id": address.id, "status": PackageStatus.CREATED})
+    assert not ds.dispatch_order(order._package_id)
+    assert ds.find_order_by_package_id(
+        order._package_id)._status == PackageStatus.CREATED.value
+    ready = []
+    assert ds.when_coordinates_ready(address.id, ready.append)
+    assert ready == [] and geocoder.calls == 0
+
+    geocoder.release.set()
+    ds.geocoding_queue.join()
+    ds.geocoding_queue.stop()
+    assert len(ready) == 1 and ready[0].coordinates is not None
+    assert not ds.is_address_pending(address.id)
+    dispatched = ds.find_order_by_package_id(order._package_id)
+    assert (dispatched._status, dispatched._courier_id) == (
+        PackageStatus.CONFIRMED.value, 1)
+    # Once the coordinates are known, callbacks run right away
+    assert not ds.when_coordinates_ready(address.id, ready.append)
+    assert len(ready) == 2
+
+
+def test_address_that_cannot_be_geocoded_leaves_its_order_unassigned(data_dir):
+    set_geocoder(StubGeocoder({"5 nowhere st, atlantis, 0, nowhere": None}))
+    ds = DispatchSystem("managers.json", "addresses.json",
+                        deferred_geocoding=True)
+    address = ds.add_address({"street": "Nowhere st", "house_number": 5, "city": "Atlantis", "postal_code": "0",
+                              "country": "Nowhere"})
+    order = ds.add_order({"customer_id": "c1", "courier_id": None, "origin_id": None,
+                          "destination_id": address.id, "status": PackageStatus.CREATED})
+    ready = []
+    ds.when_coordinates_ready(address.id, ready.append)
+    ds.dispatch_order(order._package_id)
+    ds.geocoding_queue.join()
+    ds.geocoding_queue.stop()
+    assert ready[0].coordinates is None and not ready[0].coordinates_pending and ready[0].geocode_failed
+    assert ds.find_order_by_package_id(
+        order._package_id)._status == PackageStatus.NOT_ASSIGNED.value
+
+
+def test_loading_addresses_never_geocodes(data_dir):
+    geocoder = StubGeocoder({"5 nowhere st, atlantis, 0, nowhere": None})
+    set_geocoder(geocoder)
+    failed = Address("Nowhere st", 5, "Atlantis", "0", "Nowhere", id=1)
+    assert failed.geocode_failed and geocoder.calls == 1
+    record = failed.to_dict()
+    for data in (record, dict(record, geocode_failed=False), dict(record, coordinates_pending=True)):
+        loaded = Address.from_dict(data)
+        assert loaded.coordinates is None
+        assert loaded.coordinates_pending == data["coordinates_pending"]
+        assert loaded.geocode_failed == data["geocode_failed"]
+    assert geocoder.calls == 1
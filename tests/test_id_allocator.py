@@ -0,0 +1,33 @@
+import multiprocessing
+
+from id_allocator import IdAllocator
+
+
+def _allocate(path, count, queue):
+    allocator = IdAllocator(path, block_size=7)
+    queue.put([allocator.next_id() for _ in range(count)])
+
+
+def test_allocator_seeds_once_and_leases_blocks(tmp_path):
+    path = tmp_path / "orders.ids"
+    seeds = []
+    allocator = IdAllocator(
+        path, block_size=3, seed=lambda: seeds.append(1) or 10)
+    assert [allocator.next_id() for _ in range(4)] == [10, 11, 12, 13]
+    assert path.read_text().strip() == "16"
+    other = IdAllocator(path, block_size=3, seed=lambda: 1)
+    assert other.next_id() == 16
+    assert seeds == [1]
+
+
+def test_processes_never_share_ids(tmp_path):
+    path = tmp_path / "orders.ids"
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(
+        target=_allocate, args=(path, 50, queue)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    ids = [i for _ in workers for i in queue.get(timeout=30)]
+    for worker in workers:
+        worker.join()
+    assert len(ids) == len(set(ids)) == 200
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+import metrics
+from storage import JsonRepository
+
+
+@pytest.fixture
+def recording():
+    metrics.enable()
+    yield
+    metrics.enable(False)
+
+
+def test_histogram_renders_cumulative_buckets(recording):
+    histogram = metrics.Histogram(
+        "test_seconds", "Test latencies", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, ("index",))
+    assert histogram.samples() == [
+        'test_seconds_bucket{route="index",le="0.1"} 1',
+        'test_seconds_bucket{route="index",le="1"} 3',
+        'test_seconds_bucket{route="index",le="+Inf"} 4',
+        'test_seconds_sum{route="index"} 4.25',
+        'test_seconds_count{route="index"} 4',
+    ]
+
+
+def test_nothing_is_recorded_while_disabled():
+    counter = metrics.Counter("test_total", "Test counter")
+    timed = metrics.timed(metrics.Histogram(
+        "test_call_seconds", "Test calls"))(lambda: 42)
+    counter.inc()
+    assert timed() == 42
+    assert counter.value() == 0
+
+
+def test_generator_methods_are_timed_over_their_iteration(recording):
+    histogram = metrics.Histogram(
+        "test_method_seconds", "Test methods", ("method",))
+
+    @metrics.instrument_methods(histogram)
+    class Source:
+        def rows(self, n):
+            for i in range(n):
+                time.sleep(0.01)
+                yield i
+
+    rows = Source().rows(3)
+    assert histogram.count(("rows",)) == 0
+    assert list(rows) == [0, 1, 2]
+    assert histogram.count(("rows",)) == 1 and histogram.sum(("rows",)) >= 0.03
+
+
+def test_json_repository_io_is_measured(tmp_path, recording):
+    repo = JsonRepository(tmp_path / "things.json", "id")
+    before = metrics.REGISTRY.render()
+    repo.insert({"id": 1, "name": "a"})
+    written = (tmp_path / "things.json").stat().st_size
+    repo.invalidate()
+    assert repo.get(1) == {"id": 1, "name": "a"}
+    rendered = metrics.REGISTRY.render()
+    assert f'storage_written_bytes_total{{store="things"}} {written}' in rendered
+    assert f'storage_read_bytes_total{{store="things"}} {written}' in rendered
+    assert 'storage_save_seconds_count{store="things"} 1' in rendered
+    assert 'storage_save_seconds_count{store="things"}' not in before
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from order_analytics import OrderAnalytics
+from order_store import OrderStore
+
+pytest.importorskip("numpy")
+
+COORDINATES = {
+    10: (32.801, 34.991),
+    11: (32.809, 34.999),
+    12: (31.771, 35.217),
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = tmp_path / "orders.json"
+    path.write_text(json.dumps([
+        {"package_id": 1, "customer_id": "c1", "courier_id": 7,
+            "destination_id": 10, "status": "created"},
+        {"package_id": 2, "customer_id": "c1", "courier_id": 7,
+            "destination_id": 11, "status": "delivered"},
+        {"package_id": 3, "customer_id": "c2", "courier_id": None,
+            "destination_id": 12, "status": "created"},
+    ]))
+    return OrderStore(path, journal=False)
+
+
+def test_aggregates_follow_store_changes(store):
+    analytics = OrderAnalytics(store, COORDINATES.get)
+    assert analytics.status_counts() == {"created": 2, "delivered": 1}
+    assert analytics.orders_per_courier() == {7: 2}
+    assert analytics.orders_per_courier(open_only=True) == {7: 1}
+
+    store.insert({"package_id": 4, "courier_id": 8,
+                 "destination_id": 11, "status": "created"})
+    store.update(3, {"courier_id": 8, "status": "on-delivery"})
+    store.delete(2)
+    assert analytics.status_counts() == {"created": 2, "on-delivery": 1}
+    assert analytics.count(
+        status=["created", "on-delivery"], courier_id=8) == 2
+    # Destinations 10 and 11 share a 0.01-degree cell
+    assert analytics.open_orders_by_area(
+    ) == {(32.8, 34.99): 2, (31.77, 35.21): 1}
+
+
+def test_table_is_rebuilt_when_the_store_reloads(store):
+    analytics = OrderAnalytics(store, COORDINATES.get)
+    assert analytics.count() == 3
+    store.replace_all([{"package_id": 9, "courier_id": 1,
+                      "destination_id": 12, "status": "created"}])
+    assert analytics.orders_per_courier() == {1: 1}
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store.delete(9)
+            raise RuntimeError("dispatch failed")
+    assert analytics.count() == 1
+
+
+def test_pending_changes_are_coalesced_by_order(store):
+    looked_up = []
+    analytics = OrderAnalytics(store, lambda destination_id: looked_up.append(destination_id) or
+                               COORDINATES.get(destination_id))
+    assert analytics.count() == 3
+    del looked_up[:]
+    for i in range(50):
+        store.update(1, {"status": "on-delivery" if i % 2 else "created"})
+        store.update(3, {"courier_id": 8})
+    assert len(analytics._changes) == 2
+    assert analytics.status_counts() == {
+        "on-delivery": 1, "created": 1, "delivered": 1}
+    assert analytics._changes == {} and sorted(looked_up) == [10, 12]
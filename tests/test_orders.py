@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+import config
+from address import Address
+from order import Order, PackageStatus
+from order_store import OrderStore
+from dispatch_system import DispatchSystem
+
+
+@pytest.fixture
+def orders_file(tmp_path, monkeypatch):
+    path = tmp_path / "orders.json"
+    path.write_text(json.dumps([
+        {"package_id": 1, "customer_id": "c1", "courier_id": None,
+         "origin_id": None, "destination_id": 10, "status": "created"}
+    ]))
+    monkeypatch.setattr(Order, "_json_filename", str(path))
+    # These tests read orders.json back, so every change is written to it rather than the journal
+    monkeypatch.setattr(config, "ORDERS_JOURNAL", False)
+    OrderStore.reset_instances()
+    yield path
+    OrderStore.reset_instances()
+
+
+def test_create_assigns_next_package_id(orders_file):
+    order = Order("c2", None, None, 11, status=PackageStatus.CREATED)
+    assert order._package_id == 2
+    saved = json.loads(orders_file.read_text())
+    assert [o["package_id"] for o in saved] == [1, 2]
+
+
+def test_update_and_find(orders_file):
+    assert DispatchSystem.update_order_status(1, PackageStatus.DELIVERED)
+    assert DispatchSystem.find_order_by_package_id(1)._status == "delivered"
+    assert json.loads(orders_file.read_text())[0]["status"] == "delivered"
+    assert not Order.update_by_package_id(99, "status", "delivered")
+
+
+def test_delete_order(orders_file):
+    assert DispatchSystem.delete_order(1)
+    assert not DispatchSystem.delete_order(1)
+    assert DispatchSystem.view_orders() == []
+    assert json.loads(orders_file.read_text()) == []
+
+
+def test_batch_writes_once(orders_file, monkeypatch):
+    store = Order.store()
+    writes = []
+    original_write = store._write_snapshot
+    monkeypatch.setattr(store, "_write_snapshot",
+                        lambda orders: writes.append(1) or original_write(orders))
+    with store.batch():
+        Order.update_by_package_id(1, "courier_id", 5)
+        Order.update_by_package_id(1, "status", "confirmed")
+    assert len(writes) == 1
+    assert json.loads(orders_file.read_text())[0]["courier_id"] == 5
+
+
+def test_journal_appends_and_replays(orders_file):
+    store = OrderStore(orders_file, journal=True, compact_threshold=100)
+    store.insert({"package_id": 2, "status": "created"})
+    store.update(1, {"status": "delivered"})
+    store.delete(2)
+    assert json.loads(orders_file.read_text())[0]["status"] == "created"
+    assert len(store.journal_path.read_text().splitlines()) == 3
+
+    reloaded = OrderStore(orders_file, journal=True)
+    assert reloaded.get(1)["status"] == "delivered"
+    assert 2 not in reloaded
+
+
+def test_journal_compaction_folds_into_snapshot(orders_file):
+    store = OrderStore(orders_file, journal=True, compact_threshold=2)
+    store.update(1, {"status": "confirmed"})
+    store.update(1, {"courier_id": 7})
+    store.wait_for_compaction()
+    assert not store.journal_path.exists()
+    saved = json.loads(orders_file.read_text())
+    assert saved[0]["status"] == "confirmed" and saved[0]["courier_id"] == 7
+
+
+def test_query_filters_sorts_and_pages(orders_file):
+    store = Order.store()
+    for package_id in range(2, 8):
+        store.insert({"package_id": package_id, "customer_id": "c1" if package_id % 2 else "c2",
+                      "status": "created", "created_at": f"2025-07-0{package_id}T10:00:00"})
+    page, total = store.query({"customer_id": "c1"}, order_by="created_at", descending=True,
+                              offset=1, limit=2)
+    assert total == 4
+    assert [o["package_id"] for o in page] == [5, 3]
+    page, total = store.query(
+        ranges={"created_at": ("2025-07-03", "2025-07-05T23:59:59")})
+    assert [o["package_id"] for o in page] == [3, 4, 5] and total == 3
+    store.update(3, {"customer_id": "c2"})
+    assert [o["package_id"]
+            for o in store.find_by("customer_id", "c2")] == [2, 3, 4, 6]
+
+
+def test_models_have_no_instance_dict():
+    order = Order("c1", None, None, 10, package_id=1, auto_save=False)
+    address = Address("Herzl", 5, "Haifa", "123", "Israel",
+                      coordinates=(32.8, 35.0), id=1)
+    for model in (order, address):
+        assert not hasattr(model, "__dict__")
+    assert list(address.to_dict()) == list(Address.FIELDS)
@@ -0,0 +1,40 @@
+import json
+
+from record_table import RecordTable
+
+
+def test_records_with_different_fields_round_trip():
+    table = RecordTable(
+        "id", [{"id": 1, "city": "Haifa"}, {"id": 2, "floor": 3}])
+    table.put({"id": 3, "city": "Akko", "floor": None})
+    assert table.get(1) == {"id": 1, "city": "Haifa"}
+    assert table.get(2) == {"id": 2, "floor": 3}
+    assert table.records() == [{"id": 1, "city": "Haifa"}, {"id": 2, "floor": 3},
+                               {"id": 3, "city": "Akko", "floor": None}]
+    assert table.value(table.row(2), "city") is None and table.value(
+        table.row(2), "unknown") is None
+    assert table.matches(table.row(3), {"city": "Akko"}, {"id": (2, None)})
+    assert not table.matches(table.row(1), None, {"floor": (0, None)})
+
+
+def test_shared_fields_keep_one_copy_of_each_value():
+    records = json.loads(json.dumps(
+        [{"id": n, "status": "delivered", "note": "same"} for n in range(3)]))
+    table = RecordTable("id", records, shared=("status",))
+    statuses = [table.value(row, "status") for row in table.rows()]
+    notes = [table.value(row, "note") for row in table.rows()]
+    assert statuses[0] is statuses[1] is statuses[2]
+    assert notes[0] is not notes[1]
+
+
+def test_update_and_pop():
+    table = RecordTable("id", [{"id": 1, "city": "Haifa"}, {
+                        "id": 2, "city": "Akko"}, {"id": 3}])
+    assert table.update(1, {"city": "Yafo", "floor": 2}) == {
+        "id": 1, "city": "Yafo", "floor": 2}
+    assert table.update(9, {"city": "Yafo"}) is None
+    # A changed key keeps the record's place
+    assert table.update(2, {"id": 20})["id"] == 20
+    assert list(table) == [1, 20, 3] and 2 not in table
+    assert table.pop(3) == {"id": 3} and table.pop(3) is None
+    assert len(table) == 2 and list(reversed(table)) == [20, 1]
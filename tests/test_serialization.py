@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import serialization
+import storage
+from order_store import OrderStore
+
+RECORDS = [{"package_id": 1, "customer_id": "c1", "status": "נוצר", "courier_id": None},
+           {"package_id": 2, "customer_id": "c2", "status": "created", "courier_id": 7}]
+
+
+@pytest.mark.parametrize("name", ["json", "pretty", "msgpack"])
+def test_round_trip_and_format_detection(name):
+    if name == "msgpack" and serialization.msgpack is None:
+        pytest.skip("msgpack is not installed")
+    data = serialization.get(name).dumps(RECORDS)
+    assert serialization.loads(data) == RECORDS
+
+
+def test_stores_read_legacy_json_and_write_configured_format(tmp_path):
+    couriers = tmp_path / "courier.json"
+    couriers.write_text(json.dumps(
+        [{"courier_id": 1, "name": "adi"}], indent=4), encoding="utf-8")
+    repo = storage.JsonRepository(
+        couriers, "courier_id", serializer=serialization.get("json"))
+    assert repo.get(1)["name"] == "adi"
+    repo.update(1, {"name": "noa"})
+    assert couriers.read_bytes() == b'[{"courier_id":1,"name":"noa"}]'
+    assert storage.JsonRepository(couriers, "courier_id").get(1)[
+        "name"] == "noa"
+
+    orders = tmp_path / "orders.json"
+    orders.write_text(json.dumps(RECORDS, indent=2,
+                      ensure_ascii=False), encoding="utf-8")
+    store = OrderStore(orders, journal=False,
+                       serializer=serialization.get("json"))
+    store.update(2, {"status": "delivered"})
+    assert "\n" not in orders.read_text(encoding="utf-8")
+    assert OrderStore(orders, journal=False).get(2)["status"] == "delivered"
+
+
+def test_unknown_format_and_corrupt_data_are_rejected():
+    with pytest.raises(ValueError):
+        serialization.get("yaml")
+    with pytest.raises(serialization.DecodeError):
+        serialization.loads(b"[{")
+    with pytest.raises(ValueError):
+        serialization.get("pickle")
@@ -0,0 +1,60 @@
+from session_store import SessionStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_sessions_expire_after_inactivity():
+    clock = FakeClock()
+    store = SessionStore(ttl=10, max_sessions=10, clock=clock)
+    sid = store.create("customers", "c1", {"customer_id": "c1"})
+    clock.now = 8
+    assert store.get(sid).user_id == "c1"
+    clock.now = 16  # 8 seconds after the last use
+    assert store.get(sid).user_type == "customers"
+    clock.now = 27
+    assert store.get(sid) is None
+    assert store.get("unknown") is None and store.get(None) is None
+
+
+def test_least_recently_used_session_is_dropped():
+    store = SessionStore(ttl=60, max_sessions=2)
+    first = store.create("managers", "m1", {})
+    second = store.create("managers", "m2", {})
+    store.get(first)
+    third = store.create("couriers", "7", {})
+    assert store.get(second) is None
+    assert store.get(first) is not None and store.get(third) is not None
+    store.delete(first)
+    assert store.get(first) is None and len(store) == 1
+
+
+def test_sessions_are_shared_between_workers(tmp_path):
+    clock = FakeClock()
+    path = tmp_path / "sessions.sqlite3"
+    first = SessionStore(ttl=100, max_sessions=1,
+                         clock=clock, path=path, recheck=10)
+    second = SessionStore(ttl=100, max_sessions=10,
+                          clock=clock, path=path, recheck=10)
+    sid = first.create("couriers", "7", {"courier_id": 7})
+    # Another worker finds the session, and the first one after evicting it from memory
+    assert second.get(sid).user == {"courier_id": 7}
+    first.create("managers", "m1", {})
+    assert first.get(sid).user_id == "7"
+
+    # Use in one worker keeps the session open in the others
+    clock.now = 90
+    assert second.get(sid) is not None
+    clock.now = 150
+    assert first.get(sid) is not None
+
+    # A logout reaches the other worker's cached copy within `recheck` seconds
+    second.delete(sid)
+    assert first.get(sid) is not None
+    clock.now = 161
+    assert first.get(sid) is None
@@ -0,0 +1,89 @@
+import math
+import random
+import threading
+import time
+
+import pytest
+
+from courier import Courier
+from dispatch_system import DispatchSystem
+from spatial_index import GridSpatialIndex
+
+
+def brute_force(points, query, k):
+    by_distance = sorted(
+        points.items(), key=lambda item: math.dist(item[1], query))
+    return [item_id for item_id, _ in by_distance[:k]]
+
+
+def test_k_nearest_matches_brute_force():
+    rng = random.Random(7)
+    points = {i: (rng.uniform(29.5, 33.3), rng.uniform(34.2, 35.7))
+              for i in range(2000)}
+    index = GridSpatialIndex(cell_size=0.05)
+    for item_id, point in points.items():
+        index.insert(item_id, point)
+    for _ in range(50):
+        query = (rng.uniform(29, 34), rng.uniform(34, 36))
+        found = [item_id for item_id, _ in index.k_nearest(query, 5)]
+        assert found == brute_force(points, query, 5)
+
+
+def test_move_remove_and_predicate():
+    index = GridSpatialIndex(cell_size=1.0)
+    index.insert("a", (0.0, 0.0))
+    index.insert("b", (5.0, 5.0))
+    index.update("a", (10.0, 10.0))
+    assert index.nearest((0.0, 0.0))[0] == "b"
+    assert index.nearest((0.0, 0.0), predicate=lambda i: i != "b")[0] == "a"
+    assert index.remove("b") and not index.remove("b")
+    assert index.k_nearest((0.0, 0.0), 3) == [("a", math.hypot(10, 10))]
+
+
+def _dispatch_system_with_courier():
+    ds = DispatchSystem("managers.json", "addresses.json")
+    home = ds.add_address({"street": "Allenby", "house_number": 1, "city": "Tel Aviv", "postal_code": "1",
+                           "country": "Israel", "coordinates": (32.07, 34.77)})
+    ds.add_courier({"name": "noa", "courier_id": 1, "address_id": home.id, "current_location": home.id,
+                    "password": "x"})
+    ds._ensure_courier_index()
+    return ds, home
+
+
+def test_courier_changes_reach_the_index_once_committed(data_dir):
+    ds, home = _dispatch_system_with_courier()
+    other = ds.add_address({"street": "Herzl", "house_number": 2, "city": "Haifa", "postal_code": "2",
+                            "country": "Israel", "coordinates": (32.8, 35.0)})
+    with ds.unit_of_work():
+        Courier.update_courier(1, {"current_location": other.id})
+        assert ds.courier_index.position(1) == (32.07, 34.77)
+    assert ds.courier_index.position(1) == (32.8, 35.0)
+    with pytest.raises(RuntimeError):
+        with ds.unit_of_work():
+            Courier.update_courier(1, {"current_location": home.id})
+            raise RuntimeError("rolled back")
+    assert ds.courier_index.position(1) == (32.8, 35.0)
+
+
+def test_reindexing_does_not_deadlock_with_a_unit_of_work(data_dir):
+    ds, home = _dispatch_system_with_courier()
+    holding, proceed = threading.Event(), threading.Event()
+
+    def request():  # like POST /create_order: holds the address store, then changes a courier
+        with ds.unit_of_work():
+            ds.add_address({"street": "Herzl", "house_number": 2, "city": "Haifa", "postal_code": "2",
+                            "country": "Israel", "coordinates": (32.8, 35.0)})
+            holding.set()
+            proceed.wait(5)
+            Courier.update_courier(1, {"on_shift": False})
+
+    threads = [threading.Thread(target=request, daemon=True),
+               threading.Thread(target=lambda: (holding.wait(5), ds._reindex_couriers_at(home.id)), daemon=True)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.2)
+    proceed.set()
+    for thread in threads:
+        thread.join(10)
+    assert not any(thread.is_alive() for thread in threads)
+    assert ds.courier_state(1).value == "off-shift"
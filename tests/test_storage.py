@@ -0,0 +1,199 @@
+import pytest
+
+import storage
+from dispatch_system import DispatchSystem
+from order import PackageStatus
+
+
+@pytest.fixture
+def orders(tmp_path):
+    db = storage.SqliteDatabase(tmp_path / "dispatch.sqlite3")
+    yield storage.SqliteRepository(db, "orders", "package_id", ("courier_id",))
+    db.close()
+
+
+def test_sqlite_repository_crud(orders):
+    assert orders.insert({"package_id": 1, "courier_id": 7, "note": "x"})
+    assert not orders.insert({"package_id": 1})
+    assert orders.update(1, {"courier_id": 8})
+    assert orders.find_by("courier_id", 8) == [
+        {"package_id": 1, "courier_id": 8, "note": "x"}]
+    assert orders.max_key() == 1 and 1 in orders and len(orders) == 1
+    assert orders.delete(1) and not orders.delete(1)
+
+
+def test_sqlite_batch_rolls_back_on_error(orders):
+    orders.insert({"package_id": 1, "courier_id": None})
+    with pytest.raises(RuntimeError):
+        with orders.batch():
+            orders.update(1, {"courier_id": 7})
+            orders.insert({"package_id": 2})
+            raise RuntimeError("assignment failed")
+    assert orders.get(1)["courier_id"] is None
+    assert 2 not in orders
+
+
+def test_json_repository_batch_writes_once(tmp_path):
+    repo = storage.JsonRepository(tmp_path / "couriers.json", "courier_id")
+    with repo.batch():
+        repo.insert({"courier_id": 1, "current_location": 3})
+        repo.update(1, {"current_location": 4})
+        assert not (tmp_path / "couriers.json").exists()
+    assert repo.all() == [{"courier_id": 1, "current_location": 4}]
+
+
+def test_json_repository_reuses_parse_until_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "courier.json"
+    path.write_text('[{"courier_id": 1, "name": "adi"}]')
+    repo = storage.JsonRepository(path, "courier_id")
+    parses = []
+    original_parse = repo._parse
+    monkeypatch.setattr(
+        repo, "_parse", lambda: parses.append(1) or original_parse())
+
+    assert repo.get(1)["name"] == "adi"
+    assert 1 in repo and repo.get(2) is None
+    assert len(parses) == 1
+
+    # Another process rewrites the file
+    path.write_text(
+        '[{"courier_id": 1, "name": "adi"}, {"courier_id": 2, "name": "noa"}]')
+    assert repo.get(2)["name"] == "noa"
+    assert len(parses) == 2
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite", "order_store"])
+def test_scan_resumes_after_cursor_in_key_order(tmp_path, backend):
+    if backend == "json":
+        repo = storage.JsonRepository(tmp_path / "orders.json", "package_id")
+    elif backend == "sqlite":
+        repo = storage.SqliteRepository(storage.SqliteDatabase(tmp_path / "db.sqlite3"),
+                                        "orders", "package_id", ("courier_id",))
+    else:
+        from order_store import OrderStore
+        repo = OrderStore(tmp_path / "orders.json", journal=False)
+    repo.scan_chunk_size = 2
+    for package_id in (5, 1, 4, 2, 3):
+        repo.insert({"package_id": package_id, "courier_id": package_id % 2})
+    assert [r["package_id"] for r in repo.scan()] == [1, 2, 3, 4, 5]
+    assert [r["package_id"] for r in repo.scan(after=2, limit=2)] == [3, 4]
+    assert [r["package_id"]
+            for r in repo.scan({"courier_id": 1}, after=1)] == [3, 5]
+
+
+def _insert_many(kind, path, first, count):
+    if kind == "json":
+        repo = storage.JsonRepository(path, "package_id")
+    else:
+        from order_store import OrderStore
+        repo = OrderStore(path, journal=(
+            kind == "journal"), compact_threshold=15)
+    for package_id in range(first, first + count):
+        assert repo.insert({"package_id": package_id, "status": "created"})
+        repo.update(package_id, {"status": "delivered"})
+    if kind == "journal":
+        repo.wait_for_compaction()
+
+
+@pytest.mark.parametrize("kind", ["json", "snapshot", "journal"])
+def test_concurrent_processes_do_not_lose_updates(tmp_path, kind):
+    import multiprocessing
+    path = tmp_path / "orders.json"
+    workers = [multiprocessing.Process(target=_insert_many, args=(kind, path, 100 * w, 25))
+               for w in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+    if kind == "json":
+        records = storage.JsonRepository(path, "package_id").all()
+    else:
+        from order_store import OrderStore
+        records = OrderStore(path, journal=(kind == "journal")).all()
+    assert sorted(r["package_id"] for r in records) == [
+        100 * w + i for w in range(4) for i in range(25)]
+    assert {r["status"] for r in records} == {"delivered"}
+
+
+def test_unit_of_work_commits_each_store_once_or_rolls_back(tmp_path, monkeypatch):
+    from order_store import OrderStore
+    addresses = storage.JsonRepository(tmp_path / "addresses.json", "id")
+    orders = OrderStore(tmp_path / "orders.json", journal=False)
+    writes = []
+    original_write = orders._write_snapshot
+    monkeypatch.setattr(orders, "_write_snapshot",
+                        lambda o: writes.append(1) or original_write(o))
+
+    with storage.unit_of_work():
+        addresses.insert({"id": 1, "city": "Haifa"})
+        orders.insert(
+            {"package_id": 1, "destination_id": 1, "status": "created"})
+        orders.update(1, {"courier_id": 7, "status": "confirmed"})
+        assert not (tmp_path / "addresses.json").exists()
+    assert len(writes) == 1 and orders.get(1)["courier_id"] == 7
+    assert storage.JsonRepository(
+        tmp_path / "addresses.json", "id").get(1)["city"] == "Haifa"
+
+    with pytest.raises(RuntimeError):
+        with storage.unit_of_work():
+            addresses.insert({"id": 2, "city": "Eilat"})
+            orders.insert({"package_id": 2, "destination_id": 2})
+            raise RuntimeError("assignment failed")
+    assert 2 not in addresses and 2 not in orders and len(writes) == 1
+    assert 2 not in OrderStore(tmp_path / "orders.json", journal=False)
+
+
+def test_failed_dispatch_leaves_orders_and_addresses_unchanged(data_dir, monkeypatch):
+    ds = DispatchSystem("managers.json", "addresses.json")
+    home = ds.add_address({"street": "Allenby", "house_number": 1, "city": "Tel Aviv", "postal_code": "1",
+                           "country": "Israel", "coordinates": (32.07, 34.77)})
+    ds.add_courier({"name": "noa", "courier_id": 1, "address_id": home.id, "current_location": home.id,
+                    "password": "x"})
+    first = ds.add_order({"customer_id": "c1", "courier_id": None, "origin_id": None,
+                          "destination_id": home.id, "status": PackageStatus.CREATED})
+    names = ("orders.json", "orders.json.journal", "addresses.json")
+    files = {name: (data_dir / name).read_bytes()
+             for name in names if (data_dir / name).exists()}
+
+    def fail(courier_id):
+        raise RuntimeError("courier lookup failed")
+
+    # The courier is already picked for the order when dispatch_order reads it back
+    monkeypatch.setattr(ds, "get_courier_by_id", fail)
+    with pytest.raises(RuntimeError):
+        with ds.unit_of_work():  # the steps of POST /create_order
+            address = ds.add_address({"street": "Herzl", "house_number": 10, "city": "Tel Aviv",
+                                      "postal_code": "2", "country": "Israel"})
+            order = ds.add_order({"customer_id": "c1", "courier_id": None, "origin_id": None,
+                                  "destination_id": address.id, "status": PackageStatus.CREATED})
+            ds.dispatch_order(order._package_id)
+
+    assert {name: (data_dir / name).read_bytes()
+            for name in names if (data_dir / name).exists()} == files
+    assert ds.get_address_by_id(address.id) is None
+    assert ds.find_order_by_package_id(order._package_id) is None
+    assert ds.find_order_by_package_id(
+        first._package_id)._status == PackageStatus.CREATED.value
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_listeners_see_changes_and_rollbacks_change_data_version(tmp_path, backend):
+    if backend == "json":
+        repo = storage.JsonRepository(tmp_path / "courier.json", "courier_id")
+    else:
+        repo = storage.SqliteRepository(storage.SqliteDatabase(tmp_path / "db.sqlite3"), "couriers",
+                                        "courier_id", ("current_location",))
+    events = []
+    repo.add_listener(lambda key, record: events.append((key, record)))
+    repo.insert({"courier_id": 1, "current_location": 3})
+    repo.update(1, {"courier_id": 2})
+    repo.delete(2)
+    assert events == [(1, {"courier_id": 1, "current_location": 3}), (1, None),
+                      (2, {"courier_id": 2, "current_location": 3}), (2, None)]
+    version = repo.data_version()
+    with pytest.raises(RuntimeError):
+        with repo.batch():
+            repo.insert({"courier_id": 5})
+            raise RuntimeError("rolled back")
+    assert repo.data_version() != version and 5 not in repo
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import config
+import tracing
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(config, "TRACE_PATH", str(path))
+    return path
+
+
+def exported_spans(path):
+    return [json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"] for line in path.read_text().splitlines()]
+
+
+def test_sampled_trace_is_written_with_parent_links(trace_file, monkeypatch):
+    monkeypatch.setattr(config, "TRACE_SAMPLE_RATE", 1.0)
+    with tracing.trace("POST /create_order"):
+        with tracing.span("add_address"):
+            with tracing.span("geocode", cache="miss"):
+                pass
+        with tracing.span("unit_of_work.commit"):
+            pass
+    [spans] = exported_spans(trace_file)
+    by_name = {s["name"]: s for s in spans}
+    assert set(by_name) == {"POST /create_order",
+                            "add_address", "geocode", "unit_of_work.commit"}
+    assert "parentSpanId" not in by_name["POST /create_order"]
+    assert by_name["geocode"]["parentSpanId"] == by_name["add_address"]["spanId"]
+    assert by_name["add_address"]["parentSpanId"] == by_name["POST /create_order"]["spanId"]
+    assert {s["traceId"] for s in spans} == {by_name["geocode"]["traceId"]}
+    assert by_name["geocode"]["attributes"] == [
+        {"key": "cache", "value": {"stringValue": "miss"}}]
+
+
+def test_unsampled_fast_requests_are_not_written(trace_file, monkeypatch):
+    monkeypatch.setattr(config, "TRACE_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(config, "TRACE_SLOW_MS", 10_000.0)
+    with tracing.trace("GET /orders/<user_type>"):
+        with tracing.span("query"):
+            pass
+    assert not trace_file.exists()
+
+
+def test_slow_requests_are_written_and_broken_down(trace_file, monkeypatch, caplog):
+    monkeypatch.setattr(config, "TRACE_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(config, "TRACE_SLOW_MS", 0.001)
+    with pytest.raises(ValueError):
+        with tracing.trace("POST /create_order"):
+            with tracing.span("order.persist"):
+                raise ValueError("disk full")
+    [spans] = exported_spans(trace_file)
+    assert all(s["status"]["code"] == 2 for s in spans)
+    assert "  order.persist:" in caplog.text
+
+
+def test_spans_are_no_ops_without_a_trace(monkeypatch):
+    monkeypatch.setattr(config, "TRACE_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(config, "TRACE_SLOW_MS", 0.0)
+    with tracing.trace("GET /") as root:
+        with tracing.span("anything") as span:
+            assert root is None and span is None
@@ -0,0 +1,230 @@
+"""
+Lightweight span tracing of requests, written as OpenTelemetry (OTLP/JSON) trace files.
+
+A trace starts at the top of a request (start_trace) and every span() opened
+while it runs becomes a child of the innermost open span, so the trace file
+shows where the time of a request went: geocoding, persistence, courier
+lookup, file writes, ...
+
+Whether a trace is written is decided when it ends: a config.TRACE_SAMPLE_RATE
+share of requests is kept, plus every request slower than config.TRACE_SLOW_MS,
+whose breakdown is also logged. With both settings at 0 no trace is started
+and span() does nothing.
+
+Each finished trace is appended to config.TRACE_PATH as one line holding an
+OTLP ExportTraceServiceRequest, the format OpenTelemetry collectors read
+(for example with the filelog receiver) and most trace viewers import.
+"""
+import functools
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import config
+
+
+_logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "dispatch-system"
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+
+_current: ContextVar[Optional["Span"]] = ContextVar(
+    "tracing_current_span", default=None)
+_write_lock = threading.Lock()
+
+
+class Trace:
+    """The spans of one request; sampled traces are written whatever their duration."""
+
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self, sampled: bool) -> None:
+        self.trace_id = secrets.token_hex(16)
+        self.sampled = sampled
+        self.spans: List[Span] = []
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "kind",
+                 "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], kind: int = KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None) -> None:
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def _end(self) -> None:
+        self.end_ns = time.time_ns()
+        self.trace.spans.append(self)
+
+
+def enabled() -> bool:
+    return config.TRACE_SAMPLE_RATE > 0 or config.TRACE_SLOW_MS > 0
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_trace(name: str, **attributes: Any) -> Optional[Tuple[Span, Token]]:
+    """
+    Open the root span of a new trace in the current context and return a
+    handle for end_trace(), or None if tracing is off.
+    """
+    if not enabled():
+        return None
+    root = Span(Trace(random.random() < config.TRACE_SAMPLE_RATE),
+                name, None, KIND_SERVER, attributes)
+    return root, _current.set(root)
+
+
+def end_trace(handle: Optional[Tuple[Span, Token]], error: Optional[BaseException] = None) -> None:
+    """Close the root span opened by start_trace() and write the trace if it is sampled or slow."""
+    if handle is None:
+        return
+    root, token = handle
+    _current.reset(token)
+    if error is not None:
+        root.error = repr(error)
+    root._end()
+    slow = 0 < config.TRACE_SLOW_MS <= root.duration_ms
+    if slow:
+        _logger.warning(
+            f"Slow request {root.name} took {root.duration_ms:.1f} ms:\n{breakdown(root.trace)}")
+    if slow or root.trace.sampled:
+        export(root.trace)
+
+
+@contextmanager
+def trace(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """start_trace() and end_trace() around a block (for jobs and tools outside a request)."""
+    handle = start_trace(name, **attributes)
+    try:
+        yield handle[0] if handle else None
+    except BaseException as e:
+        end_trace(handle, e)
+        raise
+    end_trace(handle)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Time the block as a child of the current span; does nothing outside a trace."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes=attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        child._end()
+
+
+def traced(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorator running every call of a function inside a span (named after the function by default)."""
+    def decorate(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def breakdown(trace: Trace) -> str:
+    """The spans of a trace as an indented tree with their durations."""
+    children: Dict[Optional[str], List[Span]] = {}
+    for s in trace.spans:
+        children.setdefault(s.parent_id, []).append(s)
+    lines = []
+
+    def walk(parent_id: Optional[str], depth: int) -> None:
+        for s in sorted(children.get(parent_id, []), key=lambda s: s.start_ns):
+            details = " ".join(f"{k}={v}" for k, v in s.attributes.items())
+            error = f" ERROR {s.error}" if s.error else ""
+            lines.append(
+                f"{'  ' * depth}{s.name}: {s.duration_ms:.1f} ms {details}{error}".rstrip())
+            walk(s.span_id, depth + 1)
+    walk(None, 0)
+    return "\n".join(lines)
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """The trace as an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for s in trace.spans:
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": s.kind,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [_attribute(k, v) for k, v in s.attributes.items()],
+            # STATUS_CODE_ERROR, or unset
+            "status": {"code": 2, "message": s.error} if s.error else {},
+        }
+        if s.parent_id:
+            otlp_span["parentSpanId"] = s.parent_id
+        spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+    }]}
+
+
+def export(trace: Trace, path: Optional[str] = None) -> None:
+    """Append the trace to the trace file as one JSON line."""
+    line = json.dumps(to_otlp(trace), separators=(",", ":")) + "\n"
+    target = Path(path or config.TRACE_PATH)
+    try:
+        with _write_lock, target.open("a", encoding="utf-8") as file:
+            file.write(line)
+    except OSError as e:
+        _logger.error(f"Error writing trace to {target}: {e}")